@@ -0,0 +1,5 @@
+"""
+Benchmarks of liveusb-creator, run from the top of the source tree with e.g.
+
+    python -m benchmarks.write --help
+"""
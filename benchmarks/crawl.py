@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Benchmark of the release crawl, get_flavors of the configured backend.
+
+The pages are first recorded from the live sites, once:
+
+    python -m benchmarks.crawl --record fixtures/fedora
+
+and the crawl then replays them offline, each page taking as long as it
+did when recorded, or --latency seconds.  It reports how long the crawl
+took, the requests and bytes it read, and the releases it found.  A
+request with no recorded page means the crawler changed what it reads,
+and releases with no URL or checksum that the parser broke; either makes
+the exit status 1, as does a slowdown or more requests than --baseline:
+
+    python -m benchmarks.crawl --fixtures fixtures/fedora --output baseline.json
+    ... change the crawler ...
+    python -m benchmarks.crawl --fixtures fixtures/fedora --baseline baseline.json
+
+The backend is the one of $LIVEUSB_CREATOR_CONFIG, as for liveusb-creator.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import resource
+import sys
+import time
+
+from benchmarks.replay import Fixtures, Recorder, Replayer, mounted
+
+
+def crawl():
+    """ Run the crawl, returning the releases found """
+    from liveusb.releases import backend
+    # the backends print what they scrape
+    with contextlib.redirect_stdout(io.StringIO()):
+        return backend().get_flavors(store=False)
+
+
+def incomplete(releases):
+    """ The names of the releases that were scraped without a URL or a checksum """
+    names = []
+    for release in releases:
+        if release.get('source') == 'Local':
+            continue
+        variants = release.get('variants') or {}
+        if not variants or [v for v in variants.values()
+                            if not v.get('url') or not (v.get('sha256') or v.get('sha1'))]:
+            names.append(release.get('name', ''))
+    return names
+
+
+def record(directory):
+    fixtures = Fixtures(directory)
+    with mounted(Recorder(fixtures)):
+        releases = crawl()
+    return {'pages': len(fixtures.entries), 'releases': len(releases)}
+
+
+def replay(directory, latency=None, scale=1.0):
+    """ Crawl the recorded pages once and measure it """
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    with mounted(Replayer(Fixtures(directory), latency, scale)) as replayer:
+        releases = crawl()
+    seconds = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        'seconds': round(seconds, 4),
+        'cpu_user': round(after.ru_utime - before.ru_utime, 4),
+        'cpu_system': round(after.ru_stime - before.ru_stime, 4),
+        'requests': replayer.requests,
+        'bytes': replayer.bytes,
+        'misses': replayer.misses,
+        'releases': len(releases),
+        'incomplete': incomplete(releases),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """ Return what got worse than the baseline """
+    worse = []
+    if result['seconds'] > baseline['seconds'] * (1 + tolerance):
+        worse.append('took %.2fs instead of %.2fs' % (result['seconds'], baseline['seconds']))
+    if result['requests'] > baseline['requests']:
+        worse.append('made %d requests instead of %d' % (result['requests'], baseline['requests']))
+    if result['releases'] < baseline['releases']:
+        worse.append('found %d releases instead of %d' % (result['releases'], baseline['releases']))
+    return worse
+
+
+def report(result, out=sys.stdout):
+    out.write('%d releases in %.2fs (%.2fs CPU), %d requests, %d bytes\n' % (
+        result['releases'], result['seconds'], result['cpu_user'] + result['cpu_system'],
+        result['requests'], result['bytes']))
+    for url in result['misses']:
+        out.write('Not recorded: %s\n' % url)
+    for name in result['incomplete']:
+        out.write('No URL or checksum: %s\n' % name)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the release crawl.')
+    parser.add_argument('--record', metavar='DIR',
+                        help='crawl the live sites, recording the pages to DIR')
+    parser.add_argument('--fixtures', metavar='DIR',
+                        help='replay the pages recorded to DIR')
+    parser.add_argument('--latency', type=float,
+                        help='seconds every page takes (default: as recorded)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='what to multiply the latencies by (default: 1)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the slowdown allowed against the baseline (default: 0.1)')
+    args = parser.parse_args(argv)
+    if bool(args.record) == bool(args.fixtures):
+        parser.error('one of --record or --fixtures is needed')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.record:
+        recorded = record(args.record)
+        sys.stdout.write('Recorded %(pages)d pages, %(releases)d releases\n' % recorded)
+        return 0
+
+    result = replay(args.fixtures, args.latency, args.scale)
+    report(result)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(result, out, indent=1)
+    worse = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            worse = compare(result, json.load(baseline), args.tolerance)
+    for problem in worse:
+        sys.stderr.write('Worse than the baseline: %s\n' % problem)
+    return 1 if worse or result['misses'] or result['incomplete'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Benchmark of grabber.download against local mirrors.
+
+Downloads a generated image from LocalMirrors on localhost, through a
+redirect like that of download.fedoraproject.org, as one stream, as
+--segments ranges at once, and as ranges spread over --mirrors mirrors.
+Every mode runs once undisturbed and once with connections reset midway,
+which checks that the download resumes to the right file.  The downloads
+run in a process of their own, so the CPU time is that of the client
+only.  The results are printed, and written as JSON with --output.
+
+With --baseline, the results are compared with an earlier run, and the
+exit status is 1 if a case got slower than the --tolerance allows, or if
+a download came out wrong:
+
+    python -m benchmarks.download --output baseline.json
+    python -m benchmarks.download --baseline baseline.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mirror import LocalMirror, PatternFile, MB
+from benchmarks.write import compare, parse_size
+
+MODES = ['single', 'segmented', 'mirrors']
+FILE_NAME = 'Fedora-Live.iso'
+MAX_ATTEMPTS = 10  # the single stream resumes with a new download() each time
+
+
+class Download(object):
+    """ The parent grabber.download expects, as the GUI's download thread """
+    beingCancelled = False
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+def case_key(case):
+    return '%(mode)s segments=%(segments)d resets=%(resets)d' % case
+
+
+def cases(modes, segments, resets):
+    for mode in modes:
+        for count in resets:
+            yield {'mode': mode, 'segments': 1 if mode == 'single' else segments,
+                   'resets': count}
+
+
+def run_case(case, directory, urls):
+    """ Download the image once, in this process, and measure it """
+    from liveusb import LiveUSBError, grabber
+    parent = Download(FILE_NAME)
+    mirrors = urls[1:] if case['mode'] == 'mirrors' else ()
+    attempts = 0
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    while True:
+        attempts += 1
+        try:
+            path = grabber.download(parent, urls[0], directory, segments=case['segments'],
+                                    mirrors=mirrors)
+            break
+        except LiveUSBError:
+            if attempts == MAX_ATTEMPTS:
+                raise
+    seconds = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    size = os.path.getsize(path)
+    cpu = after.ru_utime - before.ru_utime + after.ru_stime - before.ru_stime
+    digest = hashlib.sha256()
+    with open(path, 'rb') as downloaded:
+        for block in iter(lambda: downloaded.read(MB), b''):
+            digest.update(block)
+    result = dict(case)
+    result.update({
+        'bytes': size,
+        'attempts': attempts,
+        'seconds': round(seconds, 4),
+        'mb_per_s': round(size / MB / seconds, 2) if seconds else 0.0,
+        'cpu_user': round(after.ru_utime - before.ru_utime, 4),
+        'cpu_system': round(after.ru_stime - before.ru_stime, 4),
+        'cpu_ms_per_mb': round(cpu * 1000 / (size / MB), 3) if size else 0.0,
+        'peak_rss_kb': after.ru_maxrss,
+        'sha256': digest.hexdigest(),
+    })
+    return result
+
+
+def spawn_case(case, directory, urls):
+    """ Run a case in a new process and return its result """
+    command = [sys.executable, '-m', 'benchmarks.download', '--run-case',
+               json.dumps(case), directory] + list(urls)
+    output = subprocess.check_output(command, cwd=os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    return json.loads(output.decode('utf-8'))
+
+
+def run_sweep(sweep, image, mirrors, directory, reset_after):
+    """ Run every case against the mirrors, the first of which is redirected to """
+    for mirror in mirrors:
+        mirror.add(FILE_NAME, image)
+    mirrors[0].redirect('redirect/' + FILE_NAME, mirrors[0].url(FILE_NAME))
+    urls = [mirrors[0].url('redirect/' + FILE_NAME)] + [m.url(FILE_NAME) for m in mirrors[1:]]
+    expected = image.sha256()
+    results = []
+    for case in sweep:
+        requested = sum(mirror.requests for mirror in mirrors)
+        sent = sum(mirror.bytes_sent for mirror in mirrors)
+        mirrors[0].reset(after=reset_after, count=case['resets'])
+        target = tempfile.mkdtemp(prefix='liveusb-bench-', dir=directory)
+        try:
+            result = spawn_case(case, target, urls)
+        finally:
+            shutil.rmtree(target)
+        mirrors[0].clear_resets()  # whatever wasn't used up
+        result['correct'] = result.pop('sha256') == expected
+        result['requests'] = sum(mirror.requests for mirror in mirrors) - requested
+        result['bytes_sent'] = sum(mirror.bytes_sent for mirror in mirrors) - sent
+        results.append(result)
+    return results
+
+
+def report(results, out=sys.stdout):
+    out.write('%-34s %9s %9s %8s %8s %9s %8s\n' % (
+        'case', 'MB/s', 'ms/MB', 'requests', 'attempts', 'correct', 'change'))
+    for result in results:
+        change = '%+.1f%%' % (result['change'] * 100) if 'change' in result else ''
+        out.write('%-34s %9.1f %9.3f %8d %8d %9s %8s\n' % (
+            case_key(result), result['mb_per_s'], result['cpu_ms_per_mb'],
+            result['requests'], result['attempts'], result['correct'], change))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark grabber.download.')
+    parser.add_argument('--size', type=parse_size, default=256 * MB,
+                        help='size of the image downloaded (default: 256M)')
+    parser.add_argument('--directory', default='.',
+                        help='where the downloads go (default: .)')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help='comma separated, from %s' % ', '.join(MODES))
+    parser.add_argument('--segments', type=int, default=4,
+                        help='connections of the segmented and mirrors modes (default: 4)')
+    parser.add_argument('--mirrors', type=int, default=3,
+                        help='mirrors of the mirrors mode (default: 3)')
+    parser.add_argument('--bandwidth', type=parse_size, default=100 * MB,
+                        help='bytes per second of every connection, 0 for '
+                             'unlimited (default: 100M)')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds every response is delayed by (default: 0.02)')
+    parser.add_argument('--resets', type=int, default=2,
+                        help='connections reset in the resume cases, 0 to skip them (default: 2)')
+    parser.add_argument('--reset-after', type=parse_size, default=4 * MB,
+                        help='bytes sent before a connection is reset (default: 4M)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the slowdown allowed against the baseline (default: 0.1)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_case:
+        json.dump(run_case(json.loads(args.run_case), args.paths[0], args.paths[1:]),
+                  sys.stdout)
+        return 0
+
+    sweep = list(cases(args.modes.split(','), args.segments,
+                       sorted(set([0, args.resets]))))
+    mirrors = [LocalMirror(args.bandwidth or None, args.latency)
+               for i in range(max(args.mirrors, 1))]
+    try:
+        for mirror in mirrors:
+            mirror.start()
+        results = run_sweep(sweep, PatternFile(args.size), mirrors, args.directory,
+                            args.reset_after)
+    finally:
+        for mirror in mirrors:
+            mirror.stop()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.tolerance,
+                                  case_key)
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'size': args.size, 'results': results}, out, indent=1)
+    for result in regressions:
+        sys.stderr.write('Slower than the baseline: %s (%.1f MB/s, was %.1f)\n' % (
+            case_key(result), result['mb_per_s'], result['baseline_mb_per_s']))
+    wrong = [result for result in results if not result['correct']]
+    for result in wrong:
+        sys.stderr.write('Downloaded the wrong data: %s\n' % case_key(result))
+    return 1 if regressions or wrong else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+A local stand-in for a download mirror, for the grabber tests and benchmarks.
+
+The mirror serves files from disk, sparse ones included, or PatternFiles
+of any size that are generated as they are read: every MiB of those is
+different, so data written at the wrong offset doesn't go unnoticed.  It
+does what the grabber relies on from the real mirrors: Range requests,
+with a 416 for the unsatisfiable ones, ETags and If-Range, redirects and
+keep-alive connections.  Every connection can be capped in bandwidth and
+every response delayed, and responses can be cut short with a connection
+reset:
+
+    with LocalMirror(bandwidth=20 * MB, latency=0.05) as mirror:
+        mirror.add('Fedora.iso', PatternFile(1024 * MB))
+        mirror.reset(after=100 * MB, count=2)
+        url = mirror.url('Fedora.iso')
+"""
+
+import hashlib
+import os
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+MB = 1024 ** 2
+SEND_SIZE = 64 * 1024
+
+
+class PatternFile(object):
+    """ A file of size bytes, made up from a seeded random MiB """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seed = seed
+        self._block = random.Random(seed).getrandbits(8 * MB).to_bytes(MB, 'little')
+        self.etag = '"pattern-%d-%d"' % (seed, size)
+
+    def block(self, index):
+        """ The index-th MiB: the block, stamped with its index """
+        return struct.pack('>Q', index) + self._block[8:]
+
+    def read(self, offset, length):
+        length = max(min(length, self.size - offset), 0)
+        data = []
+        while length > 0:
+            index, start = divmod(offset, MB)
+            piece = self.block(index)[start:start + length]
+            data.append(piece)
+            offset += len(piece)
+            length -= len(piece)
+        return b''.join(data)
+
+    def sha256(self):
+        digest = hashlib.sha256()
+        for offset in range(0, self.size, MB):
+            digest.update(self.read(offset, MB))
+        return digest.hexdigest()
+
+    def write(self, path):
+        with open(path, 'wb') as out:
+            for offset in range(0, self.size, MB):
+                out.write(self.read(offset, MB))
+
+
+class DiskFile(object):
+    """ A file on disk, served as it is """
+
+    def __init__(self, path):
+        self.path = path
+        info = os.stat(path)
+        self.size = info.st_size
+        self.etag = '"%x-%x"' % (info.st_size, int(info.st_mtime * 1000))
+
+    def read(self, offset, length):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+def sparse_file(path, size):
+    """ Create a sparse file of size bytes to serve """
+    with open(path, 'wb') as out:
+        out.truncate(size)
+    return path
+
+
+def parse_range(header, size):
+    """ Return the (first, last) byte of a Range header, None if it can't
+    be satisfied, or False to ignore it and send the whole file.
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return False  # malformed, or several ranges
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if not length:
+            return None
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        return None
+    return first, last
+
+
+class _Reset(Exception):
+    """ Raised once a connection has been reset on purpose """
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real mirrors
+
+    def do_HEAD(self):
+        self._serve(False)
+
+    def do_GET(self):
+        self._serve(True)
+
+    def _serve(self, body):
+        mirror = self.server.mirror
+        if mirror.latency:
+            time.sleep(mirror.latency)
+        path = urlparse(self.path).path
+        if path in mirror.redirects:
+            self._respond(302, {'Location': mirror.redirects[path], 'Content-Length': '0'})
+            return
+        name = path.lstrip('/')
+        content = mirror.files.get(name)
+        if content is None:
+            self._respond(404, {'Content-Length': '0'})
+            return
+
+        first, last = 0, content.size - 1
+        status = 200
+        etag = mirror.etags[name]
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes',
+                   'Content-Type': 'application/octet-stream'}
+        requested = self.headers.get('Range')
+        if requested and self.headers.get('If-Range', etag) == etag:
+            found = parse_range(requested, content.size)
+            if found is None:
+                headers.update({'Content-Range': 'bytes */%d' % content.size,
+                                'Content-Length': '0'})
+                self._respond(416, headers)
+                return
+            if found:
+                first, last = found
+                status = 206
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (first, last, content.size)
+        headers['Content-Length'] = str(last - first + 1)
+        self._respond(status, headers)
+        if body:
+            self._send(content, first, last + 1)
+
+    def _respond(self, status, headers):
+        self.server.mirror.count(status)
+        self.send_response(status)
+        for name, value in sorted(headers.items()):
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send(self, content, start, end):
+        mirror = self.server.mirror
+        reset_after = mirror.take_reset(end - start)
+        started = time.monotonic()
+        sent = 0
+        while start + sent < end:
+            length = min(SEND_SIZE, end - start - sent)
+            if reset_after is not None:
+                length = min(length, reset_after - sent)
+                if length <= 0:
+                    # a RST instead of a FIN, as when a mirror goes away
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                               struct.pack('ii', 1, 0))
+                    self.connection.close()
+                    raise _Reset()
+            self.wfile.write(content.read(start + sent, length))
+            sent += length
+            mirror.sent(length)
+            if mirror.bandwidth:
+                ahead = float(sent) / mirror.bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def log_message(self, format, *args):
+        pass  # the benchmarks print their own reports
+
+
+class MirrorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # resets, and clients going away while we send
+
+
+class LocalMirror(object):
+    """ An HTTP server on localhost, serving files like a download mirror
+
+    @param bandwidth: The bytes per second sent over each connection, None
+        for as fast as it goes.
+    @param latency: The seconds every response is delayed by.
+    """
+
+    def __init__(self, bandwidth=None, latency=0, address='127.0.0.1'):
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.files = {}  # {name: PatternFile or DiskFile}
+        self.etags = {}  # {name: the ETag this mirror gives it}
+        self.redirects = {}  # {path: location}
+        self.requests = 0
+        self.statuses = Counter()
+        self.bytes_sent = 0
+        self._resets = []  # the byte counts the next responses are cut at
+        self._lock = threading.Lock()
+        self._server = MirrorServer((address, 0), MirrorHandler)
+        self._server.mirror = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def url(self, name):
+        return '%s/%s' % (self.base_url, name)
+
+    def add(self, name, content, etag=None):
+        """ Serve content, a PatternFile or the path of a file, as name
+
+        @param etag: The ETag of the file on this mirror, by default one
+            derived from the content, the same on every mirror.
+        """
+        if isinstance(content, str):
+            content = DiskFile(content)
+        self.files[name] = content
+        self.etags[name] = etag or content.etag
+        return content
+
+    def redirect(self, path, location):
+        """ Answer the requests for path with a redirect to location """
+        self.redirects['/' + path.lstrip('/')] = location
+
+    def reset(self, after, count=1):
+        """ Reset the connections of the next count responses longer than after
+        bytes, once they have sent that much
+        """
+        with self._lock:
+            self._resets.extend([after] * count)
+
+    def clear_resets(self):
+        with self._lock:
+            self._resets = []
+
+    def take_reset(self, length):
+        with self._lock:
+            for i, after in enumerate(self._resets):
+                if after < length:
+                    return self._resets.pop(i)
+        return None
+
+    def count(self, status):
+        with self._lock:
+            self.requests += 1
+            self.statuses[status] += 1
+
+    def sent(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='local-mirror')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Record the pages a crawl reads, and replay them later without the network.
+
+A Recorder is a requests transport adapter that saves every response it
+gets, redirects included, to a fixtures directory, along with how long it
+took.  A Replayer answers from those fixtures instead of the network,
+taking as long as the recorded response did (or a fixed latency), and
+counts the requests, the bytes and the URLs it has no fixture for:
+
+    with mounted(Recorder(Fixtures('fixtures/fedora'))):
+        get_flavors(store=False)
+    with mounted(Replayer(Fixtures('fixtures/fedora'))) as replayer:
+        get_flavors(store=False)
+    print(replayer.requests, replayer.bytes, replayer.misses)
+
+The adapters are mounted on grabber.session(), which grabber.urlread
+reads every page with.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+INDEX = 'index.json'
+HEADERS = ('Content-Type', 'Location', 'ETag', 'Last-Modified')  # the ones kept
+
+
+class Fixtures(object):
+    """ Recorded responses, by URL, kept in a directory """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}  # {url: {'status', 'reason', 'headers', 'body', 'elapsed'}}
+        self._lock = threading.Lock()
+        path = os.path.join(directory, INDEX)
+        if os.path.exists(path):
+            with open(path) as index:
+                self.entries = json.load(index)['responses']
+
+    def save(self, url, status, reason, headers, body, elapsed):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.body'
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(os.path.join(self.directory, name), 'wb') as out:
+                out.write(body)
+            self.entries[url] = {
+                'status': status, 'reason': reason, 'body': name,
+                'elapsed': round(elapsed, 4),
+                'headers': dict((key, headers[key]) for key in HEADERS if key in headers),
+            }
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def body(self, entry):
+        with open(os.path.join(self.directory, entry['body']), 'rb') as body:
+            return body.read()
+
+    def write(self):
+        """ Write the index of the responses recorded so far """
+        with self._lock:
+            with open(os.path.join(self.directory, INDEX), 'w') as index:
+                json.dump({'responses': self.entries}, index, indent=1, sort_keys=True)
+
+
+class Recorder(HTTPAdapter):
+    """ Sends the requests to the network, saving the responses to fixtures """
+
+    def __init__(self, fixtures, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.fixtures = fixtures
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = HTTPAdapter.send(self, request, **kwargs)
+        body = response.content  # the caller reads it from memory now
+        self.fixtures.save(request.url, response.status_code, response.reason,
+                           response.headers, body, time.monotonic() - started)
+        return response
+
+    def close(self):
+        self.fixtures.write()
+        HTTPAdapter.close(self)
+
+
+class Replayer(BaseAdapter):
+    """ Answers the requests from fixtures
+
+    @param latency: The seconds every response takes, None for as long as
+        it took when recorded.
+    @param scale: What to multiply the latency by.
+    """
+
+    def __init__(self, fixtures, latency=None, scale=1.0):
+        BaseAdapter.__init__(self)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.scale = scale
+        self.requests = 0
+        self.bytes = 0
+        self.misses = []
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None):
+        entry = self.fixtures.get(request.url)
+        if entry is None:
+            status, reason, headers, body = 404, 'Not Recorded', {}, b''
+            delay = self.latency or 0
+        else:
+            status, reason, headers = entry['status'], entry['reason'], entry['headers']
+            body = self.fixtures.body(entry)
+            delay = entry['elapsed'] if self.latency is None else self.latency
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+            if entry is None:
+                self.misses.append(request.url)
+        time.sleep(delay * self.scale)
+
+        response = Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def mounted(adapter, session=None):
+    """ Send the requests of a session, the grabber's by default, through adapter """
+    if session is None:
+        from liveusb import grabber
+        session = grabber.session()
+    previous = list(session.adapters.items())
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    try:
+        yield adapter
+    finally:
+        adapter.close()
+        session.adapters.clear()
+        for prefix, original in previous:
+            session.adapters[prefix] = original
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Benchmark of the image writer behind dd_image.
+
+Writes a generated image with the ImageWriter to a regular file, to a file
+on tmpfs and, when run as root, to a loop device, sweeping the block size,
+buffered or O_DIRECT writes, the sync interval and the read-ahead depth,
+and with the Python loop as well as the kernel engine (copy_file_range()
+or sendfile(), see the method of the results; the kernel engine doesn't
+read ahead or use O_DIRECT, so those cases are only run for Python).
+Every case runs in a process of its own, so that its CPU time and peak RSS
+are its own.  The results are printed, and written as JSON with --output.
+
+With --baseline, the results are compared with an earlier run, and the
+exit status is 1 if a case got slower than the --tolerance allows:
+
+    python -m benchmarks.write --output baseline.json
+    ... change the writer ...
+    python -m benchmarks.write --baseline baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MB = 1024 ** 2
+BLOCK_SIZES = [256 * 1024, MB, 4 * MB]
+SYNC_INTERVALS = [4 * MB, 64 * MB, None]  # None syncs at the end only
+DEPTHS = [0, 4]
+TARGETS = ['file', 'tmpfs', 'loop']
+ENGINES = ['python', 'kernel']
+TMPFS = '/dev/shm'
+
+
+def make_image(path, size):
+    """ Write an image of incompressible data """
+    block = os.urandom(MB)
+    with open(path, 'wb') as image:
+        for i in range(size // MB):
+            image.write(block[i % 64:] + block[:i % 64])
+        image.write(block[:size % MB])
+
+
+def case_key(case):
+    # the results from before the kernel engine are those of the Python one
+    return ('%s %s bs=%d direct=%s sync=%s depth=%d' % (
+        case.get('engine', 'python'), case['target'], case['block_size'], case['direct'],
+        case['sync_interval'], case['depth']))
+
+
+def cases(targets, block_sizes, sync_intervals, depths, direct=(False, True),
+          engines=('python',)):
+    for engine, target, block_size, use_direct, sync_interval, depth in itertools.product(
+            engines, targets, block_sizes, direct, sync_intervals, depths):
+        if target == 'tmpfs' and use_direct:
+            continue  # tmpfs doesn't do O_DIRECT
+        if engine == 'kernel' and (use_direct or depth):
+            continue
+        yield {'engine': engine, 'target': target, 'block_size': block_size,
+               'direct': use_direct, 'sync_interval': sync_interval, 'depth': depth}
+
+
+def run_case(case, image, target):
+    """ Write the image once, in this process, and measure it """
+    from liveusb.writer import ImageWriter
+    writer = ImageWriter(image, target, block_size=case['block_size'],
+                         sync_interval=case['sync_interval'],
+                         direct=case['direct'], depth=case['depth'],
+                         engine=case.get('engine', 'python'))
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    written = writer.write()
+    seconds = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    result = dict(case)
+    result.update({
+        'method': writer.method,
+        'bytes': written,
+        'seconds': round(seconds, 4),
+        'mb_per_s': round(written / MB / seconds, 2) if seconds else 0.0,
+        'cpu_user': round(after.ru_utime - before.ru_utime, 4),
+        'cpu_system': round(after.ru_stime - before.ru_stime, 4),
+        'peak_rss_kb': after.ru_maxrss,
+    })
+    return result
+
+
+def spawn_case(case, image, target):
+    """ Run a case in a new process and return its result """
+    command = [sys.executable, '-m', 'benchmarks.write', '--run-case',
+               json.dumps(case), image, target]
+    output = subprocess.check_output(command, cwd=os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    return json.loads(output.decode('utf-8'))
+
+
+class Targets(object):
+    """ Creates, and cleans up, the files and devices written to """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self.cleanup = []
+        self.skipped = {}  # {target: why}
+
+    def path(self, target):
+        if target == 'file':
+            return self.file(self.directory)
+        if target == 'tmpfs':
+            if not os.path.isdir(TMPFS):
+                self.skipped[target] = '%s is missing' % TMPFS
+                return None
+            return self.file(TMPFS)
+        if target == 'loop':
+            return self._loop()
+        raise ValueError(target)
+
+    def file(self, directory):
+        """ A new, empty file in directory """
+        handle, path = tempfile.mkstemp(prefix='liveusb-bench-', dir=directory)
+        os.close(handle)
+        self.cleanup.append(lambda: os.remove(path))
+        return path
+
+    def _loop(self):
+        if os.getuid() != 0 or not shutil.which('losetup'):
+            self.skipped['loop'] = 'needs root and losetup'
+            return None
+        backing = self.file(self.directory)
+        with open(backing, 'wb') as out:
+            out.truncate(self.size)
+        try:
+            device = subprocess.check_output(['losetup', '--find', '--show', backing])
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.skipped['loop'] = str(e)
+            return None
+        device = device.decode('ascii').strip()
+        self.cleanup.insert(0, lambda: subprocess.call(['losetup', '--detach', device]))
+        return device
+
+    def close(self):
+        for cleanup in self.cleanup:
+            try:
+                cleanup()
+            except OSError:
+                pass
+
+
+def compare(results, baseline, tolerance, key=case_key):
+    """ Return the cases that got slower than the baseline by more than tolerance """
+    previous = dict((key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before or not before['mb_per_s']:
+            continue
+        change = result['mb_per_s'] / before['mb_per_s'] - 1
+        result['baseline_mb_per_s'] = before['mb_per_s']
+        result['change'] = round(change, 4)
+        if change < -tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    out.write('%-65s %-15s %9s %8s %8s %10s %8s\n' % (
+        'case', 'method', 'MB/s', 'user s', 'sys s', 'RSS KiB', 'change'))
+    for result in results:
+        change = '%+.1f%%' % (result['change'] * 100) if 'change' in result else ''
+        out.write('%-65s %-15s %9.1f %8.2f %8.2f %10d %8s\n' % (
+            case_key(result), result.get('method') or '', result['mb_per_s'],
+            result['cpu_user'], result['cpu_system'], result['peak_rss_kb'], change))
+
+
+def parse_size(value):
+    units = {'k': 1024, 'm': MB, 'g': 1024 * MB}
+    if value[-1:].lower() in units:
+        return int(float(value[:-1]) * units[value[-1:].lower()])
+    return int(value)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the image writer.')
+    parser.add_argument('--size', type=parse_size, default=256 * MB,
+                        help='size of the image written (default: 256M)')
+    parser.add_argument('--directory', default='.',
+                        help='where the image and the "file" target go (default: .)')
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help='comma separated, from %s' % ', '.join(TARGETS))
+    parser.add_argument('--block-sizes', default=','.join(str(b) for b in BLOCK_SIZES),
+                        help='comma separated, in bytes or with k, m or g')
+    parser.add_argument('--sync-intervals', default='4m,64m,end',
+                        help='comma separated sizes, "end" to only sync at the end')
+    parser.add_argument('--depths', default=','.join(str(d) for d in DEPTHS),
+                        help='comma separated read-ahead depths, in blocks')
+    parser.add_argument('--engines', default=','.join(ENGINES),
+                        help='comma separated, from %s' % ', '.join(ENGINES))
+    parser.add_argument('--buffered-only', action='store_true',
+                        help='skip the O_DIRECT cases')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the slowdown allowed against the baseline (default: 0.1)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_case:
+        json.dump(run_case(json.loads(args.run_case), *args.paths), sys.stdout)
+        return 0
+
+    sweep = list(cases(
+        args.targets.split(','),
+        [parse_size(size) for size in args.block_sizes.split(',')],
+        [None if size == 'end' else parse_size(size) for size in args.sync_intervals.split(',')],
+        [int(depth) for depth in args.depths.split(',')],
+        (False,) if args.buffered_only else (False, True),
+        args.engines.split(',')))
+    targets = Targets(args.directory, args.size)
+    results = []
+    try:
+        image = targets.file(args.directory)
+        make_image(image, args.size)
+        paths = {}
+        for case in sweep:
+            if case['target'] not in paths:
+                paths[case['target']] = targets.path(case['target'])
+            if paths[case['target']]:
+                results.append(spawn_case(case, image, paths[case['target']]))
+    finally:
+        targets.close()
+    for target, why in sorted(targets.skipped.items()):
+        sys.stderr.write('Skipped the %s target: %s\n' % (target, why))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.tolerance)
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'size': args.size, 'results': results}, out, indent=1)
+    for result in regressions:
+        sys.stderr.write('Slower than the baseline: %s (%.1f MB/s, was %.1f)\n' % (
+            case_key(result), result['mb_per_s'], result['baseline_mb_per_s']))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
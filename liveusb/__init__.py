@@ -48,7 +48,10 @@ class LiveUSBError(Exception):
         else:
             self.short = fullMessage
 
-if sys.platform == "win32":
+if os.getenv('LIVEUSB_CREATOR_VIRTUAL'):
+    # virtual drives instead of the real ones, see liveusb/virtual.py
+    from liveusb.virtual import VirtualLiveUSBCreator as LiveUSBCreator
+elif sys.platform == "win32":
     from liveusb.creator import WindowsLiveUSBCreator as LiveUSBCreator
 elif sys.platform.startswith("linux"):
     from liveusb.creator import LinuxLiveUSBCreator as LiveUSBCreator
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Headless batch flashing, used by --console.
+
+A manifest lists the images to write and where to write them:
+
+    concurrency: 2            # flashes running at the same time
+    verify: true              # check the image checksum first
+    readback: false           # compare the drive to the image afterwards
+    jobs:
+      - iso: /srv/images/Fedora-Workstation-Live-x86_64-24-1.2.iso
+        device: /dev/sdb
+      - iso: /srv/images/Fedora-Server-dvd-x86_64-24-1.2.iso
+        device: all           # every stick not claimed by another job
+        name: SanDisk         # ...whose name contains this
+        min_size: 4000000000  # ...and that is at least this big
+
+Every job is written with dd_image by its own LiveUSBCreator.  Progress is
+printed to stdout as one JSON object per line, the log goes to stderr.
+"""
+
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from liveusb import _, LiveUSBError
+from liveusb.progress import ProgressMeter
+
+MATCH_ALL = 'all'
+
+
+class ManifestJob(object):
+    """ One entry of the manifest: an image and the drives to write it to """
+
+    def __init__(self, iso, device, name=None, min_size=0):
+        self.iso = iso
+        self.device = device
+        self.name = name
+        self.min_size = min_size
+
+    def matches(self, drive):
+        if self.device != MATCH_ALL and drive.device != self.device:
+            return False
+        if self.name and self.name.lower() not in drive.friendlyName.lower():
+            return False
+        return drive.size >= self.min_size
+
+
+class Manifest(object):
+
+    def __init__(self, jobs, concurrency=1, verify=True, readback=False):
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.verify = verify
+        self.readback = readback
+
+
+def parse_manifest(data):
+    """ Build a Manifest from the parsed YAML, raising LiveUSBError if invalid """
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+        raise LiveUSBError(_('The manifest needs a list of jobs'))
+    jobs = []
+    for number, entry in enumerate(data['jobs'], 1):
+        if not isinstance(entry, dict) or 'iso' not in entry or 'device' not in entry:
+            raise LiveUSBError(_('Job %d of the manifest needs an iso and a device') % number)
+        try:
+            min_size = int(entry.get('min_size', 0))
+        except (TypeError, ValueError):
+            raise LiveUSBError(_('Job %d of the manifest has an invalid min_size') % number)
+        jobs.append(ManifestJob(str(entry['iso']), str(entry['device']),
+                                entry.get('name'), min_size))
+    try:
+        concurrency = int(data.get('concurrency', 1))
+    except (TypeError, ValueError):
+        concurrency = 0
+    if concurrency < 1:
+        raise LiveUSBError(_('The concurrency of the manifest has to be a positive number'))
+    return Manifest(jobs, concurrency, bool(data.get('verify', True)),
+                    bool(data.get('readback', False)))
+
+
+def load_manifest(filename):
+    """ Read a YAML manifest """
+    try:
+        with open(filename, 'r') as manifest:
+            content = manifest.read()
+    except (IOError, OSError) as e:
+        raise LiveUSBError(_('Unable to read the manifest %s: %s') % (filename, e))
+    import ruamel.yaml as yaml
+    try:
+        data = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise LiveUSBError(_('Unable to parse the manifest %s: %s') % (filename, e))
+    return parse_manifest(data)
+
+
+def plan(manifest, drives):
+    """ Assign the detected drives to the jobs of a manifest.
+
+    Explicitly named devices are assigned first, every other drive goes to
+    the first "all" job it matches.  Returns a list of (iso, drive) pairs.
+
+    @param drives: The detected drives, as in LiveUSBCreator.drives.
+    """
+    drives = sorted(drives.values(), key=lambda drive: drive.device)
+    claimed = {}
+    for job in manifest.jobs:
+        if job.device == MATCH_ALL:
+            continue
+        found = [drive for drive in drives if drive.device == job.device]
+        if not found:
+            raise LiveUSBError(_('Cannot find device %s') % job.device)
+        if job.device in claimed:
+            raise LiveUSBError(_('The manifest writes to %s more than once') % job.device)
+        if not job.matches(found[0]):
+            raise LiveUSBError(_('The device %s does not match its job') % job.device)
+        claimed[job.device] = (job.iso, found[0])
+    for job in manifest.jobs:
+        if job.device != MATCH_ALL:
+            continue
+        for drive in drives:
+            if drive.device not in claimed and job.matches(drive):
+                claimed[drive.device] = (job.iso, drive)
+    return [claimed[device] for device in sorted(claimed)]
+
+
+class JSONReporter(object):
+    """ Writes the batch events as JSON lines """
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def __call__(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = round(time.time(), 3)
+        line = json.dumps(fields, sort_keys=True)
+        with self._lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+
+class BatchFlasher(object):
+    """ Runs the flashes of a plan, at most `concurrency` at a time.
+
+    @param opts: The command line options, passed to the creators.
+    @param creator: The LiveUSBCreator class to use for each job.
+    @param report: Called as report(event, **fields) for every event.
+    @param verify: Check the checksum of known images before writing them.
+    @param readback: Compare the drive to the image after writing it.
+    """
+
+    def __init__(self, opts, creator, report, concurrency=1, verify=True,
+                 readback=False):
+        self.opts = opts
+        self.creator = creator
+        self.report = report
+        self.concurrency = concurrency
+        self.verify = verify
+        self.readback = readback
+        self._creators = {}  # {job number: LiveUSBCreator}
+        self._terminated = set()  # job numbers cancelled before they started
+        self._lock = threading.Lock()
+
+    def run(self, jobs):
+        """ Flash the (iso, drive) pairs, returning the number of failures """
+        self.report('plan', jobs=[{'job': number, 'iso': iso, 'device': drive.device}
+                                  for number, (iso, drive) in enumerate(jobs)])
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.flash, number, iso, drive)
+                       for number, (iso, drive) in enumerate(jobs)]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                self.terminate()
+                raise
+        failed = results.count(False)
+        self.report('summary', total=len(jobs), failed=failed,
+                    duration=round(time.time() - started, 3))
+        return failed
+
+    def terminate(self, number=None):
+        """ Cancel the write of one running job, or of all of them
+
+        A job that hasn't got as far as flash() yet is cancelled as soon as
+        it does, unless forget() is called for it first.
+        """
+        with self._lock:
+            if number is None:
+                creators = list(self._creators.values())
+            elif number in self._creators:
+                creators = [self._creators[number]]
+            else:
+                self._terminated.add(number)
+                creators = []
+        for live in creators:
+            live.cancel()
+
+    def forget(self, number):
+        """ Drop a cancel that came after the job was over """
+        with self._lock:
+            self._terminated.discard(number)
+
+    def _progress(self, phase, size, fields):
+        """ Return an update_function reporting rate-limited progress events """
+        meter = ProgressMeter(lambda done, speed, eta: self.report(
+            'progress', phase=phase, written=int(done), size=size,
+            speed=round(speed), eta=round(eta, 1), **fields), total=size)
+
+        def update_progress(value):
+            if value == value:  # dd reports nan until it knows
+                meter.update(value * size)
+        return update_progress
+
+    def flash(self, number, iso, drive):
+        fields = {'job': number, 'iso': iso, 'device': drive.device}
+        live = self.creator(self.opts)
+        with self._lock:
+            self._creators[number] = live
+            terminated = number in self._terminated
+            self._terminated.discard(number)
+        if terminated:
+            live.cancel()
+        try:
+            live.drives = {drive.device: drive}
+            live.drive = drive.device
+            live.set_iso(iso)
+            if self.verify and live.verify_iso_sha1() is False:
+                raise LiveUSBError(_('The checksum of %s is invalid') % iso)
+            self.report('start', size=live.isosize, **fields)
+            with live.flash_job() as job:
+                live.dd_image(self._progress('write', live.isosize, fields))
+                live.flush_buffers()
+                if self.readback:
+                    live.verify_image(self._progress('verify', live.isosize, fields))
+                live.calculate_checksums(self._progress('checksum', live.isosize, fields))
+        except Exception as e:
+            live.log.exception(e)
+            self.report('error', error=str(e), **fields)
+            return False
+        finally:
+            with self._lock:
+                del self._creators[number]
+        if live.checksums:
+            fields['checksums'] = live.checksums
+        self.report('done', log=job.path, duration=round(job.duration, 3), **fields)
+        return True
+
+
+def manifest_from_args(iso, device):
+    """ A manifest of the single job given on the command line """
+    return Manifest([ManifestJob(iso, device or MATCH_ALL)])
+
+
+def main(opts, args, out=sys.stdout):
+    """ Run a batch from the command line options, returning the exit code """
+    from liveusb import LiveUSBCreator
+    report = JSONReporter(out)
+    try:
+        if opts.manifest:
+            manifest = load_manifest(opts.manifest)
+        elif len(args) == 1 and opts.force:
+            manifest = manifest_from_args(args[0], opts.force)
+        else:
+            raise LiveUSBError(_('Console mode needs a --manifest, or an ISO '
+                                 'and the drive to write it to (--force)'))
+        detector = LiveUSBCreator(opts)
+        detector.detect_removable_drives()
+        jobs = plan(manifest, detector.drives)
+    except LiveUSBError as e:
+        report('error', error=str(e))
+        return 2
+    if not jobs:
+        report('summary', total=0, failed=0, duration=0)
+        return 1
+    flasher = BatchFlasher(opts, LiveUSBCreator, report,
+                           manifest.concurrency,
+                           manifest.verify and not opts.noverify,
+                           manifest.readback)
+    return 1 if flasher.run(jobs) else 0
@@ -0,0 +1,27 @@
+import QtQuick 2.3
+
+// Instantiates a dialog the first time it is opened instead of at startup
+Loader {
+    id: root
+    active: false
+    asynchronous: true
+
+    property bool openWhenLoaded: false
+
+    function open() {
+        if (status == Loader.Ready) {
+            item.visible = true
+        }
+        else {
+            openWhenLoaded = true
+            active = true
+        }
+    }
+
+    onLoaded: {
+        if (openWhenLoaded) {
+            openWhenLoaded = false
+            item.visible = true
+        }
+    }
+}
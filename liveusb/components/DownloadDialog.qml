@@ -187,7 +187,12 @@ Dialog {
                                                      (leftSize < (1024 * 1024)) ? ((leftSize / 1024).toFixed(1) + " KB") :
                                                      (leftSize < (1024 * 1024 * 1024)) ? ((leftSize / 1024 / 1024).toFixed(1) + " MB") :
                                                      ((leftSize / 1024 / 1024 / 1024).toFixed(1) + " GB")
-                            text: liveUSBData.currentImage.status + (liveUSBData.currentImage.download.maxProgress > 0 ? " (" + leftStr + " left)" : "")
+                            property double eta: liveUSBData.currentImage.writer.running ? liveUSBData.currentImage.writer.eta : -1
+                            property string etaStr: eta <= 0 ? "" :
+                                                    (eta < 60) ? qsTranslate("", "%1 s").arg(Math.ceil(eta)) :
+                                                    qsTranslate("", "%1 min").arg(Math.ceil(eta / 60))
+                            text: liveUSBData.currentImage.status + (liveUSBData.currentImage.download.maxProgress > 0 ? " (" + leftStr + " left)" : "") +
+                                  (etaStr ? " (" + qsTranslate("", "about %1 left").arg(etaStr) + ")" : "")
                         }
                         Item {
                             Layout.fillWidth: true
@@ -217,6 +222,7 @@ Dialog {
                         spacing: $(32)
                         Image {
                             source: liveUSBData.currentImage.logo
+                            asynchronous: true
                             Layout.preferredWidth: $(64)
                             Layout.preferredHeight: $(64)
                             sourceSize.width: $(64)
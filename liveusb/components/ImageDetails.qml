@@ -47,7 +47,7 @@ Item {
             color: "#628fcf"
             textColor: "white"
             onClicked: {
-                dlDialog.visible = true
+                dlDialog.open()
                 liveUSBData.currentImage.get()
             }
             enabled: !liveUSBData.currentImage.isLocal || liveUSBData.currentImage.readyToWrite
@@ -250,16 +250,18 @@ Item {
         }
     }
 
-    DownloadDialog {
+    DialogLoader {
         id: dlDialog
-        onVisibleChanged: {
-            //if (!visible)
-            //    liveUSBData.currentImage.
+        sourceComponent: DownloadDialog {
+            onVisibleChanged: {
+                //if (!visible)
+                //    liveUSBData.currentImage.
+            }
         }
     }
     FileDialog {
         id: fileDialog
-        nameFilters: [ qsTranslate("", "Image files (*.iso)"), qsTranslate("", "All files (*)")]
+        nameFilters: [ qsTranslate("", "Image files (*.iso *.img *.raw *.xz *.gz *.zst *.bz2)"), qsTranslate("", "All files (*)")]
         onAccepted: {
             liveUSBData.currentImage.path = fileUrl
         }
@@ -4,6 +4,7 @@ import QtQuick.Controls 1.2
 Image {
     id: root
     smooth: false
+    asynchronous: true
     Rectangle {
         anchors.fill: parent
         opacity: parent.status == Image.Ready ? 0 : 1
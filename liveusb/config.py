@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+The liveusb-creator configuration.
+
+The YAML file is only opened and parsed the first time a setting is looked
+up, and then shared by every module through the CONFIG mapping.
+"""
+
+import os
+import threading
+from collections.abc import Mapping
+
+CONFIG_FILE = os.getenv('LIVEUSB_CREATOR_CONFIG', '/etc/liveusb-creator.yml')
+
+
+class LazyConfig(Mapping):
+    """ A read-only mapping that loads the configuration file on first use """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    with open(self.filename, 'r') as config_file:
+                        content = config_file.read()
+                    import ruamel.yaml as yaml
+                    self._data = yaml.safe_load(content)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+CONFIG = LazyConfig(CONFIG_FILE)
@@ -24,28 +24,22 @@ that provides platform-independent methods.  Platform specific implementations
 include the LinuxLiveUSBCreator and the WindowsLiveUSBCreator.
 """
 
-import hashlib
 import logging
 import os
 import signal
 import subprocess
 import sys
-import time
 import re
-from io import StringIO
+from contextlib import contextmanager
 from argparse import _AppendAction
-from stat import ST_SIZE
-import ruamel.yaml as yaml
 
 from liveusb import _, LiveUSBError
-
-config_file = open('/etc/liveusb-creator.yml', 'r').read()
-CONFIG = yaml.safe_load(config_file)
-
-if 'Fedora' == CONFIG['DISTRO']:
-    from liveusb.releases.fedora import releases
-elif 'Antergos' == CONFIG['DISTRO']:
-    from liveusb.releases.antergos import releases
+from liveusb import decompress, hashing, isomd5, metrics
+from liveusb.process import ProcessRunner
+from liveusb.reader import BlockReader, same
+from liveusb.journal import WriteJournal
+from liveusb.writer import CancelToken, ImageWriter, HEAD_SIZE, PYTHON
+from liveusb.joblog import JobLog, setup_logger, app_log_path
 
 
 class Drive(object):
@@ -55,6 +49,9 @@ class Drive(object):
     type = 'usb'  # so far only this, mmc/sd in the future
     mount = []
     isIso9660 = False
+    serial = ''
+    vendorId = ''  # the USB vendor id, as four hex digits
+    port = ''  # the USB port the drive is plugged into, e.g. 1-1.2
 
     def __eq__(self, other):
         return (isinstance(other, self.__class__)
@@ -67,17 +64,33 @@ class Drive(object):
         return not self.__eq__(other)
 
 
+def usb_location(device, sysfs='/sys'):
+    """ Return the vendor id and the port of the USB device a disk is on """
+    path = os.path.realpath(os.path.join(sysfs, 'class', 'block',
+                                         os.path.basename(device), 'device'))
+    while path.startswith(sysfs + os.sep):
+        try:
+            with open(os.path.join(path, 'idVendor')) as vendor:
+                return vendor.read().strip(), os.path.basename(path)
+        except (IOError, OSError):
+            path = os.path.dirname(path)
+    return '', ''
+
+
 class LiveUSBCreator(object):
     """ An OS-independent parent class for Live USB Creators """
 
     iso = None  # the path to our live image
     drives = {}  # {device: {'label': label, 'mount': mountpoint}}
     dest = None  # the mount point of of our selected drive
-    pids = []  # a list of pids of all of our subprocesses
-    output = StringIO()  # log subprocess output in case of errors
-    isosize = 0  # the size of the selected iso
+    runner = None  # our ProcessRunner, which tracks the live subprocesses
+    isosize = 0  # the size of the selected iso, once written what was written
+    written = 0  # the bytes the last write put on the drive, complete or not
+    verified = 0  # the bytes the last read-back compared
     _drive = None  # mountpoint of the currently selected drive
     log = None
+    job = None  # the JobLog of the flash in progress
+    cancel_token = None  # the CancelToken of the current write
     callback = None  # Callback for drive changes
 
     drive = property(fget=lambda self: self.drives[self._drive] if self._drive and len(self.drives) else None,
@@ -85,66 +98,109 @@ class LiveUSBCreator(object):
 
     def __init__(self, opts):
         self.opts = opts
+        self.checksums = {}  # {'iso', 'liveos' or 'device': {algorithm: hex digest}}
+        self.known_checksums = {}  # {(path, size, mtime): {algorithm: hex digest}}, hashed as downloaded
         self._setup_logger()
+        self.runner = ProcessRunner(self.log)
+        self.reset_cancel()
+
+    @property
+    def pids(self):
+        """ The pids of the subprocesses that are still running """
+        return self.runner.pids
 
     def _setup_logger(self):
-        self.log = logging.getLogger(__name__)
         level = logging.INFO
         if self.opts.verbose:
             level = logging.DEBUG
-        self.log.setLevel(level)
-        self.handler = logging.StreamHandler()
-        self.handler.setLevel(level)
-        formatter = logging.Formatter("[%(module)s:%(lineno)s] %(message)s")
-        self.handler.setFormatter(formatter)
-        self.log.addHandler(self.handler)
+        logger = setup_logger(logging.getLogger(__name__), level)
+        # Tag our records so that JobLogs only pick up their own creator's
+        self.log = logging.LoggerAdapter(logger, {'job': None})
+
+    @contextmanager
+    def flash_job(self):
+        """ Log everything done within this context to a new JobLog """
+        job = JobLog(self.drive.device if self.drive else None, self.iso)
+        job.start(self.log.logger)
+        self.job = job
+        self.log.extra['job'] = job.id
+        try:
+            yield job
+        except Exception as e:
+            job.finish(e)
+            raise
+        else:
+            job.finish()
+        finally:
+            self.log.extra['job'] = None
+            self.job = None
+
+    def reset_cancel(self):
+        """ Arm a new CancelToken for the next write """
+        self.cancel_token = CancelToken()
+        self.cancel_token.on_cancel(self.terminate)
+
+    def cancel(self):
+        """ Stop the current write and its subprocesses as soon as possible """
+        self.log.info(_('Cancelling the write'))
+        self.cancel_token.cancel()
 
     def detect_removable_drives(self, callback=None):
         """ This method should populate self.drives with removable devices """
         raise NotImplementedError
 
-    def verify_iso_md5(self):
-        """ Verify the MD5 checksum of the ISO """
-        raise NotImplementedError
+    def verify_iso_md5(self, update_function=None):
+        """ Verify the MD5 implanted in the ISO, if it has one
+
+        Returns None for images without an implanted MD5.
+        """
+        self.log.info(_('Verifying ISO MD5 checksum'))
+        try:
+            result = isomd5.check_file(self.iso, update_function)
+        except LiveUSBError as e:
+            self.log.info(e)
+            self.log.info(_('ISO MD5 checksum verification failed'))
+            return False
+        if result is None:
+            self.log.info(_('%s has no implanted MD5 checksum') % self.iso)
+        else:
+            self.log.info(_('ISO MD5 checksum passed'))
+        return result
 
     def terminate(self):
         """ Terminate any subprocesses that we have spawned """
         raise NotImplementedError
 
-    def popen(self, cmd, passive=False, **kwargs):
+    def popen(self, cmd, passive=False, timeout=None, **kwargs):
         """ A wrapper method for running subprocesses.
 
         This method handles logging of the command and it's output, and keeps
         track of the pids in case we need to kill them.  If something goes
         wrong, an error log is written out and a LiveUSBError is thrown.
 
-        @param cmd: The commandline to execute.  Either a string or a list.
+        @param cmd: The command to execute, as a list of arguments.
         @param passive: Enable passive process failure.
-        @param kwargs: Extra arguments to pass to subprocess.Popen
+        @param timeout: Kill the command if it runs longer than this.
+        @param kwargs: Extra arguments to pass to ProcessRunner.run
         """
-        self.log.debug(cmd)
-        self.output.write(cmd)
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE, stdin=subprocess.PIPE,
-                                shell=True, **kwargs)
-        self.pids.append(proc.pid)
-        out, err = proc.communicate()
-        if out:
-            out = out.decode('utf-8')
-        if err:
-            err = err.decode('utf-8')
-        self.output.write(out + '\n' + err + '\n')
-        if proc.returncode:
+        result = self.runner.run(cmd, passive=True, timeout=timeout, **kwargs)
+        if result.returncode:
             filename = self.write_log()
             if not passive:
                 raise LiveUSBError(_("There was a problem executing the "
                                      "following command: %r\n%r\nA more detailed "
                                      "error log has been written to "
-                                     "'%r'" % (cmd, err, filename)))
-        return proc
+                                     "'%r'") % (result.command,
+                                                '\n'.join(result.stderr),
+                                                filename))
+        return result
 
     def verify_iso_sha1(self, progress=None):
-        """ Verify the SHA1 checksum of our ISO if it is in our release list """
+        """ Verify the checksums of our ISO if it is in our release list
+
+        Every checksum the release carries is checked, and the ones asked for
+        with --hash are computed too, all in the same read of the ISO.
+        """
         if not progress:
             class DummyProgress:
                 def set_max_progress(self, value): pass
@@ -153,50 +209,120 @@ class LiveUSBCreator(object):
 
             progress = DummyProgress()
         release = self.get_release_from_iso()
-        if release:
-            progress.set_max_progress(self.isosize / 1024)
-            if 'sha1' in release:
-                self.log.info(_("Verifying SHA1 checksum of LiveCD image..."))
-                algorithm = 'sha1'
-                checksum = hashlib.sha1()
-            elif 'sha256' in release:
-                self.log.info(_("Verifying SHA256 checksum of LiveCD image..."))
-                algorithm = 'sha256'
-                checksum = hashlib.sha256()
-            else:
-                return True
-            with open(self.iso, 'rb') as isofile:
-                bytesize = 1024 ** 2
-                total = 0
-                while bytesize:
-                    data = isofile.read(bytesize)
-                    checksum.update(data)
-                    bytesize = len(data)
-                    total += bytesize
-                    progress.update_progress(total / 1024)
-            if checksum.hexdigest() == release[algorithm]:
-                return True
-            else:
-                self.log.info(_("Error: The SHA1 of your Live CD is "
+        if not release:
+            self.log.debug(_('Unknown ISO, skipping checksum verification'))
+            return None
+        expected = self.release_checksums(release)
+        if not expected:
+            return True
+        self.log.info(_("Verifying the %s of the LiveCD image...") % ', '.join(
+            name.upper() for name in expected))
+        names = hashing.algorithms(list(expected) + self.checksum_algorithms())
+        known = self.known_checksums.get(self._file_key(self.iso), {})
+        if [name for name in names if name not in known]:
+            progress.set_max_progress(os.path.getsize(self.iso) / 1024)
+            self.checksums['iso'] = hashing.hash_file(
+                self.iso, names, lambda total: progress.update_progress(total / 1024))
+        else:
+            self.checksums['iso'] = dict((name, known[name]) for name in names)
+        for name, checksum in sorted(self.checksums['iso'].items()):
+            self.log.info('%s(%s) = %s' % (name, self.iso, checksum))
+        for name in expected:
+            if self.checksums['iso'][name] != expected[name].lower():
+                self.log.info(_("Error: The %s of your Live CD is "
                                 "invalid.  You can run this program with "
                                 "the --noverify argument to bypass this "
-                                "verification check."))
+                                "verification check.") % name.upper())
                 return False
-        else:
-            self.log.debug(_('Unknown ISO, skipping checksum verification'))
+        return True
+
+    def release_checksums(self, release):
+        """ The checksums a release gives for our ISO, {algorithm: hex digest}
+
+        They are those of the variant the ISO is of, or of the release.
+        """
+        isoname = os.path.basename(self.iso)
+        sources = [release] + [variant for variant in release.get('variants', {}).values()
+                               if os.path.basename(variant.get('url') or '') == isoname
+                               or variant.get('filename') == isoname]
+        expected = {}
+        for source in sources:
+            for name in hashing.ALGORITHMS:
+                if source.get(name):
+                    expected[name] = source[name].lower()
+        return expected
+
+    def add_known_checksums(self, path, checksums):
+        """ Remember the checksums of an ISO hashed as it was downloaded """
+        self.known_checksums[self._file_key(path)] = dict(checksums)
+
+    @staticmethod
+    def _file_key(path):
+        """ What tells whether a file is still the one it was """
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), info.st_size, info.st_mtime
+
+    def checksum_algorithms(self):
+        """ The algorithms asked for with --hash """
+        # the front ends built without the full option parser lack --hash
+        return hashing.algorithms(getattr(self.opts, 'hash', None) or 'sha1')
+
+    def calculate_checksums(self, update_function=None):
+        """ Compute the checksums of the drive asked for on the command line
+
+        The --liveos-checksum covers the image as written, unless verify_image
+        already computed it, and the --device-checksum the whole drive.
+        """
+        if getattr(self.opts, 'liveos_checksum', False) and 'liveos' not in self.checksums:
+            self.calculate_liveos_checksum(update_function)
+        if getattr(self.opts, 'device_checksum', False):
+            self.calculate_device_checksum(update_function)
+        return self.checksums
+
+    def calculate_liveos_checksum(self, update_function=None):
+        """ Calculate the checksums of the image written to the drive """
+        return self._checksum_drive('liveos', self.isosize, update_function)
+
+    def calculate_device_checksum(self, update_function=None):
+        """ Calculate the checksums of the whole drive """
+        return self._checksum_drive('device', None, update_function)
+
+    def _checksum_drive(self, key, limit, update_function):
+        device = self.drive.device
+        self.log.info(_('Calculating the %s of %s') % (
+            ', '.join(name.upper() for name in self.checksum_algorithms()), device))
+        size = limit or self.drive.size
+
+        def progress(total):
+            self.cancel_token.check(total)
+            if update_function and size:
+                update_function(min(float(total) / size, 1.0))
+        self.checksums[key] = hashing.hash_file(self.drive_reader(), self.checksum_algorithms(),
+                                                progress, limit)
+        for name, checksum in sorted(self.checksums[key].items()):
+            self.log.info('%s(%s) = %s' % (name, device, checksum))
+        return self.checksums[key]
 
     def write_log(self):
-        """ Write out our subprocess stdout/stderr to a log file """
-        tmpdir = os.getenv('TEMP', '/tmp')
-        filename = os.path.join(tmpdir, 'liveusb-creator.log')
-        with open(filename, 'a') as out:
-            out.write(self.output.getvalue())
-        return filename
+        """ Return the log file our subprocess stdout/stderr has been written to
+
+        The output is logged as it streams in, so there is nothing left to
+        write here besides flushing the handlers.
+        """
+        for handler in self.log.logger.handlers:
+            handler.flush()
+        if self.job:
+            return self.job.path
+        return app_log_path()
 
     def get_release_from_iso(self):
         """ If the ISO is for a known release, return it. """
+        from liveusb.releases import get_releases
         isoname = os.path.basename(self.iso)
-        for release in releases:
+        for release in get_releases():
             for arch, variant in release['variants'].items():
                 if 'url' in variant and os.path.basename(variant['url']) == isoname:
                     return release
@@ -230,7 +356,7 @@ class LiveUSBCreator(object):
     def set_iso(self, iso):
         """ Select the given ISO """
         self.iso = os.path.abspath(self._to_unicode(iso))
-        self.isosize = os.stat(self.iso)[ST_SIZE]
+        self.isosize = decompress.image_size(self.iso)
 
     @staticmethod
     def _to_unicode(obj, encoding='utf-8'):
@@ -250,6 +376,82 @@ class LiveUSBCreator(object):
     def dd_image(self, update_function=None):
         raise NotImplementedError
 
+    def write_image(self, update_function=None):
+        """ Write the image over the whole drive, resuming an earlier write if we can
+
+        This is the part of dd_image common to the platforms writing with an
+        ImageWriter, once the drive is ready to be written to.
+        """
+        drive = self.drive.device
+        journal = WriteJournal.for_write(self.drive.serial, self.iso)
+        md5 = None if self.opts.noverify else isomd5.checker(self.iso)
+        writer = self.image_writer(drive, update_function, journal=journal,
+                                   consumers=[md5] if md5 else [],
+                                   engine=getattr(self.opts, 'write_engine', None) or PYTHON)
+        try:
+            writer.write()
+            # the size of a compressed image isn't always known up front
+            self.isosize = writer.written
+            self.log.debug(_('Wrote the image with %s') % writer.method)
+            if writer.resumed:
+                self.log.info(_('Resumed an earlier write at %d bytes') % writer.resumed)
+            if writer.fed:
+                self.log.info(_('ISO MD5 checksum passed'))
+        except LiveUSBError:
+            if writer.partial:
+                self.log.info(_('%s was partially written, its first %d bytes '
+                                'have been cleared') % (drive, HEAD_SIZE))
+            raise
+        finally:
+            self.written = writer.written
+
+        if update_function:
+            update_function(1.0)
+
+    def image_writer(self, target, update_function, **kwargs):
+        """ Return the ImageWriter writing our image to target """
+        return ImageWriter(self.iso, target, self.cancel_token, update_function, **kwargs)
+
+    def drive_reader(self):
+        """ Return what to read the drive from: its device, or a file object """
+        return self.drive.device
+
+    @metrics.measured('verify', metrics.record_verify, 'verified')
+    def verify_image(self, update_function=None):
+        """ Read the image back from the drive and compare it to the ISO
+
+        @param update_function: Called with the fraction compared so far.
+        """
+        self.log.info(_('Verifying the written image'))
+        blocksize = 1024 ** 2
+        compared = 0
+        hasher = None
+        if getattr(self.opts, 'liveos_checksum', False):
+            hasher = hashing.MultiHasher(self.checksum_algorithms())
+        try:
+            with decompress.read_blocks(self.iso, blocksize) as iso, \
+                    BlockReader(self.drive_reader(), blocksize) as device:
+                for expected in iso:
+                    self.cancel_token.check(compared)
+                    actual = device.read()[:len(expected)]
+                    if not same(actual, expected):
+                        raise LiveUSBError(_('The image on %s differs from %s at '
+                                             'byte %d') % (self.drive.device, self.iso, compared))
+                    if hasher:
+                        hasher.update(actual)
+                    compared += len(expected)
+                    self.verified = compared
+                    if update_function:
+                        update_function(min(float(compared) / self.isosize, 1.0))
+        finally:
+            if hasher:
+                hasher.close()
+        self.log.info(_('The written image matches'))
+        if hasher:
+            self.checksums['liveos'] = hasher.hexdigests()
+            for name, checksum in sorted(self.checksums['liveos'].items()):
+                self.log.info('%s(%s) = %s' % (name, self.drive.device, checksum))
+
     def restore_drive(self, d, callback):
         raise NotImplementedError
 
@@ -307,8 +509,10 @@ class LinuxLiveUSBCreator(LiveUSBCreator):
             data.size = int(blk['Size'])
             data.friendlyName = str(drive['Vendor']) + ' ' + str(drive['Model'])
             data.isIso9660 = blk['IdType'] == 'iso9660'
+            data.serial = str(drive['Serial'])
             if drive['ConnectionBus'] == 'usb':
                 data.type = 'usb'
+                data.vendorId, data.port = usb_location(data.device)
             else:
                 data.type = 'sd'
 
@@ -344,11 +548,12 @@ class LinuxLiveUSBCreator(LiveUSBCreator):
         for name, device in self.udisks.GetManagedObjects().items():
             handleAdded(name, device)
 
+    @metrics.measured('write', metrics.record_write, 'written')
     def dd_image(self, update_function=None):
         self.log.info(_('Overwriting device with live image'))
         drive = self.drive.device
 
-        # has to run in C locale
+        # umount has to run in the C locale for us to understand it
         env = os.environ.copy()
         keys = [k for k in env if k.startswith('LC_')]
         for i in keys:
@@ -356,67 +561,17 @@ class LinuxLiveUSBCreator(LiveUSBCreator):
 
         env['LC_ALL'] = 'C'
 
-        cmd = ['dd', 'if=%s'%self.iso, 'of=%s'%drive, 'bs=1M', 'iflag=direct', 'oflag=direct', 'conv=fdatasync']
-
-        #check for version of coreutls (for progress reporting)
-        p = subprocess.Popen(['dd', '--version'], stdout=subprocess.PIPE)
-        p.wait()
-        version = p.stdout.readline().strip().decode('utf8')
-        if version.startswith('dd (coreutils) ') and version >= 'dd (coreutils) 8.24':
-            cmd.append('status=progress')
-        else:
-            update_function = None
-
-        if update_function:
-            update_function(float('nan'))
-
         for i in os.listdir('/dev'):
             dev = os.path.join('/dev/', i)
             if dev.startswith(os.path.normpath(drive)) and dev != os.path.normpath(drive):
-                umount = subprocess.Popen(['umount', dev], env=env, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                umount.wait()
-                if umount.returncode != 0 and not 'not mounted' in umount.stdout.readline().decode('utf8'):
+                umount = self.popen(['umount', dev], passive=True, env=env)
+                if umount.returncode != 0 and not 'not mounted' in umount.output:
                     raise LiveUSBError(_("The drive you're trying to use is open in another application"))
 
-        self.log.debug(_('Running'), cmd)
-        dd = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, universal_newlines=True)
-
-        if update_function:
-            while dd.poll() is None:
-
-                buf = dd.stdout.readline()
-                match = re.search('([0-9]+) bytes', buf)
-                if match:
-                    update_function(float(match.group(1)) / self.isosize)
-        else:
-            dd.wait()
-
-        if update_function:
-            update_function(1.0)
+        self.write_image(update_function)
 
     def terminate(self):
-        for pid in self.pids:
-            try:
-                os.kill(pid, signal.SIGHUP)
-                self.log.debug("Killed process %d" % pid)
-            except OSError as e:
-                self.log.debug(repr(e))
-
-    def verify_iso_md5(self):
-        """ Verify the ISO md5sum.
-
-        At the moment this is Linux specific, until we port checkisomd5
-        to Windows.
-        """
-        self.log.info(_('Verifying ISO MD5 checksum'))
-        try:
-            self.popen('checkisomd5 "%s"' % self.iso)
-        except LiveUSBError as e:
-            self.log.exception(e)
-            self.log.info(_('ISO MD5 checksum verification failed'))
-            return False
-        self.log.info(_('ISO MD5 checksum passed'))
-        return True
+        self.runner.terminate(signal.SIGHUP)
 
     def get_proxies(self):
         """ Return the proxy settings.
@@ -449,37 +604,10 @@ class LinuxLiveUSBCreator(LiveUSBCreator):
     def format_device(self):
         """ Format the selected partition as FAT32 """
         self.log.info('Formatting %s as FAT32' % self.drive['device'])
-        self.popen('mkfs.vfat -F 32 %s' % self.drive['device'])
-
-    def calculate_device_checksum(self, progress=None):
-        """ Calculate the SHA1 checksum of the device """
-        self.log.info(_("Calculating the SHA1 of %s" % self.drive['device']))
-        if not progress:
-            class DummyProgress:
-                def set_max_progress(self, value): pass
-
-                def update_progress(self, value): pass
-
-            progress = DummyProgress()
-        # Get size of drive
-        # progress.set_max_progress(self.isosize / 1024)
-        checksum = hashlib.sha1()
-        device_name = self.drive.device.decode('utf8')
-        with open(device_name, 'rb') as device:
-            bytes = 1024 ** 2
-            total = 0
-            while bytes:
-                data = device.read(bytes)
-                checksum.update(data)
-                bytes = len(data)
-                total += bytes
-                progress.update_progress(total / 1024)
-        hexdigest = checksum.hexdigest()
-        self.log.info("sha1(%s) = %s" % (device_name, hexdigest))
-        return hexdigest
+        self.popen(['mkfs.vfat', '-F', '32', self.drive['device']])
 
     def flush_buffers(self):
-        self.popen('sync', passive=True)
+        self.popen(['sync'], passive=True)
 
 
     def is_admin(self):
@@ -541,10 +669,6 @@ class MacOsLiveUSBCreator(LiveUSBCreator):
         """
         pass
 
-    def verify_iso_md5(self):
-        """ Verify the MD5 checksum of the ISO """
-        pass
-
     def terminate(self):
         """ Terminate any subprocesses that we have spawned """
         pass
@@ -622,9 +746,14 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
 
         detect()
 
+    @metrics.measured('write', metrics.record_write, 'written')
     def dd_image(self, update_function=None):
         import re
 
+        if decompress.detect(self.iso):
+            raise LiveUSBError(_('Compressed images cannot be written on '
+                                 'Windows yet, please decompress %s first') % self.iso)
+
         if update_function:
             update_function(float("NaN"))
 
@@ -639,6 +768,7 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
             self.log('Diskpart exited with a nonzero status')
             return
 
+        written = os.path.getsize(self.iso)  # dd.exe copies the file as it is
         dd = subprocess.Popen([(os.path.dirname(sys.argv[0]) if len(os.path.dirname(sys.argv[0])) else os.path.dirname(os.path.realpath(__file__))+'/..')+'/tools/dd.exe',
                                'bs=1M',
                                'if='+self.iso,
@@ -650,6 +780,7 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
                               stderr=subprocess.STDOUT,
                               bufsize=1,
                               universal_newlines=True)
+        self.cancel_token.on_cancel(dd.kill)
         if update_function:
             while dd.poll() is None:
                 buf = dd.stdout.readline().strip()
@@ -661,11 +792,13 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
                         raise LiveUSBError(buf)
                 r = re.search('^([,0-9]+)', buf)
                 if r and len(r.groups()) > 0 and len(r.group(0)) > 0:
-                    ratio = float(float(r.group(0).replace(',', '')) / self.isosize)
+                    ratio = float(float(r.group(0).replace(',', '')) / written)
                     if ratio >= 0.0 and ratio <= 1.0:
                         update_function(ratio)
         else:
             dd.wait()
+        self.cancel_token.check()
+        self.isosize = self.written = written
 
         if update_function:
             update_function(1.0)
@@ -749,8 +882,6 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
 
     def popen(self, cmd, **kwargs):
         import win32process
-        if isinstance(cmd, str):
-            cmd = cmd.split()
         prgmfiles = os.getenv('PROGRAMFILES')
         folder = 'LiveUSB Creator'
         paths = [os.path.join(x, folder) for x in (prgmfiles, prgmfiles + ' (x86)')]
@@ -759,14 +890,14 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
         for path in paths:
             exe = os.path.join(path, 'tools', '%s.exe' % cmd[0])
             if os.path.exists(exe):
-                tool = '"%s"' % exe
+                tool = exe
                 break
         else:
             raise LiveUSBError(_("Cannot find") + ' %s.  ' % (cmd[0]) +
                                _("Make sure to extract the entire "
                                  "liveusb-creator zip file before "
                                  "running this program."))
-        return LiveUSBCreator.popen(self, ' '.join([tool] + cmd[1:]),
+        return LiveUSBCreator.popen(self, [tool] + cmd[1:],
                                     creationflags=win32process.CREATE_NO_WINDOW,
                                     **kwargs)
 
@@ -806,44 +937,11 @@ class WindowsLiveUSBCreator(LiveUSBCreator):
         self.log.debug(_('Using proxies: %r') % proxies)
         return proxies
 
-    def verify_iso_md5(self):
-        """ Verify the ISO md5sum.
-
-        At the moment this is Linux-only, until we port checkisomd5 to Windows.
-        """
-        return True
-
-    def calculate_device_checksum(self, progress=None):
-        """ Calculate the SHA1 checksum of the device """
-        self.log.info(_("Calculating the SHA1 of %s" % self._drive))
-        time.sleep(3)
-        if not progress:
-            class DummyProgress:
-                def set_max_progress(self, value): pass
-
-                def update_progress(self, value): pass
-
-            progress = DummyProgress()
-        progress.set_max_progress(self.drive['size'])
-        checksum = hashlib.sha1()
-        device_name = r'\\.\%s' % self.drive['device']
-        with open(device_name, 'rb') as device:
-            bytes = 1
-            total = 0
-            while bytes:
-                data = device.read(1024 ** 2)
-                checksum.update(data)
-                bytes = len(data)
-                total += bytes
-                progress.update_progress(total)
-        hexdigest = checksum.hexdigest()
-        self.log.info("sha1(%s) = %s" % (self.drive['device'], hexdigest))
-        return hexdigest
-
     def format_device(self):
         """ Format the selected partition as FAT32 """
         self.log.info('Formatting %s as FAT32' % self.drive['device'])
-        self.popen('format /Q /X /y /V:Fedora /FS:FAT32 %s' % self.drive['device'])
+        self.popen(['format', '/Q', '/X', '/y', '/V:Fedora', '/FS:FAT32',
+                    self.drive['device']])
 
     def is_admin(self):
         import pywintypes
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+The flashing daemon, started with --daemon.
+
+Jobs are kept in an SQLite database, so they survive restarts, and are
+submitted and cancelled through a JSON protocol on a Unix socket: clients
+send one JSON object per line and get one back.
+
+    {"command": "submit", "iso": "/srv/f24.iso", "name": "SanDisk"}
+    {"command": "cancel", "id": 3}
+    {"command": "jobs"}
+    {"command": "job", "id": 3}
+    {"command": "drives"}
+
+A queued job starts as soon as a drive that matches it is attached and
+idle.  A drive that has been written to is left alone until it is
+unplugged, so a kiosk only needs to keep plugging in sticks.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+from liveusb import _, LiveUSBError
+from liveusb.batch import BatchFlasher, ManifestJob, MATCH_ALL
+
+SOCKET_PATH = os.getenv('LIVEUSB_CREATOR_SOCKET', '/run/liveusb-creator.sock')
+DATABASE_PATH = os.getenv('LIVEUSB_CREATOR_DATABASE',
+                          '/var/lib/liveusb-creator/jobs.sqlite')
+MAX_RUNNING = 4  # jobs written at the same time
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    iso TEXT NOT NULL,
+    device TEXT,
+    name TEXT,
+    min_size INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    target TEXT,
+    error TEXT,
+    log TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+)
+"""
+COLUMNS = ('id', 'iso', 'device', 'name', 'min_size', 'state', 'target',
+           'error', 'log', 'created', 'started', 'finished')
+
+
+class JobQueue(object):
+    """ The persistent list of flash jobs.
+
+    device is the device a job has to be written to, or None for any drive
+    matching name and min_size.  target is the device it was written to.
+    """
+
+    def __init__(self, path=DATABASE_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _execute(self, sql, *args):
+        with self._lock, self._db:
+            return self._db.execute(sql, args)
+
+    def _rows(self, sql, *args):
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def submit(self, iso, device=None, name=None, min_size=0):
+        """ Queue a job, returning its id """
+        return self._execute(
+            'INSERT INTO jobs (iso, device, name, min_size, state, created) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            iso, device, name, int(min_size or 0), QUEUED, time.time()).lastrowid
+
+    def get(self, job_id):
+        rows = self._rows('SELECT %s FROM jobs WHERE id = ?' % ', '.join(COLUMNS), job_id)
+        return rows[0] if rows else None
+
+    def jobs(self, state=None):
+        sql = 'SELECT %s FROM jobs' % ', '.join(COLUMNS)
+        if state:
+            return self._rows(sql + ' WHERE state = ? ORDER BY id', state)
+        return self._rows(sql + ' ORDER BY id')
+
+    def claim(self, job_id, target):
+        """ Mark a queued job as running on target; False if it wasn't queued """
+        return self._execute(
+            'UPDATE jobs SET state = ?, target = ?, started = ? '
+            'WHERE id = ? AND state = ?',
+            RUNNING, target, time.time(), job_id, QUEUED).rowcount == 1
+
+    def finish(self, job_id, state, error=None, log=None):
+        self._execute(
+            'UPDATE jobs SET state = ?, error = ?, log = ?, finished = ? WHERE id = ?',
+            state, error, log, time.time(), job_id)
+
+    def cancel(self, job_id):
+        """ Cancel a queued job; False if it isn't queued any more """
+        return self._execute(
+            'UPDATE jobs SET state = ?, finished = ? WHERE id = ? AND state = ?',
+            CANCELLED, time.time(), job_id, QUEUED).rowcount == 1
+
+    def requeue_running(self):
+        """ Put back the jobs a previous daemon was interrupted in """
+        return self._execute(
+            'UPDATE jobs SET state = ?, target = NULL, started = NULL WHERE state = ?',
+            QUEUED, RUNNING).rowcount
+
+
+def job_filter(job):
+    return ManifestJob(job['iso'], job['device'] or MATCH_ALL,
+                       job['name'], job['min_size'])
+
+
+class FlashDaemon(object):
+    """ Schedules the queued jobs onto the attached drives.
+
+    @param opts: The command line options, passed to the creators.
+    @param queue: The JobQueue.
+    @param creator: The LiveUSBCreator class to write with.
+    """
+
+    def __init__(self, opts, queue, creator, max_running=MAX_RUNNING):
+        self.opts = opts
+        self.queue = queue
+        self.creator = creator
+        self.max_running = max_running
+        self.drives = {}  # {device: Drive} of the attached drives
+        self.written = set()  # devices that got a job since they were attached
+        self.running = {}  # {job id: device}
+        self.progress = {}  # {job id: the last progress event}
+        self.cancelled = set()
+        self.flasher = BatchFlasher(opts, creator, self.report,
+                                    verify=not opts.noverify)
+        self.detector = None
+        self._lock = threading.RLock()
+
+    def update_drives(self, drives):
+        """ Take note of the attached drives and start what can be started """
+        with self._lock:
+            self.drives = dict((drive.device, drive) for drive in drives.values())
+            self.written &= set(self.drives)
+        self.schedule()
+
+    def schedule(self):
+        """ Start the queued jobs that have an idle drive to go to """
+        started = []
+        with self._lock:
+            busy = set(self.running.values()) | self.written
+            for job in self.queue.jobs(QUEUED):
+                if len(self.running) >= self.max_running:
+                    break
+                wanted = job_filter(job)
+                for device in sorted(self.drives):
+                    drive = self.drives[device]
+                    if device in busy or not wanted.matches(drive):
+                        continue
+                    if self.queue.claim(job['id'], device):
+                        self.running[job['id']] = device
+                        self.written.add(device)
+                        busy.add(device)
+                        started.append((job, drive))
+                    break
+        for job, drive in started:
+            thread = threading.Thread(target=self.flash, args=(job, drive),
+                                      name='flash-%d' % job['id'])
+            thread.daemon = True
+            thread.start()
+        return [job['id'] for job, drive in started]
+
+    def flash(self, job, drive):
+        try:
+            self.flasher.flash(job['id'], job['iso'], drive)
+        finally:
+            with self._lock:
+                self.running.pop(job['id'], None)
+                self.progress.pop(job['id'], None)
+                self.cancelled.discard(job['id'])
+                self.flasher.forget(job['id'])
+            self.schedule()
+
+    def report(self, event, **fields):
+        job_id = fields.get('job')
+        if event == 'progress':
+            self.progress[job_id] = fields
+        elif event == 'done':
+            self.queue.finish(job_id, DONE, log=fields['log'])
+        elif event == 'error':
+            if job_id in self.cancelled:
+                self.queue.finish(job_id, CANCELLED)
+            else:
+                self.queue.finish(job_id, FAILED, error=fields['error'])
+
+    def submit(self, iso, device=None, name=None, min_size=0):
+        if not os.path.isfile(iso):
+            raise LiveUSBError(_('Cannot find the image %s') % iso)
+        job_id = self.queue.submit(iso, device, name, min_size)
+        self.schedule()
+        return job_id
+
+    def cancel(self, job_id):
+        """ Cancel a queued job, or stop a running one """
+        if self.queue.cancel(job_id):
+            return True
+        with self._lock:
+            if job_id not in self.running:
+                return False
+            self.cancelled.add(job_id)
+            # under the lock, so flash() can't be over before it's terminated
+            self.flasher.terminate(job_id)
+        return True
+
+    def job(self, job_id):
+        job = self.queue.get(job_id)
+        if job and job_id in self.progress:
+            job['progress'] = self.progress[job_id]
+        return job
+
+    def jobs(self, state=None):
+        jobs = self.queue.jobs(state)
+        for job in jobs:
+            if job['id'] in self.progress:
+                job['progress'] = self.progress[job['id']]
+        return jobs
+
+    def handle(self, request):
+        """ Answer a request of the control protocol """
+        command = request.get('command')
+        if command == 'submit':
+            if 'iso' not in request:
+                raise LiveUSBError(_('A job needs an iso'))
+            return {'id': self.submit(request['iso'], request.get('device'),
+                                      request.get('name'), request.get('min_size', 0))}
+        elif command == 'cancel':
+            return {'cancelled': self.cancel(int(request['id']))}
+        elif command == 'job':
+            return {'job': self.job(int(request['id']))}
+        elif command == 'jobs':
+            return {'jobs': self.jobs(request.get('state'))}
+        elif command == 'drives':
+            with self._lock:
+                return {'drives': [{'device': drive.device,
+                                    'name': drive.friendlyName,
+                                    'size': drive.size,
+                                    'busy': device in self.running.values(),
+                                    'written': device in self.written}
+                                   for device, drive in sorted(self.drives.items())]}
+        raise LiveUSBError(_('Unknown command: %s') % command)
+
+    def listen(self, path=SOCKET_PATH):
+        """ Start answering requests on a Unix socket, in a thread """
+        if os.path.exists(path):
+            os.remove(path)
+        server = ControlServer(path, self)
+        os.chmod(path, 0o660)
+        thread = threading.Thread(target=server.serve_forever, name='control')
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def serve(self, path=SOCKET_PATH):
+        """ Run the daemon until it gets SIGTERM or SIGINT """
+        requeued = self.queue.requeue_running()
+        server = self.listen(path)
+        try:
+            loop, self.detector = hotplug_loop(self.opts, self.creator, self.update_drives)
+            if requeued:
+                self.detector.log.info('Requeued %d interrupted jobs' % requeued)
+            self.detector.log.info('Listening on %s' % path)
+            loop.run()
+        finally:
+            server.shutdown()
+            server.server_close()
+            if os.path.exists(path):
+                os.remove(path)
+            self.flasher.terminate()
+
+
+def hotplug_loop(opts, creator, update_drives):
+    """ Follow the UDisks2 hotplug signals on a GLib main loop.
+
+    update_drives is called with the drives of the detecting creator now
+    and whenever a drive comes or goes.  Returns the main loop, which quits
+    on SIGTERM and SIGINT, and the detecting creator.
+    """
+    import dbus.mainloop.glib
+    from gi.repository import GLib
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    loop = GLib.MainLoop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signum, loop.quit)
+    # only a non-console creator registers for the hotplug signals
+    opts.console = False
+    detector = creator(opts)
+    detector.detect_removable_drives(callback=lambda: update_drives(detector.drives))
+    update_drives(detector.drives)
+    return loop, detector
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError('expected a JSON object')
+                response = self.server.daemon.handle(request)
+                response['ok'] = True
+            except (LiveUSBError, ValueError, KeyError, TypeError) as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, ControlHandler)
+
+    def server_bind(self):
+        # the socket must never exist with looser permissions than 0660
+        umask = os.umask(0o117)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+
+class DaemonClient(object):
+    """ Talks to a running flashing daemon """
+
+    def __init__(self, path=SOCKET_PATH, timeout=10):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, command, **args):
+        args['command'] = command
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+                sock.sendall(json.dumps(args).encode('utf-8') + b'\n')
+                with sock.makefile('rb') as reply:
+                    line = reply.readline()
+            finally:
+                sock.close()
+        except (socket.error, OSError) as e:
+            raise LiveUSBError(_('Unable to reach the flashing daemon at %s: %s') % (self.path, e))
+        if not line:
+            raise LiveUSBError(_('The flashing daemon closed the connection'))
+        response = json.loads(line.decode('utf-8'))
+        if not response.pop('ok', False):
+            raise LiveUSBError(response.get('error', ''))
+        return response
+
+    def submit(self, iso, device=None, name=None, min_size=0):
+        return self.request('submit', iso=os.path.abspath(iso), device=device,
+                            name=name, min_size=min_size)['id']
+
+    def cancel(self, job_id):
+        return self.request('cancel', id=job_id)['cancelled']
+
+    def job(self, job_id):
+        return self.request('job', id=job_id)['job']
+
+    def jobs(self, state=None):
+        return self.request('jobs', state=state)['jobs']
+
+    def drives(self):
+        return self.request('drives')['drives']
+
+
+def main(opts, args):
+    """ Run the daemon, or talk to it, from the command line """
+    from liveusb import LiveUSBCreator
+    if opts.daemon:
+        daemon = FlashDaemon(opts, JobQueue(), LiveUSBCreator)
+        daemon.serve()
+        return 0
+    client = DaemonClient()
+    try:
+        if opts.submit:
+            if len(args) != 1:
+                raise LiveUSBError(_('Please give the ISO to queue'))
+            result = {'id': client.submit(args[0], opts.force or None)}
+        elif opts.cancel:
+            result = {'cancelled': client.cancel(int(opts.cancel))}
+        else:
+            result = {'jobs': client.jobs()}
+    except LiveUSBError as e:
+        print(json.dumps({'error': str(e)}))
+        return 1
+    print(json.dumps(result))
+    return 0
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Compressed images, decompressed on the fly while they are written.
+
+The format is detected from the magic bytes at the start of the file, not
+from its name.  When a decompressor that can use several threads is
+installed (xz, pigz, zstd, lbzip2 or pbzip2) it runs in its own process,
+so decompression and writing overlap; otherwise the Python modules are
+used.  zstd images need either the zstd tool or the zstandard module.
+
+The uncompressed size is read from the xz index or the zstd frame header
+when the image has one.  gzip only records it modulo 4 GiB and bzip2 not
+at all, so for those the progress follows the compressed input instead.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from collections import OrderedDict, deque
+
+from liveusb import _, LiveUSBError
+from liveusb.reader import BlockReader
+
+CHUNK_SIZE = 1024 ** 2
+STDERR_LINES = 50  # the last lines of a decompressor's stderr kept for errors
+
+# {format: (magic, external decompressors, from the best)}
+FORMATS = OrderedDict([
+    ('xz', (b'\xfd7zXZ\x00', [['xz', '-dc', '-T0']])),
+    ('gzip', (b'\x1f\x8b', [['pigz', '-dc']])),
+    ('zstd', (b'\x28\xb5\x2f\xfd', [['zstd', '-dcq']])),
+    ('bzip2', (b'BZh', [['lbzip2', '-dc'], ['pbzip2', '-dc']])),
+])
+
+# the names the images we can write usually go by
+EXTENSIONS = ('.iso', '.img', '.raw', '.xz', '.gz', '.zst', '.bz2')
+
+
+def detect(path):
+    """ Return the compression format of a file, or None if it isn't compressed """
+    with open(path, 'rb') as image:
+        head = image.read(8)
+    for name, (magic, tools) in FORMATS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _vli(data, position):
+    """ Decode an xz variable length integer, returning it and the next position """
+    value = 0
+    for i in range(9):
+        byte = data[position + i]
+        value |= (byte & 0x7f) << (7 * i)
+        if not byte & 0x80:
+            return value, position + i + 1
+    raise ValueError('Invalid variable length integer')
+
+
+def _xz_size(image, end):
+    """ Sum the uncompressed sizes in the indexes of the xz streams before end """
+    total = 0
+    while end > 0:
+        image.seek(end - 12)
+        footer = image.read(12)
+        if footer[10:] != b'YZ':
+            if footer[-4:] == b'\0\0\0\0':
+                end -= 4  # stream padding
+                continue
+            return None
+        index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        index_start = end - 12 - index_size
+        image.seek(index_start)
+        index = bytearray(image.read(index_size))
+        if not index or index[0] != 0:
+            return None
+        records, position = _vli(index, 1)
+        blocks = 0
+        for i in range(records):
+            unpadded, position = _vli(index, position)
+            uncompressed, position = _vli(index, position)
+            blocks += (unpadded + 3) & ~3
+            total += uncompressed
+        end = index_start - blocks - 12
+    return total if end == 0 else None
+
+
+def _zstd_size(header):
+    """ Return the content size in a zstd frame header, if it has one """
+    descriptor = bytearray(header)[4]
+    single_segment = descriptor & 0x20
+    position = 5 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 3]
+    length = (1 if single_segment else 0, 2, 4, 8)[descriptor >> 6]
+    if not length:
+        return None
+    value = int.from_bytes(header[position:position + length], 'little')
+    return value + 256 if length == 2 else value
+
+
+def uncompressed_size(path, format=None):
+    """ Return the size of the decompressed image, or None if the image doesn't say """
+    format = format or detect(path)
+    if format is None:
+        return os.path.getsize(path)
+    try:
+        with open(path, 'rb') as image:
+            if format == 'xz':
+                return _xz_size(image, os.path.getsize(path))
+            if format == 'zstd':
+                return _zstd_size(image.read(18))
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def image_size(path):
+    """ How much will be written for an image, as far as we can tell up front """
+    size = uncompressed_size(path)
+    return size if size is not None else os.path.getsize(path)
+
+
+class DecompressedImage(object):
+    """ A compressed image, read as if it were the raw image.
+
+    @param path: The path of the compressed image.
+    @param format: Its compression format, as returned by detect().
+    @param tools: Whether to use the external decompressors when available.
+    """
+
+    def __init__(self, path, format, tools=True):
+        self.path = path
+        self.format = format
+        self.size = uncompressed_size(path, format)
+        self.compressed_size = os.path.getsize(path)
+        self.consumed = 0  # compressed bytes fed to the decompressor
+        self._raw = open(path, 'rb')
+        self._process = None
+        self._feeder = None
+        self._drainer = None
+        self._stderr = deque(maxlen=STDERR_LINES)
+        command = self._tool() if tools else None
+        try:
+            if command:
+                self._stream = self._spawn(command)
+            else:
+                self._stream = self._module()
+        except Exception:
+            self._raw.close()
+            raise
+
+    def _tool(self):
+        for command in FORMATS[self.format][1]:
+            if shutil.which(command[0]):
+                return command
+        return None
+
+    def _spawn(self, command):
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+        self._feeder = threading.Thread(target=self._feed, name='decompress-feed')
+        self._feeder.daemon = True
+        self._feeder.start()
+        # a decompressor blocks once the stderr pipe fills up, so keep reading it
+        self._drainer = threading.Thread(target=self._drain, name='decompress-stderr')
+        self._drainer.daemon = True
+        self._drainer.start()
+        return self._process.stdout
+
+    def _feed(self):
+        try:
+            while True:
+                data = self._raw.read(CHUNK_SIZE)
+                if not data:
+                    break
+                self._process.stdin.write(data)
+                self.consumed += len(data)
+        except (IOError, OSError, ValueError):
+            pass  # the decompressor is gone, read() will tell why
+        finally:
+            try:
+                self._process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def _drain(self):
+        try:
+            for line in self._process.stderr:
+                line = line.rstrip()
+                if line:
+                    self._stderr.append(line.decode('utf-8', 'replace'))
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _module(self):
+        if self.format == 'xz':
+            return lzma.LZMAFile(self._raw)
+        if self.format == 'gzip':
+            return gzip.GzipFile(fileobj=self._raw)
+        if self.format == 'bzip2':
+            return bz2.BZ2File(self._raw)
+        try:
+            import zstandard
+        except ImportError:
+            raise LiveUSBError(_('Writing zstd compressed images needs either '
+                                 'the zstd tool or the zstandard module'))
+        return zstandard.ZstdDecompressor().stream_reader(self._raw)
+
+    def read(self, size=CHUNK_SIZE):
+        data = self._call(self._stream.read, size)
+        self._check(len(data))
+        return data
+
+    def readinto(self, buffer):
+        count = self._call(self._stream.readinto, buffer)
+        self._check(count)
+        return count
+
+    def _call(self, method, argument):
+        try:
+            return method(argument)
+        except (EOFError, IOError, OSError, ValueError, lzma.LZMAError) as e:
+            raise LiveUSBError(_('Decompressing %s failed: %s') % (self.path, e))
+
+    def _check(self, count):
+        if self._process is None:
+            self.consumed = self._raw.tell()
+        elif not count and self._process.wait() != 0:
+            self._drainer.join()
+            error = '\n'.join(self._stderr)
+            raise LiveUSBError(_('Decompressing %s failed: %s') % (self.path, error))
+
+    def seekable(self):
+        return False
+
+    def fraction(self, position):
+        """ How far along the image position is, by the uncompressed size if known """
+        if self.size:
+            return min(float(position) / self.size, 1.0)
+        if self.compressed_size:
+            return min(float(self.consumed) / self.compressed_size, 1.0)
+        return 1.0
+
+    def close(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process.stdout.close()
+            self._feeder.join()
+            self._drainer.join()
+            self._process.stderr.close()
+        else:
+            self._stream.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_full(image, size):
+    """ Read size bytes, or up to the end of the image """
+    data = image.read(size)
+    while len(data) < size:
+        more = image.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def open_image(path, tools=True):
+    """ Open an image for reading, decompressing it if it is compressed """
+    format = detect(path)
+    if format is None:
+        return open(path, 'rb')
+    return DecompressedImage(path, format, tools)
+
+
+def read_blocks(path, block_size=CHUNK_SIZE, limit=None):
+    """ A BlockReader over an image, decompressing it if it is compressed """
+    format = detect(path)
+    return BlockReader(DecompressedImage(path, format) if format else path,
+                       block_size, limit)
@@ -1,13 +1,26 @@
 import subprocess
+import errno
+import http.client
+import io
+import json
 import os
+import queue
+import shutil
 import sys
-import requests
 import tempfile
+import threading
+import time
+from urllib.parse import urlparse
 
 from liveusb import _
 from liveusb import LiveUSBError
+from liveusb import metrics
+from liveusb.reader import BlockReader
 
-from PyQt5.QtCore import QStandardPaths
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (30.0, 30.0)
+SEGMENT_RETRIES = 3  # how often a range is retried after the connection broke
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024  # how much is downloaded between records of the extents
 
 
 def find_downloads():
@@ -33,6 +46,7 @@ def find_downloads():
             path = tempfile.mkdtemp("liveusb-creator")
 
     else:
+        from PyQt5.QtCore import QStandardPaths
         path = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
 
     return path
@@ -50,98 +64,601 @@ def chown_file(path):
             pw = pwd.getpwuid(uid)
             gid = pw[3]
         else:
-            pass
+            return  # it already belongs to us
 
         os.chown(path, uid, gid)
     else:
         pass
 
-def cancel_download(url, target_folder=find_downloads()):
+def cancel_download(url, target_folder=None):
+    if target_folder is None:
+        target_folder = find_downloads()
     file_name = os.path.basename(url)
     full_path = os.path.join(target_folder, file_name)
     partial_path = full_path + ".part"
 
     if os.path.exists(partial_path):
         os.remove(partial_path)
+    PartialFile(partial_path).remove()
+
+def mirror_urls(url, base_url, mirrors):
+    """ The URLs of a file under base_url on each of the mirrors """
+    base_url = base_url.rstrip('/')
+    if not url.startswith(base_url + '/'):
+        return []
+    return [mirror.rstrip('/') + url[len(base_url):] for mirror in mirrors]
+
+class ResponseBody(io.RawIOBase):
+    """ The body of a streamed response, read straight into our buffers
+
+    urllib3's readinto() reads a new bytes object and copies it over, so
+    unless the body is compressed this reads from the http.client response
+    under it.  That isn't part of urllib3's API, so anything but an
+    http.client response there goes through urllib3's readinto() instead.
+    Broken connections raise requests' ConnectionError, as they do from
+    iter_content().
+    """
+
+    def __init__(self, response):
+        io.RawIOBase.__init__(self)
+        self.response = response
+        raw = response.raw
+        self._fp = getattr(raw, '_fp', None)
+        if (raw.headers.get('Content-Encoding', 'identity') != 'identity'
+                or not isinstance(self._fp, http.client.HTTPResponse)):
+            raw.decode_content = True
+            self._fp = raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        import requests
+        try:
+            return self._fp.readinto(buffer)
+        except (http.client.HTTPException, OSError) as e:
+            raise requests.exceptions.ConnectionError(e)
+
+    def close(self):
+        if not self.closed:
+            if self._fp is not self.response.raw and self._fp.isclosed():
+                # read to the end, the connection can be used again
+                self.response.raw.release_conn()
+            else:
+                self.response.close()
+        io.RawIOBase.close(self)
+
+
+def _write_at(f, block, offset):
+    """ Write all of block at offset of the unbuffered file f """
+    if not hasattr(os, 'pwrite'):
+        f.seek(offset)
+        f.write(block)
+        return
+    while block:
+        written = os.pwrite(f.fileno(), block, offset)
+        block = block[written:]
+        offset += written
+
+class PartialFile(object):
+    """ What of a partial download has been downloaded
+
+    A .part file is allocated in full before the download starts, so its
+    size says nothing about how much of it is there.  The ranges that are,
+    along with the size and the ETag of what they were downloaded from,
+    are kept next to it in a .extents file, recorded once they are on the
+    disk, and empty as soon as the file has been allocated.  A .part file
+    without one is from before, valid to its size (legacy), unless it is
+    as big as the download: that could just as well be one allocated by a
+    download that died before recording anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sidecar = path + '.extents'
+        self.size = None
+        self.etag = None
+        self.extents = []  # sorted [start, end) ranges
+        self.unsaved = 0  # bytes added since the last save
+        self.legacy = False
+        self._lock = threading.Lock()
+        self._saving = threading.Lock()
+
+    @classmethod
+    def load(cls, path, size=None):
+        """ Load what is known of path, a download of size bytes if known """
+        partial = cls(path)
+        if not os.path.exists(path):
+            return partial
+        try:
+            with open(partial.sidecar) as sidecar:
+                record = json.load(sidecar)
+        except (IOError, OSError) as e:
+            length = os.path.getsize(path)
+            if e.errno == errno.ENOENT and (size is None or length < size):
+                partial.extents = [[0, length]]
+                partial.legacy = True
+            return partial
+        except ValueError:
+            return partial
+        partial.size = record.get('size')
+        partial.etag = record.get('etag')
+        partial.extents = [[int(start), int(end)] for start, end in record.get('extents', [])]
+        return partial
+
+    def reset(self, size, etag):
+        """ Start over, for a download of size bytes """
+        with self._lock:
+            self.size = size
+            self.etag = etag
+            self.extents = []
+            self.unsaved = 0
+
+    def valid(self):
+        """ The number of bytes downloaded from the beginning on """
+        with self._lock:
+            if self.extents and self.extents[0][0] == 0:
+                return self.extents[0][1]
+        return 0
+
+    def downloaded(self):
+        with self._lock:
+            return sum(end - start for start, end in self.extents)
+
+    def missing(self, size):
+        """ The [start, end) ranges of the first size bytes still to download """
+        gaps = []
+        position = 0
+        with self._lock:
+            for start, end in self.extents:
+                if start > position:
+                    gaps.append((position, min(start, size)))
+                position = max(position, end)
+        if position < size:
+            gaps.append((position, size))
+        return [(start, end) for start, end in gaps if start < end]
+
+    def add(self, start, end):
+        with self._lock:
+            merged = []
+            for extent in sorted(self.extents + [[start, end]]):
+                if merged and extent[0] <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], extent[1])
+                else:
+                    merged.append(extent)
+            self.extents = merged
+            self.unsaved += end - start
+
+    def save(self, f):
+        """ Record the extents, once the data of f they cover is on the disk """
+        with self._saving:
+            with self._lock:
+                record = {'size': self.size, 'etag': self.etag,
+                          'extents': [list(extent) for extent in self.extents]}
+                self.unsaved = 0
+            try:
+                os.fsync(f.fileno())
+                temporary = self.sidecar + '.tmp'
+                with open(temporary, 'w') as sidecar:
+                    json.dump(record, sidecar)
+                    sidecar.flush()
+                    os.fsync(sidecar.fileno())
+                os.rename(temporary, self.sidecar)
+            except (IOError, OSError):
+                pass  # all it costs is downloading it again
+
+    def remove(self):
+        try:
+            os.remove(self.sidecar)
+        except OSError:
+            pass
 
-def download(parent, url, target_folder=find_downloads(), update_maximum = None, update_current = None):
-    CHUNK_SIZE = 1024 * 1024
+
+def _allocated(path):
+    """ The bytes of the disk a file takes up already """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return 0
+    return info.st_blocks * 512 if hasattr(info, 'st_blocks') else info.st_size
+
+def check_space(folder, needed):
+    """ Raise a LiveUSBError if folder's filesystem can't take needed more bytes """
+    try:
+        free = shutil.disk_usage(folder).free
+    except OSError:
+        return
+    if needed > free:
+        raise LiveUSBError(_('There is not enough free space in %s for the download: '
+                             '%.1f MB more are needed, %.1f MB are free')
+                           % (folder, needed / 1024.0 ** 2, free / 1024.0 ** 2))
+
+def preallocate(f, size):
+    """ Allocate the whole file up front, so that it is written contiguously,
+    raising a LiveUSBError if it doesn't fit
+    """
+    check_space(os.path.dirname(os.path.abspath(f.name)), size - _allocated(f.name))
+    if not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise LiveUSBError(_('There is not enough free space for the download '
+                                 'of %s') % os.path.basename(f.name))
+        # the filesystem doesn't allocate ahead, the file grows as it goes
+
+def _hash_file(path, hasher, limit=None):
+    """ Feed hasher the first limit bytes of a file """
+    with BlockReader(path, CHUNK_SIZE, limit, drop_cache=False) as source:
+        for block in source:
+            hasher.update(block)
+
+def download(parent, url, target_folder=None, update_maximum = None, update_current = None,
+             segments=1, mirrors=(), hasher=None, size=None):
+    """ Download url to the downloads folder, resuming a partial download
+
+    With more than one segment, or with mirrors, the file is fetched as
+    ranges by that many connections at once, spread over url and the
+    mirrors, as long as the server supports ranges.
+
+    @param hasher: A MultiHasher, or anything with update(), that gets the
+        whole file in order.  The data is hashed as it arrives, except for
+        a file that was already downloaded, a partial download picked up and
+        the pieces of a segmented one, which are read back from the disk.
+    @param size: The size the file is expected to be, such as that of the
+        release, to check there is room for it before connecting.  Its
+        Content-Length is what counts once known.
+    """
+    import requests
     current_size = 0
     file_name = parent.filename
+    if target_folder is None:
+        target_folder = find_downloads()
     if isinstance(target_folder, bytes):
         target_folder = target_folder.decode('utf8')
     full_path = os.path.join(target_folder, file_name)
     partial_path = full_path + ".part"
     if os.path.exists(full_path):
-        print(full_path)
+        if hasher:
+            _hash_file(full_path, hasher)
         return full_path
-    elif os.path.exists(partial_path):
-        current_size = os.path.getsize(partial_path)
+    if size:
+        check_space(target_folder, size - _allocated(partial_path))
+
+    if segments > 1 or mirrors:
+        segmented = SegmentedDownload(parent, [url] + list(mirrors), partial_path,
+                                      max(segments, len(mirrors) + 1))
+        try:
+            with metrics.timed('download'):
+                result = segmented.run(update_maximum, update_current) if segmented.probe() else False
+            if result is not False:
+                if result is None:
+                    cancel_download(url, target_folder)
+                    return None
+                if hasher:
+                    _hash_file(partial_path, hasher)
+                segmented.partial.remove()
+                os.rename(partial_path, full_path)
+                return full_path
+        except requests.exceptions.RequestException as e:
+            raise LiveUSBError("Your internet connection seems to be broken")
+        # no ranges, one stream it is
+
+    partial = PartialFile.load(partial_path, size)
+    current_size = partial.valid()
     bytes_read = current_size
 
     if current_size > 0:
         resume_header = {'Range': 'bytes=%d-' % current_size}
+        if partial.etag:
+            resume_header['If-Range'] = partial.etag
     else:
         resume_header = {}
 
+    mirror = urlparse(url).netloc
     try:
-        r = requests.get(url, headers=resume_header, stream=True, allow_redirects=True, timeout=(30.0, 30.0))
-
-        if r.status_code == 200:
-            mode = "wb"
-        elif r.status_code == 206:
-            mode = "ab"
-        elif r.status_code == 416:
-            return full_path
-        else:
-            raise LiveUSBError("Couldn't download the file: %s (%d)" % (r.reason, r.status_code))
-
-        if update_maximum:
-            update_maximum(current_size + int(r.headers['Content-Length']))
-
-        with open(partial_path, mode) as f:
-            chown_file(partial_path)
-
-            for chunk in r.iter_content(CHUNK_SIZE):
-                if not parent.beingCancelled:
-                    f.write(chunk)
-                    bytes_read += len(chunk)
-                    if update_current:
-                        update_current(bytes_read)
-                else:
-                    f.close()
-                    cancel_download(url, target_folder)
-                    return None
-
-        os.rename(partial_path, full_path)
+        with metrics.timed('download') as timer:
+            r = requests.get(url, headers=resume_header, stream=True, allow_redirects=True, timeout=TIMEOUT)
+            if r.status_code == 416 and partial.legacy:
+                # as big as the download, or bigger: it may only have been allocated
+                r.close()
+                current_size = bytes_read = 0
+                r = requests.get(url, stream=True, allow_redirects=True, timeout=TIMEOUT)
+            mirror = urlparse(r.url).netloc
+
+            if r.status_code == 200:
+                mode = "wb"
+                current_size = bytes_read = 0
+                partial.remove()  # about to be truncated
+            elif r.status_code == 206:
+                mode = "r+b"
+            elif r.status_code == 416:
+                # the partial file is already complete
+                if hasher:
+                    _hash_file(partial_path, hasher)
+                partial.remove()
+                os.rename(partial_path, full_path)
+                return full_path
+            else:
+                raise LiveUSBError("Couldn't download the file: %s (%d)" % (r.reason, r.status_code))
+
+            total = size
+            if 'Content-Length' in r.headers:
+                total = current_size + int(r.headers['Content-Length'])
+            if update_maximum and total:
+                update_maximum(total)
+
+            if hasher and current_size:
+                _hash_file(partial_path, hasher, current_size)
+            body = BlockReader(ResponseBody(r), CHUNK_SIZE)
+            try:
+                with open(partial_path, mode, buffering=0) as f:
+                    chown_file(partial_path)
+                    if mode == "wb":
+                        partial.reset(total, r.headers.get('ETag'))
+                    if total:
+                        preallocate(f, total)
+                    # before anything is written, the file no longer tells
+                    partial.save(f)
+
+                    try:
+                        for block in body:
+                            if not parent.beingCancelled:
+                                _write_at(f, block, bytes_read)
+                                if hasher:
+                                    hasher.update(block)
+                                partial.add(bytes_read, bytes_read + len(block))
+                                bytes_read += len(block)
+                                if partial.unsaved >= CHECKPOINT_INTERVAL:
+                                    partial.save(f)
+                                if update_current:
+                                    update_current(bytes_read)
+                            else:
+                                f.close()
+                                cancel_download(url, target_folder)
+                                metrics.record_download(mirror, bytes_read - current_size)
+                                return None
+                    except requests.exceptions.RequestException:
+                        partial.save(f)
+                        raise
+                    # less than the size we were told, or allocated
+                    f.truncate(bytes_read)
+            finally:
+                body.close()
+
+            partial.remove()
+            os.rename(partial_path, full_path)
 
     except requests.exceptions.RequestException as e:
+        metrics.record_download(mirror, bytes_read - current_size)
         raise LiveUSBError("Your internet connection seems to be broken")
 
+    metrics.record_download(mirror, bytes_read - current_size, timer.duration)
     return full_path
 
 
+def _content_range(response):
+    """ Return the (first, last, size) of a 206 response, None for anything else """
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code != 206 or not content_range.startswith('bytes '):
+        return None
+    span, _slash, size = content_range[len('bytes '):].partition('/')
+    first, _dash, last = span.partition('-')
+    try:
+        return int(first), int(last), int(size)
+    except ValueError:
+        return None
+
+
+class SegmentedDownload(object):
+    """ Fetches a file as ranges, over several connections and mirrors
+
+    The file is cut into pieces handed out to one worker per connection, so
+    a fast mirror ends up fetching more of them than a slow one.  A piece
+    whose connection breaks is picked up again where it stopped, and the
+    pieces downloaded are recorded in a PartialFile, so that only what
+    is missing is fetched when the download is run again.
+
+    Every mirror is probed for its size and ETag, which it is then asked
+    for in If-Range.  A mirror that doesn't serve ranges of a file of the
+    same size, at the probe or later, is dropped and the others fetch its
+    pieces instead.
+    """
+
+    def __init__(self, parent, urls, partial_path, connections):
+        self.parent = parent
+        self.urls = list(urls)
+        self.partial_path = partial_path
+        self.connections = connections
+        self.size = None
+        self.etag = None  # that of the first URL, the one the partial file is of
+        self.etags = {}  # {url: etag}
+        self.dropped = set()
+        self.received = dict((urlparse(url).netloc, 0) for url in self.urls)
+        self.bytes_read = 0
+        self.partial = PartialFile.load(partial_path)
+        self._pieces = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._error = None
+
+    def probe(self):
+        """ Find the size of the file, returning False if ranges aren't supported
+
+        The mirrors that don't serve the same size with ranges are left out.
+        """
+        import requests
+        urls = []
+        for index, url in enumerate(self.urls):
+            try:
+                r = requests.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                                 allow_redirects=True, timeout=TIMEOUT)
+                r.close()
+            except requests.exceptions.RequestException:
+                if not index:
+                    raise
+                continue
+            found = _content_range(r)
+            if not index:
+                if not found:
+                    return False
+                self.size = found[2]
+                self.etag = r.headers.get('ETag')
+            elif not found or found[2] != self.size:
+                continue
+            # don't go through the redirections for every piece
+            self.received.pop(urlparse(url).netloc, None)
+            self.received[urlparse(r.url).netloc] = 0
+            self.etags[r.url] = r.headers.get('ETag')
+            urls.append(r.url)
+        self.urls = urls
+        return True
+
+    def run(self, update_maximum=None, update_current=None):
+        """ Download every piece, returning None if cancelled """
+        if update_maximum:
+            update_maximum(self.size)
+        self._update = update_current
+        resume = (self.partial.extents and self.partial.size == self.size
+                  and self.partial.etag == self.etag)
+        if not resume:
+            self.partial.remove()  # about to be truncated
+            self.partial.reset(self.size, self.etag)
+        self.bytes_read = self.partial.downloaded()
+        piece = max(CHUNK_SIZE, -(-self.size // (self.connections * 4)))
+        for first, last in self.partial.missing(self.size):
+            for start in range(first, last, piece):
+                self._pieces.put((start, min(start + piece, last) - 1))
+
+        with open(self.partial_path, 'r+b' if resume else 'wb', buffering=0) as f:
+            chown_file(self.partial_path)
+            preallocate(f, self.size)
+            self.partial.save(f)
+            started = time.monotonic()
+            # the pieces of a mirror dropped after the others were done need another round
+            while not self._pieces.empty() and not self._stop.is_set():
+                urls = [url for url in self.urls if url not in self.dropped]
+                if not urls:
+                    self._error = LiveUSBError("Couldn't download the file: no mirror "
+                                               "serves it as it was")
+                    break
+                workers = [threading.Thread(target=self._work, args=(urls[i % len(urls)],),
+                                            name='download-%d' % i)
+                           for i in range(self.connections)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            duration = time.monotonic() - started
+            if self._error is not None:
+                self.partial.save(f)
+        for mirror, size in self.received.items():
+            metrics.record_download(mirror, size, None if self._error else duration)
+        if self._error is not None:
+            raise self._error
+        if self.parent.beingCancelled:
+            return None
+        return self.bytes_read
+
+    def _work(self, url):
+        import requests
+        session = requests.Session()
+        try:
+            with open(self.partial_path, 'r+b', buffering=0) as f:
+                while not self._stop.is_set() and url not in self.dropped:
+                    try:
+                        start, end = self._pieces.get_nowait()
+                    except queue.Empty:
+                        return
+                    self._fetch(session, url, f, start, end)
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+        finally:
+            session.close()
+
+    def _fetch(self, session, url, f, start, end):
+        import requests
+        mirror = urlparse(url).netloc
+        position = start
+        for attempt in range(SEGMENT_RETRIES + 1):
+            headers = {'Range': 'bytes=%d-%d' % (position, end)}
+            if self.etags.get(url):
+                headers['If-Range'] = self.etags[url]
+            try:
+                r = session.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+                found = _content_range(r)
+                if not found or found[0] != position or found[2] != self.size:
+                    # not the file it was, or not ranges of it: leave it to the others
+                    r.close()
+                    with self._lock:
+                        self.dropped.add(url)
+                    self._pieces.put((position, end))
+                    return
+                body = BlockReader(ResponseBody(r), CHUNK_SIZE, end + 1 - position)
+                try:
+                    for block in body:
+                        if self.parent.beingCancelled or self._stop.is_set():
+                            self._stop.set()
+                            return
+                        _write_at(f, block, position)
+                        self.partial.add(position, position + len(block))
+                        position += len(block)
+                        self._received(mirror, len(block))
+                        if self.partial.unsaved >= CHECKPOINT_INTERVAL:
+                            self.partial.save(f)
+                finally:
+                    body.close()
+            except requests.exceptions.RequestException:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                continue
+            if position > end:
+                return
+        raise LiveUSBError("Couldn't download the file: %s stopped at byte %d" % (mirror, position))
+
+    def _received(self, mirror, size):
+        with self._lock:
+            self.received[mirror] += size
+            self.bytes_read += size
+            if self._update:
+                self._update(self.bytes_read)
+
+
+_session = None
+
+def session():
+    """ The requests Session the pages are read with, keeping the
+    connections alive from one page of a site to the next
+    """
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
 def urlread(url):
-    CHUNK_SIZE = 1024 * 1024
+    import requests
 
-    bytes_read = 0
-    ret = ''
+    chunks = []
 
     try:
-        r = requests.get(url, stream=True, allow_redirects=True, timeout=(30.0, 30.0))
+        r = session().get(url, stream=True, allow_redirects=True, timeout=TIMEOUT)
 
         if r.status_code != 200:
             raise LiveUSBError("Couldn't download the file: %s (%d)" % (r.reason, r.status_code))
 
         for chunk in r.iter_content(CHUNK_SIZE):
-            chunk = chunk.decode('utf8')
-            bytes_read += len(chunk)
-            ret += chunk
+            chunks.append(chunk)
 
     except requests.exceptions.RequestException as e:
         raise LiveUSBError("Your internet connection seems to be broken")
 
-    return ret
+    # decoded at once, a character may straddle two chunks
+    return b''.join(chunks).decode('utf8')
 
 
 
@@ -37,7 +37,6 @@ import os
 import sys
 import logging
 import urllib.parse as urlparse
-import ruamel.yaml as yaml
 
 
 from time import sleep
@@ -49,13 +48,21 @@ from PyQt5.QtGui import QGuiApplication
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtQml import qmlRegisterType, qmlRegisterUncreatableType, QQmlComponent, QQmlApplicationEngine, QQmlListProperty, QQmlEngine
 from PyQt5 import QtQuick
-from setuptools.sandbox import save_pkg_resources_state
 
 from . import resources_rc
 from . import qml_rc
 from . import grabber
+from . import hashing
+from . import profiling
+from .progress import ProgressMeter
+from .writer import WriteCancelled
 
 from liveusb import LiveUSBCreator, LiveUSBError, _
+from liveusb import decompress
+from liveusb.config import CONFIG
+from liveusb.releases import get_releases, get_flavors
+from liveusb.releases.diff import diff, release_keys
+from liveusb.releases.index import ARCH_MAP, ReleaseIndex, normalize
 
 try:
     import dbus.mainloop.pyqt5
@@ -63,27 +70,32 @@ try:
 except Exception as e:
     pass
 
-config_file = open('/etc/liveusb-creator.yml', 'r').read()
-
-CONFIG = yaml.safe_load(config_file)
 MAX_FAT16 = 2047
 MAX_FAT32 = 3999
 MAX_EXT = 2097152
 
-if 'Fedora' == CONFIG['DISTRO']:
-    from liveusb.releases.fedora import releases, get_flavors
-elif 'Antergos' == CONFIG['DISTRO']:
-    from liveusb.releases.antergos import releases, get_flavors
-
 
 def __(text):
     return _(text.format_map(CONFIG))
 
 
+def release_category(data):
+    """ The heading a release is listed under in the release list """
+    if data['source'] in CONFIG['CATEGORIES']['main']:
+        return 'main'
+    elif data['source'] == 'Spins':
+        return _('<b>Fedora Spins </b> &nbsp; Alternative desktops for Fedora')
+    elif data['source'] == 'Labs':
+        return _('<b>Fedora Labs </b> &nbsp; Functional bundles for Fedora')
+    else:
+        return '<b>Other</b>'
+
+
 class ReleaseDownloadThread(QThread):
     """ Heavy lifting in the process the iso file download """
     downloadFinished = pyqtSignal(str)
     downloadError = pyqtSignal(str)
+    progressUpdated = pyqtSignal(float, float, float)
 
     beingCancelled = False
 
@@ -92,17 +104,42 @@ class ReleaseDownloadThread(QThread):
         self.progress = progress
         self.proxies = proxies
         self.filename = filename
+        # grabber reports every chunk, the GUI only gets a few updates a second
+        self.meter = ProgressMeter(self.progressUpdated.emit)
 
     def run(self):
         try:
             self.beingCancelled = False
-            filename = grabber.download(self, self.progress.release.url, update_maximum=self.progress.start, update_current=self.progress.update)
+            url = self.progress.release.url
+            mirrors = grabber.mirror_urls(url, CONFIG['BASE_URL'], CONFIG.get('MIRRORS') or [])
+            live = self.progress.release.live
+            expected = self.progress.release.get_checksums()
+            # hashed from the buffers the download goes through, not read again
+            hasher = hashing.MultiHasher(list(expected) + live.checksum_algorithms())
+            try:
+                filename = grabber.download(self, url, update_maximum=self.start_progress, update_current=self.meter.update,
+                                            segments=CONFIG.get('DOWNLOAD_SEGMENTS', 1), mirrors=mirrors,
+                                            size=int(self.progress.release.size) or None, hasher=hasher)
+            finally:
+                hasher.close()
             if filename:
+                checksums = hasher.hexdigests()
+                for name in sorted(expected):
+                    if checksums[name] != expected[name]:
+                        os.remove(filename)
+                        raise LiveUSBError(_('The downloaded image is corrupted, its %s '
+                                             'is not the one of the release') % name.upper())
+                live.add_known_checksums(filename, checksums)
+                self.meter.flush()
                 self.progress.end()
                 self.downloadFinished.emit(filename)
         except LiveUSBError as e:
             self.downloadError.emit(e.args[0])
 
+    def start_progress(self, size):
+        self.meter.reset(size)
+        self.progress.start(size)
+
     @pyqtSlot()
     def cancelDownload(self):
         self.beingCancelled = True
@@ -120,12 +157,15 @@ class ReleaseDownload(QObject):
     _running = False
     _current = -1.0
     _maximum = -1.0
+    _speed = -1.0
+    _eta = -1.0
     _path = ''
 
     def __init__(self, parent, filename):
         QObject.__init__(self, parent)
         self.release = parent
         self._grabber = ReleaseDownloadThread(self, parent.live.get_proxies(), filename)
+        self._grabber.progressUpdated.connect(self.update, Qt.QueuedConnection)
         self._live = parent.live
 
     def reset(self):
@@ -143,11 +183,16 @@ class ReleaseDownload(QObject):
         self.maximumChanged.emit()
         self.runningChanged.emit()
 
-    def update(self, amount_read):
+    @pyqtSlot(float, float, float)
+    def update(self, amount_read, speed=-1.0, eta=-1.0):
         """ Update our download progressbar.
 
         :read: the number of bytes read so far
+        :speed: the smoothed download speed in bytes per second
+        :eta: the estimated number of seconds left
         """
+        self._speed = speed
+        self._eta = eta
         if self._current < amount_read:
             self._current = amount_read
             self.currentChanged.emit()
@@ -190,6 +235,14 @@ class ReleaseDownload(QObject):
     def progress(self):
         return self._current
 
+    @pyqtProperty(float, notify=currentChanged)
+    def speed(self):
+        return self._speed
+
+    @pyqtProperty(float, notify=currentChanged)
+    def eta(self):
+        return self._eta
+
     @pyqtProperty(bool, notify=runningChanged)
     def running(self):
         return self._running
@@ -208,18 +261,23 @@ class ReleaseDownload(QObject):
 
 class ReleaseWriterThread(QThread):
     """ The actual write to the portable drive """
+    progressUpdated = pyqtSignal(float, float, float)
 
     def __init__(self, parent):
         QThread.__init__(self, parent)
 
         self.live = parent.live
         self.parent = parent
+        # dd reports every block it writes, the GUI only gets a few updates a second
+        self.meter = ProgressMeter(self.report_progress)
 
     def run(self):
         now = datetime.now()
         try:
             self.ddImage(now)
 
+        except WriteCancelled as e:
+            self.live.log.info(e.args[0])
         except Exception as e:
             self.parent.release.addError(e.args[0])
             self.live.log.exception(e)
@@ -228,13 +286,24 @@ class ReleaseWriterThread(QThread):
 
     def ddImage(self, now):
         # TODO move this to the backend
-        self.live.dd_image(self.update_progress)
+        self.meter.reset(self.live.isosize)
+        with self.live.flash_job():
+            self.live.dd_image(self.update_progress)
+            # the checksums start from zero again, with their own speed and ETA
+            self.meter.reset(self.live.isosize)
+            self.live.calculate_checksums(self.update_progress)
         self.parent.status = 'Finished!'
         self.parent.finished = True
         return
 
     def update_progress(self, value):
-        self.parent.progress = value
+        if value != value:  # NaN, the progress is not known yet
+            self.progressUpdated.emit(value, -1.0, -1.0)
+        else:
+            self.meter.update(value * self.live.isosize)
+
+    def report_progress(self, written, speed, eta):
+        self.progressUpdated.emit(written / self.live.isosize if self.live.isosize else 1.0, speed, eta)
 
 class ReleaseWriter(QObject):
     """ Here we can track the progress of the writing and control it """
@@ -245,6 +314,8 @@ class ReleaseWriter(QObject):
 
     _running = False
     _current = -1.0
+    _speed = -1.0
+    _eta = -1.0
     _status = ''
     _finished = False
 
@@ -253,6 +324,7 @@ class ReleaseWriter(QObject):
         self.live = parent.live
         self.release = parent
         self.worker = ReleaseWriterThread(self)
+        self.worker.progressUpdated.connect(self.updateProgress, Qt.QueuedConnection)
 
     def reset(self):
         self._running = False
@@ -267,11 +339,14 @@ class ReleaseWriter(QObject):
         self.runningChanged.emit()
         self.currentChanged.emit()
         self.status = 'Writing'
+        self.live.reset_cancel()
         self.worker.start()
 
     @pyqtSlot()
     def cancel(self):
-        self.worker.terminate()
+        # the worker notices within a block, stops and clears the drive
+        if self.worker.isRunning():
+            self.live.cancel()
         self.reset()
 
     @pyqtProperty(bool, notify=runningChanged)
@@ -294,6 +369,21 @@ class ReleaseWriter(QObject):
             self._current = value
             self.currentChanged.emit()
 
+    @pyqtSlot(float, float, float)
+    def updateProgress(self, value, speed, eta):
+        """ Receives the rate limited progress of the worker thread """
+        self._speed = speed
+        self._eta = eta
+        self.progress = value
+
+    @pyqtProperty(float, notify=currentChanged)
+    def speed(self):
+        return self._speed
+
+    @pyqtProperty(float, notify=currentChanged)
+    def eta(self):
+        return self._eta
+
     @pyqtProperty(str, notify=statusChanged)
     def status(self):
         return self._status
@@ -326,10 +416,12 @@ class Release(QObject):
     statusChanged = pyqtSignal()
     pathChanged = pyqtSignal()
     sizeChanged = pyqtSignal()
+    indexChanged = pyqtSignal()
+    metadataChanged = pyqtSignal()
 
     _path = ''
 
-    _archMap = {'Intel 64bit': ['x86_64'], 'Intel 32bit': ['i686','i386']} #, 'ARM': ['armv7hl']}
+    _archMap = ARCH_MAP
 
     def __init__(self, parent, index, live, data):
         QObject.__init__(self, parent)
@@ -340,7 +432,7 @@ class Release(QObject):
 
         self._size = 0
 
-        self._data = data
+        self._setData(data)
 
         self._info = []
         self._warning = []
@@ -362,6 +454,28 @@ class Release(QObject):
         parent.releaseProxyModel.archChanged.connect(self.sizeChanged)
         parent.releaseProxyModel.archChanged.connect(self.pathChanged)
 
+    def _setData(self, data):
+        self._data = data
+        self._arch = [name for name, abbrs in self._archMap.items()
+                      if any(abbr in data['variants'] for abbr in abbrs)]
+        self._category = release_category(data)
+
+    def update(self, data):
+        """ Take over refreshed metadata, keeping the download and writer state """
+        if data == self._data:
+            return False
+        screenshots = self._data['screenshots']
+        self._setData(data)
+        self.metadataChanged.emit()
+        self.sizeChanged.emit()
+        if data['screenshots'] != screenshots:
+            self.screenshotsChanged.emit()
+        return True
+
+    def setIndex(self, index):
+        if index != self._index:
+            self._index = index
+            self.indexChanged.emit()
 
     @pyqtSlot()
     def get(self):
@@ -381,7 +495,7 @@ class Release(QObject):
 
         self._writer.run()
 
-    @pyqtProperty(int, constant=True)
+    @pyqtProperty(int, notify=indexChanged)
     def index(self):
         return self._index
 
@@ -389,13 +503,14 @@ class Release(QObject):
     def isSeparator(self):
         return self._data['source'] == ''
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def name(self):
         return self._data['name']
 
     def get_filename(self):
-        if '.iso' in self.get_url():
-            return os.path.basename(self.get_url())
+        url = self.get_url()
+        if '.iso' in url or url.lower().endswith(decompress.EXTENSIONS):
+            return os.path.basename(url)
         try:
             return self._data['variants']['x86_64']['filename']
         except KeyError:
@@ -403,7 +518,7 @@ class Release(QObject):
 
         return ''
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def logo(self):
         return self._data['logo']
 
@@ -421,41 +536,29 @@ class Release(QObject):
             self._size = value
             self.sizeChanged.emit()
 
-    @pyqtProperty('QStringList', constant=True)
+    @pyqtProperty('QStringList', notify=metadataChanged)
     def arch(self):
-        ret = list()
-        for key in self._archMap.keys():
-            for variant in self._archMap[key]:
-                if variant in self._data['variants'].keys():
-                    ret.append(str(key))
-        return ret
+        return self._arch
 
     @pyqtProperty(str, constant=True)
     def version(self):
         return self._data['version']
 
-    @pyqtProperty(QDateTime, constant=True)
+    @pyqtProperty(QDateTime, notify=metadataChanged)
     def releaseDate(self):
         return QDateTime.fromString(self._data['releaseDate'], Qt.ISODate)
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def summary(self):
         return self._data['summary']
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def description(self):
         return self._data['description']
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def category(self):
-        if self._data['source'] in CONFIG['CATEGORIES']['main']:
-            return 'main'
-        elif self._data['source'] == 'Spins':
-            return _('<b>Fedora Spins </b> &nbsp; Alternative desktops for Fedora')
-        elif self._data['source'] == 'Labs':
-            return _('<b>Fedora Labs </b> &nbsp; Functional bundles for Fedora')
-        else:
-            return '<b>Other</b>'
+        return self._category
 
     @pyqtProperty(bool, constant=True)
     def isLocal(self):
@@ -465,7 +568,7 @@ class Release(QObject):
     def screenshots(self):
         return self._data['screenshots']
 
-    @pyqtProperty(str, constant=True)
+    @pyqtProperty(str, notify=metadataChanged)
     def url(self):
         return self.get_url()
 
@@ -476,6 +579,17 @@ class Release(QObject):
             if arch in self._archMap[self.liveUSBData.releaseProxyModel.archFilter]:
                 return self._data['variants'][arch]['url']
 
+    def get_checksums(self):
+        """ The checksums of the variant get_url downloads, {algorithm: hex digest} """
+        if self.isLocal:
+            return {}
+        for arch in self._data['variants'].keys():
+            if arch in self._archMap[self.liveUSBData.releaseProxyModel.archFilter]:
+                variant = self._data['variants'][arch]
+                return dict((name, variant[name].lower()) for name in hashing.ALGORITHMS
+                            if variant.get(name))
+        return {}
+
     @pyqtProperty(str, notify=pathChanged)
     def path(self):
         return self._download.path
@@ -571,11 +685,12 @@ class ReleaseListProxy(QSortFilterProxyModel):
     nameFilterChanged = pyqtSignal()
     isFrontChanged = pyqtSignal()
 
-    _archFilter = ['x86_64']
+    _archFilter = 'Intel 64bit'
     _nameFilter = ''
+    _search = ''  # the normalized _nameFilter
     _frontPage = True
 
-    _archMap = {'Intel 64bit': ['x86_64'], 'Intel 32bit': ['i686','i386']} #, 'ARM': ['armv7hl']}
+    _archMap = ARCH_MAP
     _archMapDetailed = {'Intel 64bit': _('ISO format image for Intel, AMD and other compatible PCs (64-bit)'), 'Intel 32bit': _('ISO format image for Intel, AMD and other compatible PCs (32-bit)')} #, 'ARM': ['armv7hl']}
 
     def __init__(self, parent, sourceModel):
@@ -596,12 +711,10 @@ class ReleaseListProxy(QSortFilterProxyModel):
         return self.sourceModel().rowCount(parent)
 
     def filterAcceptsRow(self, sourceRow, sourceParent):
-        row = self.sourceModel().index(sourceRow, 0, sourceParent).data()
-        if len(self._archFilter) == 0 or row.isLocal or self.archFilter in row.arch or row.isSeparator:
-            if not len(self._nameFilter) or not row.isSeparator:
-                if len(self._nameFilter) == 0 or self._nameFilter.lower() in row.name.lower() or self._nameFilter.lower() in row.summary.lower():
-                    return True
-        return False
+        index = self.parent().releaseIndex
+        if sourceRow >= len(index):
+            return False
+        return index.accepts(sourceRow, index.arch_bits.get(self._archFilter, 0), self._search)
 
     @pyqtProperty(str, notify=nameFilterChanged)
     def nameFilter(self):
@@ -611,12 +724,13 @@ class ReleaseListProxy(QSortFilterProxyModel):
     def nameFilter(self, value):
         if value != self._nameFilter:
             self._nameFilter = value
+            self._search = normalize(value)
             self.nameFilterChanged.emit()
             self.invalidateFilter()
 
     @pyqtProperty('QStringList', constant=True)
     def possibleArchs(self):
-        return self._archMap.keys()
+        return list(self._archMap.keys())
 
     @pyqtProperty(str, notify=archChanged)
     def archFilterDetailed(self):
@@ -624,16 +738,12 @@ class ReleaseListProxy(QSortFilterProxyModel):
 
     @pyqtProperty(str, notify=archChanged)
     def archFilter(self):
-        for name, abbrs in self._archMap.items():
-            if abbrs == self._archFilter:
-                return name
-        self._archFilter = self._archMap['Intel 64bit']
-        return 'Intel 64bit'
+        return self._archFilter
 
     @archFilter.setter
     def archFilter(self, value):
-        if value in self._archMap and self.archFilter != self._archMap[value]:
-            self._archFilter = self._archMap[value]
+        if value in self._archMap and self._archFilter != value:
+            self._archFilter = value
             self.archChanged.emit()
             self.invalidateFilter()
 
@@ -722,20 +832,23 @@ class LiveUSBData(QObject):
     _currentIndex = 0
     _currentDrive = 0
 
-    releaseData = []
-
     def __init__(self, opts):
         QObject.__init__(self)
-        self.live = LiveUSBCreator(opts=opts)
+        with profiling.span('LiveUSBCreator'):
+            self.live = LiveUSBCreator(opts=opts)
+        self.releaseData = []
         self._releaseModel = ReleaseListModel(self)
         self._releaseProxy = ReleaseListProxy(self, self._releaseModel)
+        self.releaseIndex = ReleaseIndex([])
 
-        self.fillReleases()
+        with profiling.span('fillReleases'):
+            self.fillReleases()
         self.updateThread = DataUpdateThread(self)
 
         self._usbDrives = []
 
-        self.live.detect_removable_drives(callback=self.USBDeviceCallback)
+        with profiling.span('detect_removable_drives'):
+            self.live.detect_removable_drives(callback=self.USBDeviceCallback)
 
         self.updateThread.finished.connect(self.fillReleases)
         self.updateThread.finished.connect(self.updateThreadStopped)
@@ -744,21 +857,57 @@ class LiveUSBData(QObject):
 
     @pyqtSlot()
     def fillReleases(self):
-        if self.releaseData and self.releaseData[self.currentIndex]:
-            if self.releaseData[self.currentIndex].download.running or self.releaseData[self.currentIndex].writer.running:
-                return
-
-        self.releaseModel.beginResetModel()
-
-        for release in releases:
-            self.releaseData.append(Release(self,
-                                            len(self.releaseData),
-                                            self.live,
-                                            release
-                                            ))
+        """ Bring the release list in line with the known releases.
 
-        self.releaseModel.endResetModel()
-        self.releaseProxyModel.invalidate()
+        Releases are matched by their source, name and version.  Rows only
+        change where the releases did, and a release that is still listed
+        keeps its Release object, including any download or write in progress.
+        """
+        current = self.currentImage
+        releases = [dict(release) for release in get_releases()]
+        # a release that is being downloaded or written stays until it's done
+        busy = set(r for r in self.releaseData if r.download.running or r.writer.running)
+        newKeys = release_keys(releases)
+        for release, key in zip(self.releaseData, release_keys([r._data for r in self.releaseData])):
+            if release in busy and key not in newKeys:
+                releases.append(release._data)
+                newKeys.append(key)
+
+        model = self.releaseModel
+        for op, row, arg in diff(release_keys([r._data for r in self.releaseData]), newKeys):
+            if op == 'remove':
+                model.beginRemoveRows(QModelIndex(), row, arg)
+                removed = self.releaseData[row:arg + 1]
+                del self.releaseData[row:arg + 1]
+                self.releaseIndex.remove(row, arg)
+                model.endRemoveRows()
+                for release in removed:
+                    release.deleteLater()
+                continue
+            if op == 'insert':
+                model.beginInsertRows(QModelIndex(), row, row)
+                self.releaseData.insert(row, Release(self, row, self.live, releases[row]))
+                self.releaseIndex.insert(row, releases[row])
+                model.endInsertRows()
+                continue
+            if op == 'move':
+                source, row = row, arg
+                model.beginMoveRows(QModelIndex(), source, source, QModelIndex(), row)
+                self.releaseData.insert(row, self.releaseData.pop(source))
+                self.releaseIndex.move(source, row)
+                model.endMoveRows()
+            if self.releaseData[row].update(releases[row]):
+                self.releaseIndex.update(row, releases[row])
+                model.dataChanged.emit(model.index(row), model.index(row))
+
+        for row, release in enumerate(self.releaseData):
+            release.setIndex(row)
+
+        if current in self.releaseData:
+            self._currentIndex = self.releaseData.index(current)
+        else:
+            self._currentIndex = 0
+        self.releaseProxyModel.invalidateFilter()
         self.currentImageChanged.emit()
 
     def USBDeviceCallback(self):
@@ -810,7 +959,7 @@ class LiveUSBData(QObject):
 
     @pyqtProperty(QVariant, notify=configChanged)
     def config(self):
-        return QVariant(self._config)
+        return QVariant(dict(self._config))
 
     @pyqtProperty(ReleaseListModel, notify=releasesChanged)
     def releaseModel(self):
@@ -872,27 +1021,47 @@ class LiveUSBData(QObject):
 
 class LiveUSBApp(QApplication):
     """ Main application class """
+    _firstFrame = None  # the startup profiling span that ends at the first frame
+
     def __init__(self, opts, args):
-        QApplication.__init__(self, args)
-        translator = QTranslator()
-        translator.load(QLocale.system().name(), "po")
-        self.installTranslator(translator)
-        qmlRegisterUncreatableType(ReleaseDownload, 'LiveUSB', 1, 0, 'Download', 'Not creatable directly, use the liveUSBData instance instead')
-        qmlRegisterUncreatableType(ReleaseWriter, 'LiveUSB', 1, 0, 'Writer', 'Not creatable directly, use the liveUSBData instance instead')
-        qmlRegisterUncreatableType(ReleaseListModel, 'LiveUSB', 1, 0, 'ReleaseModel', 'Not creatable directly, use the liveUSBData instance instead')
-        qmlRegisterUncreatableType(Release, 'LiveUSB', 1, 0, 'Release', 'Not creatable directly, use the liveUSBData instance instead')
-        qmlRegisterUncreatableType(USBDrive, 'LiveUSB', 1, 0, 'Drive', 'Not creatable directly, use the liveUSBData instance instead')
-        qmlRegisterUncreatableType(LiveUSBData, 'LiveUSB', 1, 0, 'Data', 'Use the liveUSBData root instance')
+        with profiling.span('QApplication'):
+            QApplication.__init__(self, args)
+        with profiling.span('translations'):
+            translator = QTranslator()
+            translator.load(QLocale.system().name(), "po")
+            self.installTranslator(translator)
+        with profiling.span('QML type registration'):
+            qmlRegisterUncreatableType(ReleaseDownload, 'LiveUSB', 1, 0, 'Download', 'Not creatable directly, use the liveUSBData instance instead')
+            qmlRegisterUncreatableType(ReleaseWriter, 'LiveUSB', 1, 0, 'Writer', 'Not creatable directly, use the liveUSBData instance instead')
+            qmlRegisterUncreatableType(ReleaseListModel, 'LiveUSB', 1, 0, 'ReleaseModel', 'Not creatable directly, use the liveUSBData instance instead')
+            qmlRegisterUncreatableType(Release, 'LiveUSB', 1, 0, 'Release', 'Not creatable directly, use the liveUSBData instance instead')
+            qmlRegisterUncreatableType(USBDrive, 'LiveUSB', 1, 0, 'Drive', 'Not creatable directly, use the liveUSBData instance instead')
+            qmlRegisterUncreatableType(LiveUSBData, 'LiveUSB', 1, 0, 'Data', 'Use the liveUSBData root instance')
 
         # releases = get_flavors()
 
         engine = QQmlApplicationEngine()
-        self.data = LiveUSBData(opts)
+        with profiling.span('LiveUSBData'):
+            self.data = LiveUSBData(opts)
         engine.rootContext().setContextProperty('liveUSBData', self.data)
-        if (opts.directqml):
-            engine.load(QUrl('liveusb/liveusb.qml'))
-        else:
-            engine.load(QUrl('qrc:/liveusb.qml'))
-        engine.rootObjects()[0].show()
+        with profiling.span('QML load'):
+            if (opts.directqml):
+                engine.load(QUrl('liveusb/liveusb.qml'))
+            else:
+                engine.load(QUrl('qrc:/liveusb.qml'))
+        window = engine.rootObjects()[0]
+        if profiling.profiler:
+            self._firstFrame = profiling.profiler.begin('first frame')
+            window.frameSwapped.connect(self.firstFrameSwapped)
+        with profiling.span('show'):
+            window.show()
 
         self.exec_()
+
+    @pyqtSlot()
+    def firstFrameSwapped(self):
+        """ Finish the startup profile once the window has been drawn """
+        if self._firstFrame:
+            profiling.profiler.end(self._firstFrame)
+            self._firstFrame = None
+            profiling.profiler.report()
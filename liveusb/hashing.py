@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Several checksums of the same data, computed in a single read.
+
+Each algorithm hashes on a thread of its own.  hashlib releases the GIL
+while it hashes a buffer, so with several algorithms they run in parallel
+on the same, shared blocks instead of one after the other.
+"""
+
+import hashlib
+import queue
+import threading
+
+from liveusb import _, LiveUSBError
+from liveusb.reader import BlockReader
+
+ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512', 'blake2b')
+BLOCK_SIZE = 1024 ** 2
+
+
+def algorithms(names):
+    """ Parse a comma separated list of algorithms, like the --hash option """
+    if isinstance(names, str):
+        names = names.split(',')
+    result = []
+    for name in names:
+        name = name.strip().lower()
+        if not name or name in result:
+            continue
+        if name not in ALGORITHMS:
+            raise LiveUSBError(_('Unknown checksum algorithm %s, use one of %s')
+                               % (name, ', '.join(ALGORITHMS)))
+        result.append(name)
+    return result
+
+
+class MultiHasher(object):
+    """ Feeds the same data to several hash algorithms.
+
+    With a single algorithm the data is hashed right away; with more, each
+    one gets a thread, and update() returns once the threads are done with
+    the previous block.  So a block must be left alone until the next call
+    to update(), which is what a BlockReader with two buffers gives us.
+    """
+
+    def __init__(self, names):
+        self.names = algorithms(names)
+        self._hashes = dict((name, hashlib.new(name)) for name in self.names)
+        self._queues = []
+        self._threads = []
+        self._error = None
+        if len(self.names) > 1:
+            for name in self.names:
+                blocks = queue.Queue(1)
+                thread = threading.Thread(target=self._hash, args=(self._hashes[name], blocks),
+                                          name='hash-%s' % name)
+                thread.daemon = True
+                thread.start()
+                self._queues.append(blocks)
+                self._threads.append(thread)
+
+    def _hash(self, digest, blocks):
+        while True:
+            block = blocks.get()
+            try:
+                if block is None:
+                    return
+                digest.update(block)
+            except Exception as e:
+                self._error = e
+            finally:
+                blocks.task_done()
+
+    def update(self, block):
+        if not self._queues:
+            for digest in self._hashes.values():
+                digest.update(block)
+            return
+        for blocks in self._queues:
+            blocks.join()
+        for blocks in self._queues:
+            blocks.put(block)
+
+    def close(self):
+        """ Wait for the threads to hash what they have been given """
+        for blocks in self._queues:
+            blocks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._queues = []
+        self._threads = []
+
+    def hexdigests(self):
+        """ Return {algorithm: hex digest} of everything given so far """
+        self.close()
+        if self._error:
+            raise self._error
+        return dict((name, self._hashes[name].hexdigest()) for name in self.names)
+
+
+def hash_file(path, names, update_function=None, limit=None, block_size=BLOCK_SIZE):
+    """ Return {algorithm: hex digest} of a file, or of its first limit bytes
+
+    @param update_function: Called with the number of bytes read so far.
+    """
+    hasher = MultiHasher(names)
+    try:
+        with BlockReader(path, block_size, limit) as source:
+            for block in source:
+                hasher.update(block)
+                if update_function:
+                    update_function(source.position)
+    finally:
+        hasher.close()
+    return hasher.hexdigests()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+The implanted ISO MD5 check, as done by checkisomd5 from isomd5sum.
+
+implantisomd5 stores an MD5 of the image in the application use area of
+the primary volume descriptor.  The sum covers the image up to its last
+SKIPSECTORS sectors, with the application use area itself blanked out, and
+comes with FRAGMENT SUMS: a few characters of the sum of each of the first
+FRAGMENT COUNT fragments, so that a corrupt image is caught early.
+
+The check is a consumer of the blocks of the image, so it can ride along
+with the write instead of reading the image a second time.  The blocks are
+cut into the same chunks checkisomd5 reads, 32 KiB or a fragment if that is
+smaller, since the fragment sums depend on where it looks at them.
+"""
+
+import hashlib
+import re
+import struct
+
+from liveusb import _, LiveUSBError
+from liveusb.decompress import open_image, read_blocks, read_full
+
+SECTOR_SIZE = 2048
+PVD_SECTOR = 16
+MAX_DESCRIPTORS = 16  # how far to look for the primary volume descriptor
+APPDATA_OFFSET = 883
+APPDATA_SIZE = 512
+CHUNK_SIZE = 16 * SECTOR_SIZE
+FRAGMENT_SUM_SIZE = 60
+
+
+class ImplantedMD5Error(LiveUSBError):
+    """ Raised when an image does not match its implanted MD5 """
+
+
+class ImplantedMD5(object):
+    """ The implanted MD5 of an image, read from its volume descriptor """
+
+    def __init__(self, mediasum, isosize, pvd_offset, skipsectors=0,
+                 fragmentsums='', fragmentcount=0):
+        self.mediasum = mediasum
+        self.isosize = isosize
+        self.pvd_offset = pvd_offset
+        self.skipsectors = skipsectors
+        self.fragmentsums = fragmentsums
+        self.fragmentcount = fragmentcount
+
+    @classmethod
+    def parse(cls, head):
+        """ Parse the start of an image, returning None if it has no implanted MD5 """
+        for sector in range(PVD_SECTOR, PVD_SECTOR + MAX_DESCRIPTORS):
+            offset = sector * SECTOR_SIZE
+            descriptor = head[offset:offset + SECTOR_SIZE]
+            if len(descriptor) < SECTOR_SIZE or descriptor[1:6] != b'CD001':
+                return None
+            if descriptor[0] == 1:
+                break
+            if descriptor[0] == 255:  # the set terminator
+                return None
+        else:
+            return None
+        appdata = descriptor[APPDATA_OFFSET:APPDATA_OFFSET + APPDATA_SIZE].decode('ascii', 'replace')
+        fields = dict(re.findall(r'([A-Z0-9 ]+?) = ([^;]*);', appdata))
+        mediasum = fields.get('ISO MD5SUM', '')
+        if not re.match('^[0-9a-f]{32}$', mediasum):
+            return None
+        try:
+            skipsectors = int(fields.get('SKIPSECTORS', 0))
+            fragmentcount = int(fields.get('FRAGMENT COUNT', 0))
+        except ValueError:
+            return None
+        isosize = struct.unpack('>I', descriptor[84:88])[0] * SECTOR_SIZE
+        return cls(mediasum, isosize, offset, skipsectors,
+                   fields.get('FRAGMENT SUMS', ''), fragmentcount)
+
+    @classmethod
+    def from_file(cls, path):
+        with open_image(path) as image:
+            return cls.parse(read_full(image, (PVD_SECTOR + MAX_DESCRIPTORS) * SECTOR_SIZE))
+
+
+class MD5Checker(object):
+    """ Checks the blocks of an image, given in order, against its implanted MD5
+
+    update() raises ImplantedMD5Error as soon as a fragment sum does not
+    match, and close() if the whole sum does not.
+    """
+
+    def __init__(self, implanted):
+        self.implanted = implanted
+        self.total_size = implanted.isosize - implanted.skipsectors * SECTOR_SIZE
+        self.fragment_size = self.total_size // (implanted.fragmentcount + 1)
+        # libcheckisomd5 never reads more than a fragment at once
+        self.chunk_size = min(CHUNK_SIZE, self.fragment_size) or CHUNK_SIZE
+        self.offset = 0
+        self._md5 = hashlib.md5()
+        self._pending = b''
+        self._fragment = 0
+
+    def update(self, block):
+        if self._pending:
+            block = self._pending + bytes(block)
+            self._pending = b''
+        view = memoryview(block)
+        while len(view) >= self.chunk_size and self.offset < self.total_size:
+            self._check(view[:self.chunk_size])
+            view = view[self.chunk_size:]
+        if self.offset < self.total_size:
+            self._pending = bytes(view)
+
+    def _check(self, chunk):
+        chunk = chunk[:self.total_size - self.offset]
+        appdata = self.implanted.pvd_offset + APPDATA_OFFSET - self.offset
+        if -APPDATA_SIZE <= appdata <= len(chunk):
+            chunk = bytearray(chunk)
+            start = max(appdata, 0)
+            end = min(len(chunk), appdata + APPDATA_SIZE)
+            chunk[start:end] = b' ' * (end - start)
+        self._md5.update(chunk)
+        if self.implanted.fragmentcount and self.fragment_size:
+            fragment = self.offset // self.fragment_size
+            if fragment != self._fragment:
+                self._check_fragment(fragment)
+                self._fragment = fragment
+        self.offset += len(chunk)
+
+    def _check_fragment(self, fragment):
+        length = FRAGMENT_SUM_SIZE // self.implanted.fragmentcount
+        digest = bytearray(self._md5.copy().digest())
+        # checkisomd5 keeps the first hex digit of each byte
+        found = ''.join(('%x' % byte)[0] for byte in digest[:length])
+        start = (fragment - 1) * length
+        if found != self.implanted.fragmentsums[start:start + len(found)]:
+            raise ImplantedMD5Error(_('The image is corrupt: the checksum of '
+                                      'fragment %d does not match') % fragment)
+
+    def close(self):
+        """ Check the whole sum, once every block has been given """
+        if self._pending:
+            self._check(memoryview(self._pending))
+            self._pending = b''
+        if self.offset < self.total_size:
+            raise ImplantedMD5Error(_('The image is truncated: it ends at %d bytes '
+                                      'instead of %d') % (self.offset, self.total_size))
+        if self._md5.hexdigest() != self.implanted.mediasum:
+            raise ImplantedMD5Error(_('The image is corrupt: its MD5 does not '
+                                      'match the implanted one'))
+
+
+def checker(path):
+    """ Return an MD5Checker for an image, or None if it has no implanted MD5 """
+    implanted = ImplantedMD5.from_file(path)
+    return MD5Checker(implanted) if implanted else None
+
+
+def check_file(path, update_function=None):
+    """ Check an image, returning None if it has no implanted MD5
+
+    @param update_function: Called with the fraction checked so far.
+    """
+    md5 = checker(path)
+    if md5 is None:
+        return None
+    with read_blocks(path, limit=md5.total_size) as image:
+        for block in image:
+            md5.update(block)
+            if update_function:
+                update_function(float(md5.offset) / md5.total_size)
+    md5.close()
+    return True
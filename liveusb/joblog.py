@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Operation logs for the LiveUSBCreator.
+
+Everything the creators log ends up in a size-rotated application log.  Each
+flash additionally gets its own small log file, so the output of one job is written exactly once and
+the amount of log I/O does not depend on how long the application has been
+running.
+"""
+
+import glob
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+
+LOG_FORMAT = "%(asctime)s [%(module)s:%(lineno)s] %(message)s"
+MAX_LOG_BYTES = 1024 ** 2  # rotate the log files once they reach this size
+LOG_BACKUPS = 3  # rotated copies of the application log to keep
+MAX_JOB_LOGS = 20  # per-job log files to keep
+
+
+def log_dir():
+    """ Return the directory the logs are written to """
+    return os.getenv('TEMP', '/tmp')
+
+
+class JobFilter(logging.Filter):
+    """ Only lets through the records that were logged for a given job """
+
+    def __init__(self, job_id):
+        logging.Filter.__init__(self)
+        self.job_id = job_id
+
+    def filter(self, record):
+        return getattr(record, 'job', None) == self.job_id
+
+
+class JobLog(object):
+    """ The log file of a single flash job.
+
+    Records are routed to the job by the 'job' attribute that the creator's
+    LoggerAdapter puts on them, so concurrent jobs in the same process each
+    get only their own output.
+    """
+
+    def __init__(self, device, iso, directory=None):
+        self.id = '%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8])
+        self.device = device
+        self.iso = iso
+        self.directory = directory or os.path.join(log_dir(), 'liveusb-creator-jobs')
+        self.path = os.path.join(self.directory, '%s.log' % self.id)
+        self.started = None
+        self.finished = None
+        self.error = None
+        self._handler = None
+        self._logger = None
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def start(self, logger):
+        """ Start writing the records of this job to its log file """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        prune_job_logs(self.directory, MAX_JOB_LOGS - 1)
+        self._handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=MAX_LOG_BYTES, backupCount=1)
+        self._handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self._handler.addFilter(JobFilter(self.id))
+        self._logger = logger
+        self._logger.addHandler(self._handler)
+        self.started = time.time()
+        self._write('job %s: writing %s to %s' % (self.id, self.iso, self.device))
+
+    def finish(self, error=None):
+        """ Record the outcome and timings of the job and close its log """
+        self.finished = time.time()
+        self.error = error
+        if error:
+            self._write('job %s: failed after %.1fs: %s' % (self.id, self.duration, error))
+        else:
+            self._write('job %s: finished in %.1fs' % (self.id, self.duration))
+        if self._handler:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+
+    def _write(self, message):
+        if not self._handler:
+            return
+        record = logging.LogRecord(__name__, logging.INFO, __file__, 0,
+                                   message, None, None)
+        record.job = self.id
+        self._handler.handle(record)
+
+
+def prune_job_logs(directory, keep=MAX_JOB_LOGS):
+    """ Remove all but the newest `keep` job logs in the given directory """
+    logs = sorted(glob.glob(os.path.join(directory, '*.log')),
+                  key=os.path.getmtime, reverse=True)
+    for path in logs[keep:]:
+        for filename in glob.glob(path + '*'):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+_setup_lock = threading.Lock()
+
+
+def setup_logger(logger, level):
+    """ Install the console and application log handlers.
+
+    The handlers are only installed once per logger; calling this again
+    just adjusts the console verbosity.
+    """
+    with _setup_lock:
+        logger.setLevel(logging.DEBUG)
+        console = getattr(logger, '_liveusb_console', None)
+        if console is None:
+            console = logging.StreamHandler()
+            console.setFormatter(logging.Formatter("[%(module)s:%(lineno)s] %(message)s"))
+            logger.addHandler(console)
+            try:
+                applog = logging.handlers.RotatingFileHandler(
+                    app_log_path(), maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUPS)
+            except (IOError, OSError):
+                applog = None
+            else:
+                applog.setFormatter(logging.Formatter(LOG_FORMAT))
+                logger.addHandler(applog)
+            logger._liveusb_console = console
+            logger._liveusb_applog = applog
+        console.setLevel(level)
+    return logger
+
+
+def app_log_path():
+    return os.path.join(log_dir(), 'liveusb-creator.log')
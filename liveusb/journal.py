@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Write journals, which let an interrupted write pick up where it stopped.
+
+While writing, the ImageWriter records the last offset it has synced to
+the drive.  The journal is keyed by the serial number of the drive and a
+fingerprint of the image, so it only ever applies to the same image on
+the same stick.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+JOURNAL_DIR = os.getenv('LIVEUSB_CREATOR_JOURNAL',
+                        '/var/lib/liveusb-creator/journal')
+FINGERPRINT_SAMPLE = 1024 ** 2
+
+
+def image_fingerprint(path):
+    """ Identify an image by its size and a sample of its beginning and end.
+
+    This is not a checksum of the whole image: reading all of it would cost
+    about as much as the write a resume is meant to save.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode('ascii'))
+    with open(path, 'rb') as image:
+        digest.update(image.read(FINGERPRINT_SAMPLE))
+        image.seek(max(size - FINGERPRINT_SAMPLE, 0))
+        digest.update(image.read(FINGERPRINT_SAMPLE))
+    return digest.hexdigest()
+
+
+class WriteJournal(object):
+    """ The checkpoint of the write of one image to one drive.
+
+    @param serial: The serial number of the drive.
+    @param fingerprint: The image_fingerprint of the image.
+    """
+
+    def __init__(self, serial, fingerprint, directory=None):
+        self.serial = serial
+        self.fingerprint = fingerprint
+        self.directory = directory or JOURNAL_DIR
+        key = hashlib.sha1(('%s\0%s' % (serial, fingerprint)).encode('utf-8')).hexdigest()
+        self.path = os.path.join(self.directory, '%s.json' % key[:20])
+
+    @classmethod
+    def for_write(cls, serial, image, directory=None):
+        """ Return the journal of a write, or None if the drive has no serial """
+        if not serial:
+            return None
+        return cls(serial, image_fingerprint(image), directory)
+
+    def load(self):
+        """ Return the checkpoint as (offset, chunk), or None if there is none """
+        try:
+            with open(self.path) as journal:
+                record = json.load(journal)
+        except (IOError, OSError, ValueError):
+            return None
+        if record.get('serial') != self.serial or record.get('image') != self.fingerprint:
+            return None
+        return int(record['offset']), int(record['chunk'])
+
+    def checkpoint(self, offset, chunk):
+        """ Durably record that everything up to offset is on the drive """
+        record = {
+            'serial': self.serial,
+            'image': self.fingerprint,
+            'offset': offset,
+            'chunk': chunk,
+            'updated': time.time(),
+        }
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w') as journal:
+                json.dump(record, journal)
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.rename(temporary, self.path)
+        except (IOError, OSError):
+            pass  # a resume is a bonus, never a reason to fail the write
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
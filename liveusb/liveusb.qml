@@ -42,7 +42,7 @@ ApplicationWindow {
             right: parent.right
             top: parent.top
         }
-        onAccepted: restoreDialog.visible = true
+        onAccepted: restoreDialog.open()
         Connections {
             target: liveUSBData
             onDriveToRestoreChanged: deviceNotification.open = liveUSBData.driveToRestore
@@ -82,9 +82,15 @@ ApplicationWindow {
                 id: contentComponent
                 width: contentList.width
                 height: contentList.height
+                // only the front page is needed for the first frame, the
+                // other pages are created when they are first shown
+                property bool needed: index <= contentList.currentIndex
+                onNeededChanged: if (needed) contentLoader.active = true
                 Loader {
                     id: contentLoader
                     source: contentList.model[index]
+                    active: contentComponent.needed
+                    asynchronous: index > 0
                     anchors.fill: parent
                 }
                 Connections {
@@ -99,8 +105,9 @@ ApplicationWindow {
         }
     }
 
-    RestoreDialog {
+    DialogLoader {
         id: restoreDialog
+        sourceComponent: RestoreDialog { }
     }
 }
 
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Throughput and failure metrics in the Prometheus text format.
+
+The writes, verifications, downloads and release list refreshes always
+update the metrics below, which is just a few additions.  They are only
+exported when asked to with --metrics-port, which serves them over HTTP on
+localhost, or with --metrics-file, which keeps a file up to date for the
+node_exporter textfile collector.
+"""
+
+import atexit
+import errno
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+SPEED_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)  # MB/s
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values = {}  # {label values: value}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            for key in sorted(self._values):
+                lines.extend(self._samples(key, self._values[key]))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, key), _number(value))]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        Metric.__init__(self, name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        values = self._values.get(self._key(labels))
+        return values[0][-1] if values else 0
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        for bound, count in zip(self.buckets, counts):
+            lines.append('%s_bucket%s %d' % (
+                self.name, _labels(self.labelnames, key, [('le', _number(bound))]), count))
+        lines.append('%s_sum%s %s' % (self.name, _labels(self.labelnames, key), _number(total)))
+        lines.append('%s_count%s %d' % (self.name, _labels(self.labelnames, key), counts[-1]))
+        return lines
+
+
+BYTES_WRITTEN = Counter('liveusb_written_bytes_total', 'Bytes written to drives.', ['device'])
+BYTES_VERIFIED = Counter('liveusb_verified_bytes_total', 'Bytes read back from drives and compared.', ['device'])
+WRITE_SPEED = Histogram('liveusb_write_speed_megabytes_per_second', 'Average speed of the writes.',
+                        SPEED_BUCKETS)
+VERIFY_SPEED = Histogram('liveusb_verify_speed_megabytes_per_second', 'Average speed of the verifications.',
+                         SPEED_BUCKETS)
+DURATION = Histogram('liveusb_operation_duration_seconds', 'How long the successful operations took.',
+                     DURATION_BUCKETS, ['operation'])
+DOWNLOAD_BYTES = Counter('liveusb_downloaded_bytes_total', 'Bytes downloaded, by mirror.', ['mirror'])
+DOWNLOAD_SPEED = Histogram('liveusb_download_speed_megabytes_per_second', 'Average speed of the downloads.',
+                           SPEED_BUCKETS, ['mirror'])
+REFRESH_LATENCY = Histogram('liveusb_release_refresh_seconds', 'How long fetching the release list took.',
+                            LATENCY_BUCKETS)
+FAILURES = Counter('liveusb_failures_total', 'Failed operations, by operation and type of error.',
+                   ['operation', 'error'])
+
+METRICS = [BYTES_WRITTEN, BYTES_VERIFIED, WRITE_SPEED, VERIFY_SPEED, DURATION,
+           DOWNLOAD_BYTES, DOWNLOAD_SPEED, REFRESH_LATENCY, FAILURES]
+
+
+def render():
+    """ Return all metrics in the Prometheus text exposition format """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def error_type(error):
+    """ A short, low-cardinality name for an exception """
+    if isinstance(error, (IOError, OSError)) and error.errno in errno.errorcode:
+        return errno.errorcode[error.errno]
+    return type(error).__name__
+
+
+class Timer(object):
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.duration = None
+
+
+@contextmanager
+def timed(operation):
+    """ Time an operation, counting it as a failure if it raises """
+    timer = Timer()
+    try:
+        yield timer
+    except Exception as e:
+        FAILURES.inc(operation=operation, error=error_type(e))
+        raise
+    timer.duration = time.monotonic() - timer.started
+
+
+def measured(operation, record, counter):
+    """ Decorate a creator method that writes or reads back its image.
+
+    Whether it succeeds or not, record is then called with the device, the
+    bytes the method left in the creator's counter attribute, and the
+    duration, which is None unless it succeeded.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            device = self.drive.device  # the drive may be gone by the end
+            setattr(self, counter, 0)
+            timer = None
+            try:
+                with timed(operation) as timer:
+                    return method(self, *args, **kwargs)
+            finally:
+                record(device, getattr(self, counter), timer.duration if timer else None)
+        return wrapper
+    return decorator
+
+
+def _megabytes_per_second(size, duration):
+    return size / 1024.0 ** 2 / duration if duration > 0 else 0.0
+
+
+def record_write(device, size, duration=None):
+    """ Count written bytes; the speed only of writes that completed """
+    BYTES_WRITTEN.inc(size, device=device)
+    if duration is not None:
+        WRITE_SPEED.observe(_megabytes_per_second(size, duration))
+        DURATION.observe(duration, operation='write')
+
+
+def record_verify(device, size, duration=None):
+    """ Count verified bytes; the speed only of read-backs that completed """
+    BYTES_VERIFIED.inc(size, device=device)
+    if duration is not None:
+        VERIFY_SPEED.observe(_megabytes_per_second(size, duration))
+        DURATION.observe(duration, operation='verify')
+
+
+def record_download(mirror, size, duration=None):
+    """ Count downloaded bytes; the duration is only known for complete downloads """
+    DOWNLOAD_BYTES.inc(size, mirror=mirror)
+    if size and duration is not None:
+        DOWNLOAD_SPEED.observe(_megabytes_per_second(size, duration), mirror=mirror)
+        DURATION.observe(duration, operation='download')
+
+
+def record_refresh(duration):
+    REFRESH_LATENCY.observe(duration)
+
+
+def write_textfile(path):
+    """ Atomically replace a textfile collector file with the current metrics """
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary, 'w') as out:
+        out.write(render())
+    os.rename(temporary, path)
+
+
+def serve(port, address='127.0.0.1'):
+    """ Serve the metrics over HTTP from a background thread """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def start(port=None, textfile=None, interval=15):
+    """ Start the exporters asked for on the command line """
+    if port:
+        serve(port)
+    if textfile:
+        atexit.register(write_textfile, textfile)
+
+        def update():
+            while True:
+                try:
+                    write_textfile(textfile)
+                except (IOError, OSError):
+                    pass
+                time.sleep(interval)
+        thread = threading.Thread(target=update, name='metrics-textfile')
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Subprocess handling for the LiveUSBCreator.
+
+Every creator owns its own ProcessRunner.  Commands are given as argv lists,
+their stdout and stderr are streamed line by line to the logger, and only the
+last few hundred lines of each are kept around for error reports.
+"""
+
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from liveusb import _, LiveUSBError
+
+
+class ProcessResult(object):
+    """ The outcome of a finished subprocess """
+
+    def __init__(self, argv, returncode, stdout, stderr, duration):
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout  # the last lines of stdout, as a list
+        self.stderr = stderr  # the last lines of stderr, as a list
+        self.duration = duration
+
+    @property
+    def command(self):
+        return format_command(self.argv)
+
+    @property
+    def output(self):
+        """ The captured tail of both streams, as a single string """
+        return '\n'.join(self.stdout + self.stderr)
+
+
+def format_command(argv):
+    """ Return a shell-like representation of an argv list for logging """
+    return ' '.join(shlex.quote(str(arg)) for arg in argv)
+
+
+class ProcessRunner(object):
+    """ Runs subprocesses and keeps track of the ones that are still alive.
+
+    @param log: The logger that receives the streamed output.
+    @param max_lines: How many lines of output to keep per stream, and in
+                      the runner-wide history.
+    """
+
+    def __init__(self, log, max_lines=500):
+        self.log = log
+        self.max_lines = max_lines
+        self.history = deque(maxlen=max_lines)
+        self._children = {}  # {pid: subprocess.Popen}
+        self._lock = threading.Lock()
+
+    @property
+    def pids(self):
+        """ The pids of the children that are currently running """
+        with self._lock:
+            return list(self._children)
+
+    def run(self, argv, passive=False, timeout=None, line_callback=None,
+            **kwargs):
+        """ Run a command to completion, streaming its output.
+
+        @param argv: The command to execute, as a list of arguments.
+        @param passive: Do not raise a LiveUSBError if the command fails.
+        @param timeout: Seconds after which the command is killed.
+        @param line_callback: Called with every line the command prints.
+        @param kwargs: Extra arguments to pass to subprocess.Popen
+        @return: A ProcessResult
+        """
+        if isinstance(argv, str):
+            argv = shlex.split(argv)
+        argv = [str(arg) for arg in argv]
+        command = format_command(argv)
+        self.log.debug(command)
+        self.history.append('$ ' + command)
+
+        start = time.time()
+        try:
+            proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True,
+                                    encoding='utf-8', errors='replace',
+                                    **kwargs)
+        except OSError as e:
+            raise LiveUSBError(_("Unable to execute %r: %s") % (command, e))
+
+        with self._lock:
+            self._children[proc.pid] = proc
+
+        stdout = deque(maxlen=self.max_lines)
+        stderr = deque(maxlen=self.max_lines)
+        readers = [self._pump(proc.stdout, stdout, argv[0], line_callback),
+                   self._pump(proc.stderr, stderr, argv[0], line_callback)]
+
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.log.warning(_("Killing %r after %d seconds") % (command, timeout))
+            proc.kill()
+            proc.wait()
+            raise LiveUSBError(_("The following command timed out: %r") % command)
+        finally:
+            for reader in readers:
+                reader.join()
+            self._forget(proc)
+
+        result = ProcessResult(argv, proc.returncode, list(stdout),
+                               list(stderr), time.time() - start)
+        if result.returncode and not passive:
+            raise LiveUSBError(_("There was a problem executing the "
+                                 "following command: %r\n%r") %
+                               (command, '\n'.join(result.stderr)))
+        return result
+
+    def terminate(self, sig=signal.SIGTERM):
+        """ Send a signal to every child that is still running """
+        with self._lock:
+            children = list(self._children.values())
+        for proc in children:
+            if proc.poll() is not None:
+                continue
+            try:
+                os.kill(proc.pid, sig)
+                self.log.debug("Killed process %d" % proc.pid)
+            except OSError as e:
+                self.log.debug(repr(e))
+
+    def _forget(self, proc):
+        with self._lock:
+            self._children.pop(proc.pid, None)
+
+    def _pump(self, stream, lines, name, line_callback):
+        """ Read a stream line by line in a background thread """
+        def pump():
+            for line in stream:
+                line = line.rstrip('\r\n')
+                if not line:
+                    continue
+                lines.append(line)
+                self.history.append(line)
+                self.log.debug('%s: %s' % (name, line))
+                if line_callback:
+                    line_callback(line)
+            stream.close()
+        reader = threading.Thread(target=pump)
+        reader.daemon = True
+        reader.start()
+        return reader
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Startup profiling, enabled with --profile-startup.
+
+The startup code wraps its phases in span(), which does nothing unless a
+StartupProfiler has been started.  The profiler also times every module
+import, and at the end writes a Chrome trace-event JSON file (viewable in
+chrome://tracing or Perfetto) and prints a summary table.
+"""
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+profiler = None  # the active StartupProfiler, if any
+
+
+@contextmanager
+def span(name, category='phase'):
+    """ Time the enclosed block if startup profiling is enabled """
+    if profiler is None:
+        yield
+    else:
+        with profiler.span(name, category):
+            yield
+
+
+def start(version=''):
+    """ Start profiling, including module imports, and return the profiler """
+    global profiler
+    profiler = StartupProfiler(version)
+    profiler.install_import_hook()
+    return profiler
+
+
+class Span(object):
+
+    def __init__(self, name, category, start, depth, tid):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = None
+        self.depth = depth
+        self.tid = tid
+        self.children = 0.0  # time spent in nested spans
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def self_time(self):
+        return self.duration - self.children
+
+
+class StartupProfiler(object):
+    """ Records wall-clock spans for the startup phases and module imports """
+
+    def __init__(self, version=''):
+        self.version = version
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hook = None
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def begin(self, name, category='phase'):
+        """ Open a span in the current thread; it is closed with end() """
+        stack = self._stack()
+        record = Span(name, category, time.perf_counter(), len(stack),
+                      threading.get_ident())
+        with self._lock:
+            self.spans.append(record)
+        stack.append(record)
+        return record
+
+    def end(self, record):
+        record.end = time.perf_counter()
+        stack = self._stack()
+        if record in stack:
+            stack.remove(record)
+        if stack:
+            stack[-1].children += record.duration
+
+    @contextmanager
+    def span(self, name, category='phase'):
+        record = self.begin(name, category)
+        try:
+            yield record
+        finally:
+            self.end(record)
+
+    def install_import_hook(self):
+        if self._hook is None:
+            self._hook = ImportTimer(self)
+            sys.meta_path.insert(0, self._hook)
+
+    def remove_import_hook(self):
+        if self._hook is not None:
+            sys.meta_path.remove(self._hook)
+            self._hook = None
+
+    def trace(self):
+        """ Return the recorded spans in the Chrome trace-event format """
+        events = []
+        for record in self.spans:
+            events.append({
+                'name': record.name,
+                'cat': record.category,
+                'ph': 'X',
+                'ts': round((record.start - self.origin) * 1e6, 1),
+                'dur': round(record.duration * 1e6, 1),
+                'pid': os.getpid(),
+                'tid': record.tid,
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'metadata': {
+                'version': self.version,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'total': round(self.total() * 1e3, 3),
+            },
+        }
+
+    def write_trace(self, filename):
+        with open(filename, 'w') as out:
+            json.dump(self.trace(), out, indent=1)
+        return filename
+
+    def total(self):
+        """ Seconds since the profiler was started """
+        ends = [record.end for record in self.spans if record.end]
+        return (max(ends) if ends else time.perf_counter()) - self.origin
+
+    def summary(self, imports=15):
+        """ Return a table of the phases and the slowest imports """
+        lines = ['%-44s %10s %10s' % ('phase', 'start ms', 'took ms')]
+        for record in self.spans:
+            if record.category != 'phase':
+                continue
+            lines.append('%-44s %10.1f %10.1f' % (
+                '  ' * record.depth + record.name,
+                (record.start - self.origin) * 1e3, record.duration * 1e3))
+        slowest = sorted((r for r in self.spans if r.category == 'import'),
+                         key=lambda r: r.self_time, reverse=True)[:imports]
+        if slowest:
+            lines.append('')
+            lines.append('%-44s %10s %10s' % ('import', 'self ms', 'total ms'))
+            for record in slowest:
+                lines.append('%-44s %10.1f %10.1f' % (
+                    record.name, record.self_time * 1e3, record.duration * 1e3))
+        lines.append('')
+        lines.append('%-44s %21.1f' % ('total', self.total() * 1e3))
+        return '\n'.join(lines)
+
+    def default_filename(self):
+        from liveusb.joblog import log_dir
+        return os.path.join(log_dir(), 'liveusb-creator-startup-%s.json' %
+                            time.strftime('%Y%m%d-%H%M%S'))
+
+    def report(self, filename=None, out=sys.stderr):
+        """ Stop timing imports, write the trace and print the summary """
+        self.remove_import_hook()
+        filename = self.write_trace(filename or self.default_filename())
+        out.write(self.summary() + '\n')
+        out.write('Startup trace written to %s\n' % filename)
+
+
+class ImportTimer(object):
+    """ A meta path finder that times the loading of every new module """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._finding = threading.local()
+
+    def find_spec(self, name, path, target=None):
+        if getattr(self._finding, 'active', False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.active = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, name, self.profiler)
+        return spec
+
+
+class TimedLoader(object):
+    """ Wraps a module loader, timing module creation and execution """
+
+    def __init__(self, loader, name, profiler):
+        self._loader = loader
+        self._name = name
+        self._profiler = profiler
+        self._span = None
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        self._span = self._profiler.begin(self._name, 'import')
+        try:
+            return self._loader.create_module(spec)
+        except BaseException:
+            self._finish()
+            raise
+
+    def exec_module(self, module):
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if self._span is not None:
+            self._profiler.end(self._span)
+            self._span = None
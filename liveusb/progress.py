@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Progress aggregation.
+
+Downloads and writes report their progress far more often than anyone can
+look at it.  A ProgressMeter swallows those reports and only passes one on
+every 1/rate seconds, together with a smoothed throughput and an ETA.
+"""
+
+import threading
+import time
+
+
+class ProgressMeter(object):
+    """ Coalesces progress updates to a fixed rate.
+
+    @param callback: Called as callback(done, speed, eta) at most `rate`
+                     times per second, and always for the final update.
+                     speed is in units per second, eta in seconds, and
+                     both are -1 while unknown.
+    @param total: The amount of work, if known.
+    @param rate: The maximum number of callbacks per second.
+    @param smoothing: Weight of the newest sample in the throughput average.
+    """
+
+    def __init__(self, callback, total=None, rate=15, smoothing=0.3,
+                 clock=time.monotonic):
+        self.callback = callback
+        self.total = total
+        self.interval = 1.0 / rate
+        self.smoothing = smoothing
+        self.clock = clock
+        self.done = 0
+        self.speed = -1.0
+        self._lock = threading.Lock()
+        self._last_time = None
+        self._last_done = 0
+
+    @property
+    def eta(self):
+        if not self.total or self.speed <= 0:
+            return -1.0
+        return max(self.total - self.done, 0) / self.speed
+
+    def reset(self, total=None, done=0):
+        """ Start measuring afresh, e.g. when a download gets resumed """
+        with self._lock:
+            self.total = total
+            self.done = done
+            self.speed = -1.0
+            self._last_time = None
+            self._last_done = done
+
+    def update(self, done):
+        """ Report the amount of work done so far """
+        with self._lock:
+            now = self.clock()
+            self.done = done
+            if self._last_time is not None:
+                elapsed = now - self._last_time
+                finished = self.total is not None and done >= self.total
+                if elapsed < self.interval and not finished:
+                    return
+                if elapsed > 0:
+                    sample = (done - self._last_done) / elapsed
+                    if self.speed < 0:
+                        self.speed = sample
+                    else:
+                        self.speed += self.smoothing * (sample - self.speed)
+            self._last_time = now
+            self._last_done = done
+            args = (float(done), self.speed, self.eta)
+        self.callback(*args)
+
+    def flush(self):
+        """ Pass on the latest state, regardless of the rate limit """
+        with self._lock:
+            args = (float(self.done), self.speed, self.eta)
+        self.callback(*args)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Streaming reads of images and drives, for the checksums and read-backs.
+
+A BlockReader reads into a few buffers allocated up front and hands out
+memoryviews of them, so reading gigabytes allocates nothing per block.
+Files are read with the kernel told the access is sequential, and the
+pages already read are dropped from the page cache as we go, so hashing a
+big ISO doesn't push everything else out of memory.  Block devices are
+opened with O_DIRECT where possible, which bypasses the cache entirely and
+makes sure a read-back comes from the stick rather than from memory.
+"""
+
+import io
+import mmap
+import os
+import stat
+
+BLOCK_SIZE = 1024 ** 2
+BUFFERS = 2
+
+
+def _advise(fd, offset, length, advice):
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass  # only a hint
+
+
+def same(a, b):
+    """ Compare two blocks without copying them """
+    if len(a) != len(b):
+        return False
+    if len(a) % 8:
+        return a.tobytes() == b.tobytes()
+    # memoryviews compare byte by byte, 64 bit words are a lot faster
+    return a.cast('Q') == b.cast('Q')
+
+
+class BlockReader(object):
+    """ Iterates over the blocks of a file, a drive or an open stream.
+
+    The blocks are memoryviews of buffers that get reused: a block stays
+    valid until buffers - 1 more blocks have been read, so keep a copy of
+    anything needed for longer.
+
+    @param source: A path, or a file object with readinto() that the
+        reader takes over.
+    @param limit: Stop after that many bytes.
+    @param direct: Use O_DIRECT for block devices.
+    @param drop_cache: Drop the pages of a file from the cache once read.
+    """
+
+    def __init__(self, source, block_size=BLOCK_SIZE, limit=None, direct=True,
+                 drop_cache=True, buffers=BUFFERS):
+        self.block_size = block_size
+        self.limit = limit
+        self.position = 0
+        self.direct = False
+        self._cache = False
+        if isinstance(source, str):
+            self.file = self._open(source, direct)
+            self._cache = drop_cache and not self.direct and hasattr(os, 'posix_fadvise')
+            if self._cache:
+                _advise(self.file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        else:
+            self.file = source
+        # anonymous maps are page aligned, as O_DIRECT wants
+        self._buffers = [mmap.mmap(-1, block_size) for i in range(buffers)]
+        self._next = 0
+
+    def _open(self, path, direct):
+        if direct and hasattr(os, 'O_DIRECT') and stat.S_ISBLK(os.stat(path).st_mode):
+            try:
+                fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+            except OSError:
+                pass
+            else:
+                self.direct = True
+                return io.FileIO(fd, 'rb')
+        return io.FileIO(path, 'rb')
+
+    def __iter__(self):
+        while True:
+            block = self.read()
+            if not block:
+                return
+            yield block
+
+    def read(self):
+        """ Read the next block, returning an empty view at the end """
+        size = self.block_size
+        if self.limit is not None:
+            size = min(size, self.limit - self.position)
+            if size <= 0:
+                return memoryview(b'')
+        view = memoryview(self._buffers[self._next])
+        self._next = (self._next + 1) % len(self._buffers)
+        # O_DIRECT needs whole blocks, whatever the limit
+        count = self._fill(view if self.direct else view[:size])
+        count = min(count, size)
+        if self._cache and count:
+            _advise(self.file.fileno(), self.position, count, os.POSIX_FADV_DONTNEED)
+        self.position += count
+        return view[:count]
+
+    def _fill(self, view):
+        filled = 0
+        while filled < len(view):
+            count = self.file.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+            if self.direct:
+                break  # a short read is the end of the device
+        return filled
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,40 @@
+"""
+The release backends.
+
+Only the backend of the configured distribution is ever imported, and only
+when the release list is first needed.
+"""
+
+import importlib
+
+from liveusb import metrics
+from liveusb.config import CONFIG
+
+BACKENDS = {
+    'Fedora': 'liveusb.releases.fedora',
+    'Antergos': 'liveusb.releases.antergos',
+}
+
+
+def backend():
+    """ Return the release module for the configured distribution """
+    return importlib.import_module(BACKENDS[CONFIG['DISTRO']])
+
+
+def get_releases():
+    """ Return the (mutable, shared) list of known releases """
+    return backend().releases
+
+
+def get_flavors(store=True):
+    """ Fetch the current releases from the distribution's website """
+    with metrics.timed('refresh') as timer:
+        flavors = backend().get_flavors(store)
+    metrics.record_refresh(timer.duration)
+    return flavors
+
+
+def PyQuery(*args, **kwargs):
+    """ Parse a page, importing pyquery only once we actually scrape one """
+    from pyquery import pyquery
+    return pyquery.PyQuery(*args, **kwargs)
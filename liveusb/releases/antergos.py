@@ -1,18 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import re
-import traceback
-
-from pyquery import pyquery
 
 from liveusb import grabber
-import ruamel.yaml as yaml
 from liveusb import _, LiveUSBError
-from PyQt5.QtCore import QDateTime
-
-config_file = open('/etc/liveusb-creator.yml', 'r').read()
+from liveusb.config import CONFIG
+from liveusb.releases import PyQuery
 
-CONFIG = yaml.safe_load(config_file)
 BASE_URL = CONFIG['BASE_URL']
 ARCHES = CONFIG['ARCHES']
 
@@ -110,7 +104,7 @@ def getProductDetails(d, minimal=False):
 
 def getProducts(url=BASE_URL):
     try:
-        d = pyquery.PyQuery(grabber.urlread(url))
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return []
 
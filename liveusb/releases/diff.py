@@ -0,0 +1,68 @@
+"""
+Keyed diffs between two release lists.
+
+A refresh of the release metadata mostly returns the releases we already
+show.  Instead of throwing the list away, the model applies the operations
+computed here, so unchanged releases (and their downloads) stay put.
+"""
+
+from collections import Counter
+
+
+def release_key(release):
+    """ The identity of a release across refreshes """
+    return (release['source'], release['name'], release['version'])
+
+
+def release_keys(releases):
+    """ Return the keys of a list of releases, numbering any duplicates """
+    seen = Counter()
+    keys = []
+    for release in releases:
+        key = release_key(release)
+        keys.append(key + (seen[key],))
+        seen[key] += 1
+    return keys
+
+
+def diff(old, new):
+    """ Return the operations that turn the key list old into new.
+
+    The operations are meant to be applied in order, row numbers always
+    referring to the list as it is after the previous operations:
+
+        ('remove', first, last)  remove the rows first to last, inclusive
+        ('move', row, to)        move a row up to the position to
+        ('insert', row, key)     insert a new row
+        ('keep', row, key)       the row is already in place
+
+    Every key in new ends up either kept, moved or inserted, so the caller
+    can compare the data of the kept and moved rows afterwards.
+    """
+    rows = list(old)
+    wanted = set(new)
+    ops = []
+
+    last = len(rows) - 1
+    while last >= 0:
+        if rows[last] in wanted:
+            last -= 1
+            continue
+        first = last
+        while first > 0 and rows[first - 1] not in wanted:
+            first -= 1
+        ops.append(('remove', first, last))
+        del rows[first:last + 1]
+        last = first - 1
+
+    for row, key in enumerate(new):
+        if row < len(rows) and rows[row] == key:
+            ops.append(('keep', row, key))
+        elif key in rows[row + 1:]:
+            source = rows.index(key, row + 1)
+            ops.append(('move', source, row))
+            rows.insert(row, rows.pop(source))
+        else:
+            ops.append(('insert', row, key))
+            rows.insert(row, key)
+    return ops
@@ -1,19 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import re
-import traceback
-
-from pyquery import pyquery
-import requests
 
 from liveusb import grabber
-import ruamel.yaml as yaml
 from liveusb import _, LiveUSBError
-from PyQt5.QtCore import QDateTime
-
-config_file = open('/etc/liveusb-creator.yml', 'r').read()
+from liveusb.config import CONFIG
+from liveusb.releases import PyQuery
 
-CONFIG = yaml.safe_load(config_file)
 BASE_URL = CONFIG['BASE_URL']
 PUB_URL = '{0}/{1}'.format(BASE_URL, CONFIG['PUB_PATH'])
 ALT_URL = '{0}/{1}'.format(BASE_URL, CONFIG['ALT_PATH'])
@@ -36,7 +29,7 @@ def getSHA(url):
     baseurl = '/'.join(url.split('/')[:-1])
     filename = url.split('/')[-1]
     try:
-        d = pyquery.PyQuery(requests.get(url).content)
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return ''
     checksum = ''
@@ -70,7 +63,7 @@ def getSize(text):
 
 def getDownload(url):
     try:
-        d = pyquery.PyQuery(grabber.urlread(url))
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return None
     ret = dict()
@@ -97,7 +90,7 @@ def getDownload(url):
 
 def getSpinDetails(url, source):
     try:
-        d = pyquery.PyQuery(grabber.urlread(url))
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return None
     spin = {
@@ -172,7 +165,7 @@ def getSpinDetails(url, source):
 
 def getSpins(url, source):
     try:
-        d = pyquery.PyQuery(grabber.urlread(url))
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return None
     spins = []
@@ -188,7 +181,7 @@ def getSpins(url, source):
     return spins
 
 def getProductDetails(url):
-    d = pyquery.PyQuery(grabber.urlread(url))
+    d = PyQuery(grabber.urlread(url))
     product = {
         'name': '',
         'summary': '',
@@ -242,7 +235,7 @@ def getProductDetails(url):
 
 def getProducts(url='https://getfedora.org/'):
     try:
-        d = pyquery.PyQuery(grabber.urlread(url))
+        d = PyQuery(grabber.urlread(url))
     except LiveUSBError as e:
         return None
 
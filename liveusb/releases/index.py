@@ -0,0 +1,91 @@
+"""
+A search index over the release list.
+
+The release list is filtered on every keystroke in the search box and on
+every architecture switch.  Everything the filter looks at is computed here
+once per release list, so filtering a row is a substring search and a bit
+test.
+"""
+
+import unicodedata
+from collections import OrderedDict
+
+# The architectures we offer, and the variants of a release that match them
+ARCH_MAP = OrderedDict([
+    ('Intel 64bit', ['x86_64']),
+    ('Intel 32bit', ['i686', 'i386']),
+    #('ARM', ['armv7hl']),
+])
+
+
+def normalize(text):
+    """ Return the form of a string used for case-insensitive matching """
+    return unicodedata.normalize('NFKC', text or '').casefold()
+
+
+class IndexEntry(object):
+    __slots__ = ('search', 'arches', 'local', 'separator')
+
+    def __init__(self, search, arches, local, separator):
+        self.search = search
+        self.arches = arches
+        self.local = local
+        self.separator = separator
+
+
+class ReleaseIndex(object):
+    """ Precomputed search keys and architecture bitmasks.
+
+    @param releases: The release dictionaries, in model row order.
+    """
+
+    def __init__(self, releases, arch_map=ARCH_MAP):
+        self.arch_map = arch_map
+        self.arch_bits = dict((name, 1 << i) for i, name in enumerate(arch_map))
+        self.entries = [self.entry(release) for release in releases]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, release):
+        return IndexEntry(
+            search=normalize(release['name']) + '\0' + normalize(release['summary']),
+            arches=self.arch_mask(release['variants']),
+            local=release['source'] == 'Local',
+            separator=release['source'] == '')
+
+    def insert(self, row, release):
+        self.entries.insert(row, self.entry(release))
+
+    def update(self, row, release):
+        self.entries[row] = self.entry(release)
+
+    def remove(self, first, last):
+        del self.entries[first:last + 1]
+
+    def move(self, row, to):
+        self.entries.insert(to, self.entries.pop(row))
+
+    def arch_mask(self, variants):
+        mask = 0
+        for name, abbrs in self.arch_map.items():
+            if any(abbr in variants for abbr in abbrs):
+                mask |= self.arch_bits[name]
+        return mask
+
+    def arch_names(self, mask):
+        """ Return the names of the architectures in a bitmask """
+        return [name for name in self.arch_map if mask & self.arch_bits[name]]
+
+    def accepts(self, row, arch_bit=0, search=''):
+        """ Whether a row passes the architecture and the search filter.
+
+        @param arch_bit: The bit of the selected architecture, 0 for any.
+        @param search: The search string, already passed through normalize().
+        """
+        entry = self.entries[row]
+        if arch_bit and not (entry.local or entry.separator or entry.arches & arch_bit):
+            return False
+        if search:
+            return not entry.separator and search in entry.search
+        return True
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Duplication station mode, started with --station.
+
+Every stick plugged into an allowed USB port, or made by an allowed vendor,
+is written and verified right away, in parallel with the others.  Sticks
+that were already plugged in when the station started are left alone until
+they are replugged.  The progress of each slot (USB port) is shown in a
+grid on the terminal.
+"""
+
+import fnmatch
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from liveusb import _, LiveUSBError
+from liveusb.batch import BatchFlasher
+
+EMPTY = 'empty'
+IGNORED = 'ignored'
+REPLUG = 'replug'  # was plugged in before the station started
+WRITING = 'writing'
+VERIFYING = 'verifying'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Slot(object):
+    """ The state of one USB port of the station """
+
+    def __init__(self, key):
+        self.key = key
+        self.state = EMPTY
+        self.device = ''
+        self.name = ''
+        self.fraction = 0.0
+        self.speed = -1.0
+        self.error = ''
+        self.written = 0  # sticks completed in this slot
+        self.job = None  # the number of the last job started in this slot
+
+
+class Station(object):
+    """ Writes an image to every eligible drive as soon as it is inserted.
+
+    @param iso: The image to write.
+    @param creator: The LiveUSBCreator class to write with.
+    @param allow_ports: Patterns of the USB ports to write to, e.g. 1-1.*
+    @param allow_vendors: USB vendor ids of the sticks to write to.
+    """
+
+    def __init__(self, opts, iso, creator, allow_ports=(), allow_vendors=(),
+                 out=sys.stdout):
+        if not allow_ports and not allow_vendors:
+            raise LiveUSBError(_('Station mode needs at least one allowed '
+                                 'USB port or vendor id'))
+        self.opts = opts
+        self.iso = iso
+        self.creator = creator
+        self.allow_ports = list(allow_ports)
+        self.allow_vendors = set(vendor.lower() for vendor in allow_vendors)
+        self.out = out
+        self.slots = OrderedDict()  # {slot key: Slot}
+        self.present = None  # the devices we have already seen
+        self.jobs = {}  # {job number: (Slot, device)} of the unfinished jobs
+        self.flasher = BatchFlasher(opts, creator, self.report,
+                                    verify=not opts.noverify, readback=True)
+        self._count = 0
+        self._lock = threading.RLock()
+        self._changed = threading.Event()
+
+    def eligible(self, drive):
+        if drive.type != 'usb':
+            return False
+        if drive.vendorId and drive.vendorId.lower() in self.allow_vendors:
+            return True
+        return any(drive.port and fnmatch.fnmatch(drive.port, pattern)
+                   for pattern in self.allow_ports)
+
+    def slot(self, drive):
+        key = drive.port or drive.device
+        if key not in self.slots:
+            self.slots[key] = Slot(key)
+        return self.slots[key]
+
+    def update_drives(self, drives):
+        """ Start writing to every newly inserted eligible drive """
+        started = []
+        with self._lock:
+            devices = dict((drive.device, drive) for drive in drives.values())
+            for slot in self.slots.values():
+                if slot.device and slot.device not in devices:
+                    if slot.state in (DONE, FAILED, IGNORED, REPLUG):
+                        slot.state = EMPTY
+                    slot.device = ''
+            for device in sorted(devices):
+                if self.present is not None and device in self.present:
+                    continue
+                drive = devices[device]
+                slot = self.slot(drive)
+                slot.device = device
+                slot.name = drive.friendlyName
+                slot.error = ''
+                if self.present is None:
+                    slot.state = REPLUG
+                    continue
+                if not self.eligible(drive):
+                    slot.state = IGNORED
+                    continue
+                slot.state = WRITING
+                slot.fraction = 0.0
+                slot.speed = -1.0
+                slot.job = self._count
+                self.jobs[self._count] = (slot, device)
+                started.append((self._count, drive))
+                self._count += 1
+            self.present = set(devices)
+        for number, drive in started:
+            thread = threading.Thread(target=self.flasher.flash,
+                                      args=(number, self.iso, drive),
+                                      name='flash-%s' % drive.device)
+            thread.daemon = True
+            thread.start()
+        self._changed.set()
+        return [number for number, drive in started]
+
+    def report(self, event, **fields):
+        with self._lock:
+            number = fields.get('job')
+            if number not in self.jobs:
+                return
+            slot, device = self.jobs[number]
+            if event in ('done', 'error'):
+                del self.jobs[number]
+            # the stick was pulled and another one went into its slot
+            if device != slot.device or number != slot.job:
+                return
+            if event == 'progress':
+                slot.state = WRITING if fields['phase'] == 'write' else VERIFYING
+                slot.fraction = float(fields['written']) / fields['size'] if fields['size'] else 0.0
+                slot.speed = fields['speed']
+            elif event == 'done':
+                slot.state = DONE
+                slot.fraction = 1.0
+                slot.written += 1
+            elif event == 'error':
+                slot.state = FAILED
+                slot.error = fields['error']
+        self._changed.set()
+
+    def render(self):
+        """ Return the status grid as text """
+        lines = ['%-12s %-10s %-24s %-10s %6s %9s %5s' % (
+            _('Slot'), _('Device'), _('Drive'), _('State'), '%', 'MB/s', _('Done'))]
+        with self._lock:
+            for slot in self.slots.values():
+                speed = '%.1f' % (slot.speed / 1024 ** 2) if slot.speed >= 0 else '-'
+                lines.append('%-12s %-10s %-24s %-10s %6.1f %9s %5d' % (
+                    slot.key[:12], os.path.basename(slot.device)[:10], slot.name[:24],
+                    slot.state, slot.fraction * 100, speed, slot.written))
+                if slot.error:
+                    lines.append('    %s' % slot.error)
+        return '\n'.join(lines)
+
+    def draw(self):
+        """ Redraw the grid if anything changed since it was last drawn """
+        if self._changed.is_set():
+            self._changed.clear()
+            if self.out.isatty():
+                self.out.write('\033[H\033[J')
+            self.out.write(self.render() + '\n\n')
+            self.out.flush()
+        return True
+
+    def serve(self, interval=0.5):
+        """ Run the station until it gets SIGTERM or SIGINT """
+        from gi.repository import GLib
+        from liveusb.daemon import hotplug_loop
+        loop, detector = hotplug_loop(self.opts, self.creator, self.update_drives)
+        detector.log.info(_('Writing %s to every stick plugged into the station') % self.iso)
+        GLib.timeout_add(int(interval * 1000), self.draw)
+        try:
+            loop.run()
+        finally:
+            self.flasher.terminate()
+
+
+def find_image(name):
+    """ Return the ISO for a path, or the downloaded image of a release """
+    if os.path.isfile(name):
+        return os.path.abspath(name)
+    from liveusb.grabber import find_downloads
+    from liveusb.releases import get_releases
+    for release in get_releases():
+        if release['name'].lower() != name.lower():
+            continue
+        for variant in release['variants'].values():
+            path = os.path.join(find_downloads(), os.path.basename(variant['url']))
+            if os.path.isfile(path):
+                return path
+        raise LiveUSBError(_('%s has not been downloaded yet') % release['name'])
+    raise LiveUSBError(_('Cannot find the image or release %s') % name)
+
+
+def main(opts, args):
+    """ Run the station from the command line options """
+    from liveusb import LiveUSBCreator
+    try:
+        if len(args) != 1:
+            raise LiveUSBError(_('Please give the ISO or the release to write'))
+        station = Station(opts, find_image(args[0]), LiveUSBCreator,
+                          opts.allow_ports or (), opts.allow_vendors or ())
+    except LiveUSBError as e:
+        sys.stderr.write('%s\n' % e)
+        return 2
+    station.serve()
+    return 0
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+Virtual drives, for running the creator without any USB stick plugged in.
+
+A virtual drive is a sparse file, or a loop device over one when running
+as root, that the VirtualLiveUSBCreator detects like a removable drive.
+Every write, read and sync on it can be slowed down to the throughput and
+latency of a real stick, and it can be told to fail like one:
+
+    eio@64M        an I/O error for every access covering byte 64M
+    disconnect@1G  the drive goes away when byte 1G is reached
+    stall@10M:5    the drive hangs for 5 seconds, once, at byte 10M
+
+The drives are described one per --virtual-drive option, or separated by
+semicolons in $LIVEUSB_CREATOR_VIRTUAL, which makes every front end use
+them, e.g.
+
+    LIVEUSB_CREATOR_VIRTUAL='size=8G,speed=20M,latency=1ms;size=4G,fail=eio@1G'
+
+The other fields are path (the backing file, a temporary one by default),
+name, serial, port and loop=1.
+"""
+
+import atexit
+import errno
+import io
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from liveusb import _, LiveUSBError, metrics
+from liveusb.creator import Drive, LiveUSBCreator
+from liveusb.writer import ImageWriter, HEAD_SIZE
+
+ENVIRONMENT = 'LIVEUSB_CREATOR_VIRTUAL'
+DEFAULT_SIZE = 8 * 1024 ** 3
+
+EIO = 'eio'
+DISCONNECT = 'disconnect'
+STALL = 'stall'
+FAULTS = (EIO, DISCONNECT, STALL)
+
+
+def parse_size(value):
+    """ Parse a size in bytes, with an optional K, M, G or T suffix """
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+    value = value.strip().lower().rstrip('b')
+    try:
+        if value[-1:] in units:
+            return int(float(value[:-1]) * units[value[-1:]])
+        return int(value)
+    except ValueError:
+        raise LiveUSBError(_('Invalid size: %s') % value)
+
+
+def parse_duration(value):
+    """ Parse a duration in seconds, or in milliseconds with an ms suffix """
+    value = value.strip().lower()
+    try:
+        if value.endswith('ms'):
+            return float(value[:-2]) / 1000
+        return float(value.rstrip('s'))
+    except ValueError:
+        raise LiveUSBError(_('Invalid duration: %s') % value)
+
+
+class Fault(object):
+    """ A failure of a virtual drive, triggered by an access to offset """
+
+    def __init__(self, kind, offset, duration=0):
+        if kind not in FAULTS:
+            raise LiveUSBError(_('Unknown fault %s, expected one of %s')
+                               % (kind, ', '.join(FAULTS)))
+        self.kind = kind
+        self.offset = offset
+        self.duration = duration
+        self.fired = False
+
+    @classmethod
+    def parse(cls, spec):
+        """ Parse kind@offset, or stall@offset:seconds """
+        kind, sep, where = spec.partition('@')
+        if not sep:
+            raise LiveUSBError(_('Invalid fault %s, expected kind@offset') % spec)
+        offset, sep, duration = where.partition(':')
+        return cls(kind.strip().lower(), parse_size(offset),
+                   parse_duration(duration) if sep else 0)
+
+    def hits(self, offset, length):
+        return offset <= self.offset < offset + max(length, 1)
+
+    def __repr__(self):
+        return '<Fault %s@%d>' % (self.kind, self.offset)
+
+
+class VirtualDrive(Drive):
+    """ A drive backed by a file, with the speed and the faults of a stick
+
+    @param throughput: The bytes per second written or read, None for as fast
+        as the backing file goes.
+    @param latency: The seconds every access and sync take on top of that.
+    @param faults: The Faults to inject.
+    @param loop: Attach the file to a loop device and write to that.
+    """
+
+    _count = 0
+
+    def __init__(self, path=None, size=DEFAULT_SIZE, name=None, serial=None,
+                 port=None, throughput=None, latency=0, faults=(), loop=False):
+        VirtualDrive._count += 1
+        number = VirtualDrive._count
+        self.path = path
+        self.size = size
+        self.friendlyName = name or 'Virtual Drive %d' % number
+        self.serial = serial or 'VIRTUAL%04d' % number
+        self.vendorId = '0000'
+        self.port = port or 'virtual-%d' % number
+        self.mount = []
+        self.throughput = throughput
+        self.latency = latency
+        self.faults = list(faults)
+        self.loop = loop
+        self.connected = False
+        self.device = None
+        self._temporary = False
+        self._lock = threading.Lock()
+        self._busy_until = 0
+        self._listeners = []
+
+    @classmethod
+    def parse(cls, spec):
+        """ Parse the key=value,... description of a drive """
+        fields = {'faults': []}
+        for field in spec.split(','):
+            if not field.strip():
+                continue
+            key, sep, value = field.partition('=')
+            key = key.strip().lower()
+            if not sep:
+                raise LiveUSBError(_('Invalid virtual drive field: %s') % field)
+            if key == 'size':
+                fields['size'] = parse_size(value)
+            elif key == 'speed':
+                fields['throughput'] = parse_size(value)
+            elif key == 'latency':
+                fields['latency'] = parse_duration(value)
+            elif key == 'fail':
+                fields['faults'].append(Fault.parse(value))
+            elif key == 'loop':
+                fields['loop'] = value.strip().lower() in ('1', 'yes', 'true')
+            elif key in ('path', 'name', 'serial', 'port'):
+                fields[key] = value.strip()
+            else:
+                raise LiveUSBError(_('Unknown virtual drive field: %s') % key)
+        return cls(**fields)
+
+    def create(self):
+        """ Create the backing file and plug the drive in """
+        if not self.path:
+            handle, self.path = tempfile.mkstemp(prefix='liveusb-virtual-', suffix='.img')
+            os.close(handle)
+            self._temporary = True
+        with open(self.path, 'ab') as backing:
+            backing.truncate(self.size)
+        self.device = self.path
+        if self.loop:
+            try:
+                device = subprocess.check_output(['losetup', '--find', '--show', self.path])
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise LiveUSBError(_('Unable to attach %s to a loop device: %s')
+                                   % (self.path, e))
+            self.device = device.decode('ascii').strip()
+        self.connected = True
+        return self
+
+    def remove(self):
+        """ Unplug the drive for good, deleting a temporary backing file """
+        self.connected = False
+        if self.loop and self.device != self.path:
+            subprocess.call(['losetup', '--detach', self.device])
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def on_disconnect(self, listener):
+        self._listeners.append(listener)
+
+    def disconnect(self):
+        """ Pull the drive out: every access fails from now on """
+        self.connected = False
+        for listener in self._listeners:
+            listener(self)
+
+    def io(self, op, offset=0, length=0):
+        """ Account for an access, sleeping and failing as the drive would """
+        if not self.connected:
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV), self.device)
+        if op == 'write' and offset + length > self.size:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), self.device)
+        if op in ('read', 'write'):
+            for fault in self.faults:
+                if not fault.hits(offset, length):
+                    continue
+                if fault.kind == EIO:
+                    raise OSError(errno.EIO, os.strerror(errno.EIO), self.device)
+                if fault.fired:
+                    continue
+                fault.fired = True
+                if fault.kind == DISCONNECT:
+                    self.disconnect()
+                    raise OSError(errno.ENODEV, os.strerror(errno.ENODEV), self.device)
+                time.sleep(fault.duration)
+        if self.latency:
+            time.sleep(self.latency)
+        self._pace(length)
+
+    def _pace(self, length):
+        """ Hold the access until the throughput allows it """
+        if not self.throughput or not length:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._busy_until = max(now, self._busy_until) + float(length) / self.throughput
+            wait = self._busy_until - now
+        time.sleep(wait)
+
+    def open(self):
+        """ Open the drive for reading, through the throttle and the faults """
+        return VirtualDriveFile(self)
+
+    def __repr__(self):
+        return '<VirtualDrive %s>' % self.device
+
+
+class VirtualDriveFile(io.FileIO):
+    """ A virtual drive opened for reading """
+
+    def __init__(self, drive):
+        io.FileIO.__init__(self, drive.device, 'rb')
+        self.drive = drive
+
+    def readinto(self, buffer):
+        self.drive.io('read', self.tell(), len(buffer))
+        return io.FileIO.readinto(self, buffer)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.drive.size - self.tell(), 0)
+        self.drive.io('read', self.tell(), size)
+        return io.FileIO.read(self, size)
+
+
+class VirtualImageWriter(ImageWriter):
+    """ An ImageWriter whose writes and syncs go through a virtual drive """
+
+    def __init__(self, drive, *args, **kwargs):
+        ImageWriter.__init__(self, *args, **kwargs)
+        self.drive = drive
+
+    def _open(self):
+        self.drive.io('open')
+        return ImageWriter._open(self)
+
+    def _write_block(self, fd, block):
+        self.drive.io('write', os.lseek(fd, 0, os.SEEK_CUR), len(block))
+        ImageWriter._write_block(self, fd, block)
+
+    def _sync(self, fd):
+        self.drive.io('sync')
+        ImageWriter._sync(self, fd)
+
+    if ImageWriter._copy_file_range:
+        def _copy_file_range(self, source, fd, count):
+            self.drive.io('write', self._position, count)
+            return ImageWriter._copy_file_range(self, source, fd, count)
+
+    if ImageWriter._sendfile:
+        def _sendfile(self, source, fd, count):
+            self.drive.io('write', self._position, count)
+            return ImageWriter._sendfile(self, source, fd, count)
+
+
+_environment_drives = {}  # {spec: [VirtualDrive]}, shared by the creators
+
+
+def drives_from_spec(specs):
+    """ Create the drives of a ;-separated list of descriptions, once per process """
+    if specs not in _environment_drives:
+        _environment_drives[specs] = [VirtualDrive.parse(spec).create()
+                                      for spec in specs.split(';') if spec.strip()]
+        for drive in _environment_drives[specs]:
+            atexit.register(drive.remove)
+    return _environment_drives[specs]
+
+
+class VirtualLiveUSBCreator(LiveUSBCreator):
+    """ A LiveUSBCreator detecting virtual drives instead of real ones
+
+    @param virtual: The VirtualDrives, by default those of --virtual-drive
+        and $LIVEUSB_CREATOR_VIRTUAL.
+    """
+
+    def __init__(self, opts, virtual=None):
+        LiveUSBCreator.__init__(self, opts)
+        self.drives = {}
+        if virtual is None:
+            specs = list(getattr(opts, 'virtual_drive', None) or [])
+            if os.getenv(ENVIRONMENT):
+                specs.append(os.getenv(ENVIRONMENT))
+            virtual = drives_from_spec(';'.join(specs))
+        self.virtual = list(virtual)
+        for drive in self.virtual:
+            drive.on_disconnect(self._disconnected)
+
+    def detect_removable_drives(self, callback=None):
+        self.callback = callback
+        self.drives = dict((drive.device, drive) for drive in self.virtual
+                           if drive.connected)
+        if callback:
+            self.callback()
+
+    def plug(self, drive):
+        """ Plug a drive in, as a hotplug event would """
+        if not drive.connected:
+            drive.create()
+        if drive not in self.virtual:
+            self.virtual.append(drive)
+            drive.on_disconnect(self._disconnected)
+        self.drives[drive.device] = drive
+        if self.callback:
+            self.callback()
+
+    def unplug(self, drive):
+        """ Pull a drive out, as a hotplug event would """
+        drive.disconnect()
+
+    def _disconnected(self, drive):
+        if self.drives.pop(drive.device, None) is not None:
+            self.log.info(_('%s has been disconnected') % drive.device)
+            if self.callback:
+                self.callback()
+
+    @metrics.measured('write', metrics.record_write, 'written')
+    def dd_image(self, update_function=None):
+        self.log.info(_('Overwriting device with live image'))
+        self.write_image(update_function)
+
+    def image_writer(self, target, update_function, **kwargs):
+        return VirtualImageWriter(self.drive, self.iso, target, self.cancel_token,
+                                  update_function, **kwargs)
+
+    def drive_reader(self):
+        return self.drive.open()
+
+    def restore_drive(self, d, callback):
+        """ Wipe the start of the drive, as a fresh format would """
+        try:
+            d.io('write', 0, HEAD_SIZE)
+            with open(d.device, 'r+b') as drive:
+                drive.write(bytes(HEAD_SIZE))
+                os.fsync(drive.fileno())
+        except (IOError, OSError) as e:
+            callback(False, str(e))
+        else:
+            callback(True)
+
+    def terminate(self):
+        pass
+
+    def is_admin(self):
+        return True
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2015  Red Hat, Inc. All rights reserved.
+#
+# This copyrighted material is made available to anyone wishing to use, modify,
+# copy, or redistribute it subject to the terms and conditions of the GNU
+# General Public License v.2.  This program is distributed in the hope that it
+# will be useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.  You should have
+# received a copy of the GNU General Public License along with this program; if
+# not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth
+# Floor, Boston, MA 02110-1301, USA. Any Red Hat trademarks that are
+# incorporated in the source code or documentation are not subject to the GNU
+# General Public License and may only be used or replicated with the express
+# permission of Red Hat, Inc.
+
+"""
+The image writer.
+
+Images are copied to the drive block by block, checking a CancelToken in
+between.  The drive is synced every few blocks, so there is never more
+than SYNC_INTERVAL of unwritten data in the page cache and an abort only
+has to wait for that little to reach the stick.
+
+A write that is cancelled or fails leaves the drive "partially written":
+the head of the drive, where the partition table and the ISO9660 volume
+descriptors live, is zeroed, so the stick shows up as blank instead of as
+a truncated copy of the image.  Since the head is written last, that
+leaves everything the journal says was synced intact, and the next write
+of the same image can resume from the checkpoint.
+
+With the kernel engine, an uncompressed image that nothing has to look at
+on the way is copied with copy_file_range() or sendfile(), so the data
+never goes through Python.  When the kernel can't copy between the two
+(copy_file_range() only copies between regular files, sendfile() needs a
+recent enough kernel for a block device), the blocks go through Python
+as usual.
+"""
+
+import errno
+import mmap
+import os
+import queue
+import threading
+
+from liveusb import _, LiveUSBError
+from liveusb.decompress import DecompressedImage, open_image, read_full, uncompressed_size
+
+BLOCK_SIZE = 1024 ** 2
+SYNC_INTERVAL = 4 * BLOCK_SIZE
+HEAD_SIZE = BLOCK_SIZE  # what gets zeroed on a partial write
+DIRECT_ALIGNMENT = 4096  # O_DIRECT writes must be multiples of the sector size
+KERNEL_CHUNK = 8 * BLOCK_SIZE  # what the kernel engine copies between checks
+
+PYTHON = 'python'
+KERNEL = 'kernel'
+ENGINES = (PYTHON, KERNEL)
+
+# what a kernel copy fails with when it can't copy between the two files
+UNSUPPORTED = (errno.EINVAL, errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP)
+
+
+class WriteCancelled(LiveUSBError):
+    """ Raised when a write is stopped through its CancelToken """
+
+    def __init__(self, written=0):
+        LiveUSBError.__init__(self, _('Writing was cancelled'))
+        self.written = written
+
+
+class CancelToken(object):
+    """ Lets one thread ask another to stop what it's doing """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """ Request the cancellation and run the registered callbacks """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """ Call callback on cancellation, right away if already cancelled """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self, written=0):
+        if self._event.is_set():
+            raise WriteCancelled(written)
+
+
+class ImageWriter(object):
+    """ Copies an image onto a drive.
+
+    The head of the image is written last, after everything else has been
+    synced, so the drive only becomes bootable once the write is complete.
+    With a WriteJournal the synced offset is checkpointed as the write goes
+    on, and a later write of the same image to the same drive resumes from
+    there once the data just before the checkpoint reads back correctly.
+
+    @param source: The path of the image, which may be compressed.
+    @param target: The path of the drive.
+    @param token: A CancelToken checked between blocks.
+    @param progress: Called with the fraction written after every block.
+    @param journal: The WriteJournal of this image on this drive, if any.
+    @param sync_interval: How much to write between syncs, None to only
+        sync at the end.
+    @param direct: Write with O_DIRECT, bypassing the page cache.
+    @param depth: How many blocks to read ahead on a separate thread.
+    @param consumers: Objects whose update() gets every block of the image,
+        in order, and whose close() is called before the head is written,
+        so that they can still reject the image by raising.  They only see
+        the image when it is written from the start, see fed.
+    @param engine: PYTHON, or KERNEL to copy inside the kernel when the
+        image is uncompressed and there are no consumers to feed; see
+        method for what was used.
+    """
+
+    def __init__(self, source, target, token=None, progress=None,
+                 block_size=BLOCK_SIZE, sync_interval=SYNC_INTERVAL,
+                 journal=None, consumers=(), direct=False, depth=0, engine=PYTHON):
+        if engine not in ENGINES:
+            raise LiveUSBError(_('Unknown write engine %s, expected one of %s')
+                               % (engine, ', '.join(ENGINES)))
+        self.source = source
+        self.target = target
+        self.token = token or CancelToken()
+        self.progress = progress
+        self.block_size = block_size
+        self.sync_interval = sync_interval
+        self.journal = journal
+        self.consumers = list(consumers)
+        self.direct = direct and hasattr(os, 'O_DIRECT')
+        self.depth = depth
+        self.engine = engine
+        self.method = None  # what copied the image: python, copy_file_range or sendfile
+        self._aligned = None  # the page aligned buffer O_DIRECT writes go through
+        self.fed = False  # whether the consumers were given the whole image
+        self._feeding = []
+        self.size = uncompressed_size(source)  # None if we can't tell up front
+        self.written = 0  # how much of the image is on the drive
+        self.resumed = 0  # the offset the write was resumed from
+        self.partial = False  # whether the drive holds an incomplete image
+        self._touched = False
+        self._position = 0  # where we are in the image
+
+    def write(self):
+        """ Write the whole image, returning the number of bytes written """
+        self.written = 0
+        self._touched = False
+        self.token.check()
+        image = open_image(self.source)
+        try:
+            fd = self._open()
+            try:
+                image = self._write(image, fd)
+            except WriteCancelled:
+                self._invalidate(fd)
+                raise WriteCancelled(self.written)
+            except (IOError, OSError) as e:
+                self._invalidate(fd)
+                raise LiveUSBError(_('Writing to %s failed after %d bytes: %s')
+                                   % (self.target, self.written, e))
+            except LiveUSBError:
+                # the image itself is bad, don't resume writing it
+                self._invalidate(fd)
+                if self.journal:
+                    self.journal.clear()
+                raise
+            finally:
+                os.close(fd)
+        finally:
+            image.close()
+        if self.journal:
+            self.journal.clear()
+        return self.written
+
+    def _open(self):
+        flags = os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+        if self.direct:
+            try:
+                fd = os.open(self.target, flags | os.O_DIRECT)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise LiveUSBError(_('Unable to open %s: %s') % (self.target, e))
+                self.direct = False  # e.g. tmpfs doesn't do O_DIRECT
+            else:
+                self._aligned = mmap.mmap(-1, max(self.block_size, HEAD_SIZE))
+                return fd
+        try:
+            return os.open(self.target, flags)
+        except OSError as e:
+            raise LiveUSBError(_('Unable to open %s: %s') % (self.target, e))
+
+    def _buffered(self, fd):
+        """ Stop using O_DIRECT, for writes that aren't aligned """
+        if self.direct:
+            import fcntl
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+            self.direct = False
+
+    def _write(self, image, fd):
+        head = read_full(image, HEAD_SIZE)
+        self._position = len(head)
+        self.partial = True
+        self.resumed = self._resume_offset(image, len(head))
+        self._feeding = [] if self.resumed else self.consumers
+        if self.resumed:
+            self.written = self.resumed - len(head)
+        elif self._position != len(head):
+            image = self._rewind(image, len(head))
+        self._feed(head)
+        self._copy(image, fd)
+        for consumer in self._feeding:
+            consumer.close()
+        self.fed = bool(self._feeding)
+        self.token.check(self.written)
+        self._sync(fd)  # the body is on the drive before the head can be
+        os.lseek(fd, 0, os.SEEK_SET)
+        self._write_block(fd, head)
+        self._sync(fd)
+        if self.progress:
+            self.progress(1.0)
+        if self.size is None:
+            self.size = self.written
+        self.partial = False
+        return image
+
+    def _skip(self, image, position):
+        """ Move the image forward to position, reading through it if we must """
+        if image.seekable():
+            image.seek(position)
+            self._position = position
+        while self._position < position:
+            data = image.read(min(self.block_size, position - self._position))
+            if not data:
+                break
+            self._position += len(data)
+        self._position = position
+
+    def _rewind(self, image, position):
+        """ Go back to position, reopening the image if it can't seek """
+        if not image.seekable():
+            image.close()
+            image = open_image(self.source)
+            self._position = 0
+        self._skip(image, position)
+        return image
+
+    def _resume_offset(self, image, head):
+        """ Return where to pick up an interrupted write, 0 to start over """
+        checkpoint = self.journal.load() if self.journal else None
+        if not checkpoint:
+            return 0
+        offset = checkpoint[0]
+        if offset <= head or (self.size is not None and offset > self.size):
+            return 0
+        length = min(self.sync_interval or SYNC_INTERVAL, offset - head)
+        try:
+            with open(self.target, 'rb') as drive:
+                if hasattr(os, 'posix_fadvise'):
+                    # read what is on the stick, not what is in our cache
+                    os.posix_fadvise(drive.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                drive.seek(offset - length)
+                actual = drive.read(length)
+        except (IOError, OSError):
+            return 0
+        self._skip(image, offset - length)
+        expected = read_full(image, length)
+        self._position += len(expected)
+        if actual != expected:
+            return 0
+        return offset
+
+    def _fraction(self, image):
+        if hasattr(image, 'fraction'):
+            return image.fraction(self.written)
+        return float(self.written) / self.size if self.size else 1.0
+
+    def _feed(self, block):
+        for consumer in self._feeding:
+            consumer.update(block)
+
+    def _write_block(self, fd, block):
+        if self.direct:
+            if len(block) % DIRECT_ALIGNMENT:
+                self._buffered(fd)  # the end of the image
+            else:
+                self._aligned[:len(block)] = block
+                block = memoryview(self._aligned)[:len(block)]
+        view = memoryview(block)
+        while view:
+            self._touched = True
+            count = os.write(fd, view)
+            view = view[count:]
+            self.written += count
+
+    def _sync(self, fd):
+        os.fsync(fd)
+
+    def _blocks(self, image):
+        """ Yield the rest of the image, reading ahead on a thread if asked to """
+        if not self.depth:
+            while True:
+                block = read_full(image, self.block_size)
+                if not block:
+                    return
+                yield block
+        blocks = queue.Queue(self.depth)
+        stop = threading.Event()
+
+        def read_ahead():
+            try:
+                while not stop.is_set():
+                    block = read_full(image, self.block_size)
+                    blocks.put(block)
+                    if not block:
+                        return
+            except Exception as e:
+                blocks.put(e)
+        thread = threading.Thread(target=read_ahead, name='read-ahead')
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                block = blocks.get()
+                if isinstance(block, Exception):
+                    raise block
+                if not block:
+                    return
+                yield block
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    blocks.get(timeout=0.1)  # unblock the reader
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def _copy(self, image, fd):
+        """ Copy the rest of the image to the drive, syncing every sync_interval """
+        os.lseek(fd, self._position, os.SEEK_SET)
+        if self.engine == KERNEL and self._kernel_copy(image, fd):
+            return
+        self.method = PYTHON
+        self._unsynced = 0
+        blocks = self._blocks(image)
+        try:
+            for block in blocks:
+                self.token.check(self.written)
+                self._feed(block)
+                self._write_block(fd, block)
+                self._copied(image, fd, len(block))
+        finally:
+            blocks.close()
+
+    def _copied(self, image, fd, count):
+        """ Account for count more bytes on the drive, syncing and checkpointing """
+        self._position += count
+        self._unsynced += count
+        if self.sync_interval and self._unsynced >= self.sync_interval:
+            self._sync(fd)
+            self._unsynced = 0
+            if self.journal:
+                self.journal.checkpoint(self._position, self._position // self.block_size)
+        if self.progress:
+            self.progress(self._fraction(image))
+
+    def _kernel_copy(self, image, fd):
+        """ Copy the rest of the image inside the kernel.
+
+        Returns False, with nothing copied, if the image has to go through
+        Python or the kernel can't copy it.
+        """
+        if self._feeding or isinstance(image, DecompressedImage) or not hasattr(image, 'fileno'):
+            return False
+        methods = [method for method in (self._copy_file_range, self._sendfile) if method]
+        if not methods:
+            return False
+        source = image.fileno()
+        size = os.fstat(source).st_size
+        self._buffered(fd)  # the kernel writes in whatever sizes it likes
+        self._unsynced = 0
+        while self._position < size:
+            self.token.check(self.written)
+            try:
+                copied = methods[0](source, fd, min(KERNEL_CHUNK, size - self._position))
+            except OSError as e:
+                if e.errno not in UNSUPPORTED or self.method:
+                    raise
+                methods.pop(0)
+                if not methods:
+                    return False
+                continue
+            if not copied:
+                break  # the image got shorter
+            self.method = methods[0].__name__.lstrip('_')
+            self._touched = True
+            self.written += copied
+            self._copied(image, fd, copied)
+        return True
+
+    if hasattr(os, 'copy_file_range'):
+        def _copy_file_range(self, source, fd, count):
+            return os.copy_file_range(source, fd, count, self._position, self._position)
+    else:
+        _copy_file_range = None
+
+    if hasattr(os, 'sendfile'):
+        def _sendfile(self, source, fd, count):
+            # writes at, and moves, the position of fd
+            return os.sendfile(fd, source, self._position, count)
+    else:
+        _sendfile = None
+
+    def _invalidate(self, fd):
+        """ Zero the head of a partially written drive, as well as we can """
+        if not self._touched and not self.resumed:
+            self.partial = False  # the drive was not touched
+            return
+        try:
+            self._buffered(fd)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, bytes(HEAD_SIZE))
+            self._sync(fd)
+        except (IOError, OSError):
+            pass
+
@@ -0,0 +1,25 @@
+""" Helpers shared by the tests, imported with `from conftest import ...` """
+
+
+def drive(device, name='Generic Flash', size=8 * 1024 ** 3, port='', vendor=''):
+    from liveusb.creator import Drive
+    data = Drive()
+    data.device = device
+    data.friendlyName = name
+    data.size = size
+    data.port = port
+    data.vendorId = vendor
+    return data
+
+
+class Options(object):
+    """ The command line options, with the ones a test cares about overridden """
+    console = True
+    force = False
+    verbose = False
+    noverify = True
+    manifest = None
+
+    def __init__(self, **options):
+        for name, value in options.items():
+            setattr(self, name, value)
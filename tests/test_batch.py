@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+from liveusb.creator import LiveUSBCreator
+
+from conftest import drive, Options
+
+
+class FakeCreator(LiveUSBCreator):
+    """ Writes nothing, but reports progress like dd_image """
+
+    def verify_iso_sha1(self):
+        return None
+
+    def dd_image(self, update_function=None):
+        if self.drive.device == '/dev/broken':
+            raise Exception('write failed')
+        update_function(float('nan'))
+        update_function(0.5)
+        update_function(1.0)
+
+    def terminate(self):
+        pass
+
+
+class TestBatch:
+
+    def test_parse_manifest(self):
+        from liveusb import LiveUSBError
+        from liveusb.batch import parse_manifest
+        manifest = parse_manifest({'concurrency': 3, 'jobs': [
+            {'iso': 'a.iso', 'device': '/dev/sdb'},
+            {'iso': 'b.iso', 'device': 'all', 'min_size': '1000'}]})
+        assert manifest.concurrency == 3
+        assert [job.iso for job in manifest.jobs] == ['a.iso', 'b.iso']
+        assert manifest.jobs[1].min_size == 1000
+        with pytest.raises(LiveUSBError):
+            parse_manifest({'jobs': [{'iso': 'a.iso'}]})
+        with pytest.raises(LiveUSBError):
+            parse_manifest({'concurrency': 0, 'jobs': []})
+
+    def test_plan(self):
+        from liveusb import LiveUSBError
+        from liveusb.batch import parse_manifest, plan
+        drives = dict((d.device, d) for d in [
+            drive('/dev/sdb'), drive('/dev/sdc', 'SanDisk Cruzer'),
+            drive('/dev/sdd', 'SanDisk Tiny', size=1024 ** 3), drive('/dev/sde')])
+        manifest = parse_manifest({'jobs': [
+            {'iso': 'b.iso', 'device': 'all', 'name': 'sandisk', 'min_size': 4 * 1024 ** 3},
+            {'iso': 'a.iso', 'device': '/dev/sdc'},
+            {'iso': 'c.iso', 'device': 'all'}]})
+        jobs = [(iso, d.device) for iso, d in plan(manifest, drives)]
+        assert jobs == [('c.iso', '/dev/sdb'), ('a.iso', '/dev/sdc'),
+                        ('c.iso', '/dev/sdd'), ('c.iso', '/dev/sde')]
+        with pytest.raises(LiveUSBError):
+            plan(parse_manifest({'jobs': [{'iso': 'a.iso', 'device': '/dev/sdx'}]}), drives)
+
+    def test_flash_reports_json_lines(self, tmpdir, monkeypatch):
+        from liveusb.batch import BatchFlasher, JSONReporter
+        monkeypatch.setenv('TEMP', str(tmpdir))
+        iso = tmpdir.join('test.iso')
+        iso.write(b'\0' * 4096, mode='wb')
+        out = io.StringIO()
+        flasher = BatchFlasher(Options(), FakeCreator, JSONReporter(out), concurrency=2)
+        failed = flasher.run([(str(iso), drive('/dev/sdb')),
+                              (str(iso), drive('/dev/broken'))])
+        assert failed == 1
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        kinds = [event['event'] for event in events]
+        assert kinds[0] == 'plan' and kinds[-1] == 'summary'
+        done = [e for e in events if e['event'] == 'done']
+        assert len(done) == 1 and done[0]['device'] == '/dev/sdb'
+        errors = [e for e in events if e['event'] == 'error']
+        assert errors[0]['device'] == '/dev/broken'
+        progress = [e for e in events if e['event'] == 'progress' and e['job'] == 0]
+        assert progress[-1]['written'] == 4096
@@ -0,0 +1,182 @@
+import pytest
+
+
+class TestWriteBenchmark:
+
+    def test_cases(self):
+        from benchmarks.write import cases
+        sweep = list(cases(['file', 'tmpfs'], [1024 ** 2], [None], [0, 4]))
+        assert len(sweep) == 6  # no O_DIRECT on tmpfs
+        assert not [case for case in sweep if case['target'] == 'tmpfs' and case['direct']]
+        sweep = list(cases(['file'], [1024 ** 2], [None], [0, 4], engines=['python', 'kernel']))
+        assert len(sweep) == 5  # the kernel engine neither reads ahead nor uses O_DIRECT
+        assert [case for case in sweep if case['engine'] == 'kernel'] == [
+            {'engine': 'kernel', 'target': 'file', 'block_size': 1024 ** 2, 'direct': False,
+             'sync_interval': None, 'depth': 0}]
+
+    def test_run_case(self, tmpdir):
+        from benchmarks.write import make_image, run_case
+        image, target = str(tmpdir.join('image')), str(tmpdir.join('target'))
+        make_image(image, 3 * 1024 ** 2 + 5)
+        open(target, 'wb').close()
+        result = run_case({'target': 'file', 'block_size': 1024 ** 2, 'direct': False,
+                           'sync_interval': None, 'depth': 2}, image, target)
+        assert result['bytes'] == 3 * 1024 ** 2 + 5
+        assert result['peak_rss_kb'] > 0
+        assert result['method'] == 'python'
+        result = run_case({'engine': 'kernel', 'target': 'file', 'block_size': 1024 ** 2,
+                           'direct': False, 'sync_interval': None, 'depth': 0}, image, target)
+        assert result['method'] in ('copy_file_range', 'sendfile')
+
+    def test_compare(self):
+        from benchmarks.write import compare
+        case = {'target': 'file', 'block_size': 1024 ** 2, 'direct': False,
+                'sync_interval': None, 'depth': 0}
+        baseline = [dict(case, mb_per_s=100.0)]
+        assert compare([dict(case, mb_per_s=95.0)], baseline, 0.1) == []
+        slower = [dict(case, mb_per_s=80.0)]
+        assert compare(slower, baseline, 0.1) == slower
+        assert slower[0]['change'] == -0.2
+        assert compare([dict(case, depth=4, mb_per_s=1.0)], baseline, 0.1) == []
+        # the baselines from before the engines were those of the Python one
+        assert compare([dict(slower[0], engine='python')], baseline, 0.1)
+        assert compare([dict(case, engine='kernel', mb_per_s=1.0)], baseline, 0.1) == []
+
+
+class TestLocalMirror:
+
+    def test_ranges(self):
+        import urllib.error
+        import urllib.request
+        from benchmarks.mirror import LocalMirror, PatternFile, MB
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(3 * MB + 5))
+            url = mirror.url('test.iso')
+            whole = urllib.request.urlopen(url).read()
+            assert whole == image.read(0, image.size)
+            assert whole[:MB] != whole[MB:2 * MB]
+            request = urllib.request.Request(url, headers={'Range': 'bytes=%d-' % (MB - 2)})
+            response = urllib.request.urlopen(request)
+            assert response.status == 206
+            assert response.headers['Content-Range'] == 'bytes %d-%d/%d' % (
+                MB - 2, image.size - 1, image.size)
+            assert response.read() == whole[MB - 2:]
+            request = urllib.request.Request(url, headers={'Range': 'bytes=-5'})
+            assert urllib.request.urlopen(request).read() == whole[-5:]
+            # a changed file is sent whole
+            request = urllib.request.Request(url, headers={'Range': 'bytes=10-', 'If-Range': '"old"'})
+            assert urllib.request.urlopen(request).status == 200
+            request = urllib.request.Request(url, headers={'Range': 'bytes=%d-' % image.size})
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(request)
+            assert error.value.code == 416
+            assert mirror.statuses == {200: 2, 206: 2, 416: 1}
+
+    def test_redirects_and_resets(self, tmpdir):
+        import urllib.request
+        from benchmarks.mirror import LocalMirror, sparse_file, MB
+        path = sparse_file(str(tmpdir.join('sparse.iso')), 2 * MB)
+        with LocalMirror(latency=0.01) as mirror:
+            mirror.add('sparse.iso', path)
+            mirror.redirect('pub/sparse.iso', mirror.url('sparse.iso'))
+            assert urllib.request.urlopen(mirror.url('pub/sparse.iso')).read() == bytes(2 * MB)
+            mirror.reset(after=MB)
+            with pytest.raises(OSError):
+                urllib.request.urlopen(mirror.url('sparse.iso')).read()
+            assert urllib.request.urlopen(mirror.url('sparse.iso')).read() == bytes(2 * MB)
+
+    def test_bandwidth(self):
+        import time
+        import urllib.request
+        from benchmarks.mirror import LocalMirror, PatternFile, MB
+        with LocalMirror(bandwidth=10 * MB) as mirror:
+            mirror.add('test.iso', PatternFile(2 * MB))
+            started = time.monotonic()
+            urllib.request.urlopen(mirror.url('test.iso')).read()
+            assert time.monotonic() - started >= 0.18
+
+
+class TestDownloadBenchmark:
+
+    def test_cases(self):
+        from benchmarks.download import case_key, cases
+        sweep = list(cases(['single', 'segmented'], 4, [0, 2]))
+        assert [case_key(case) for case in sweep] == [
+            'single segments=1 resets=0', 'single segments=1 resets=2',
+            'segmented segments=4 resets=0', 'segmented segments=4 resets=2']
+
+    def test_run_sweep(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.download import cases, run_sweep
+        from benchmarks.mirror import LocalMirror, PatternFile, MB
+        mirrors = [LocalMirror().start() for i in range(2)]
+        try:
+            results = run_sweep(list(cases(['single', 'mirrors'], 2, [1])),
+                                PatternFile(3 * MB), mirrors, str(tmpdir), MB)
+        finally:
+            for mirror in mirrors:
+                mirror.stop()
+        assert [result['correct'] for result in results] == [True, True]
+        assert results[0]['attempts'] == 2
+        assert results[1]['bytes'] == 3 * MB
+
+
+ANTERGOS_PAGE = '''<html><body>
+<div class="et_pb_blurb_0"><p>Live environment ^ Full desktop</p></div>
+<div class="et_pb_blurb_1"><p>Installer only ^ Small</p></div>
+<div class="et_pb_tab_1">
+ <div class="one_half"><h3>Antergos ISO</h3>
+  <a href="%(url)s/antergos-16.1.iso" title="Version 16.1">Download</a>
+  <ul><li>antergos-16.1.iso</li><li>1.9 GB</li><li>MD5 Sum: abc123</li></ul></div>
+ <div class="et_column_last"><h3>Antergos Minimal ISO</h3>
+  <a href="%(url)s/antergos-minimal-16.1.iso" title="Version 16.1">Download</a>
+  <ul><li>antergos-minimal-16.1.iso</li><li>600 MB</li><li>MD5 Sum: def456</li></ul></div>
+</div></body></html>'''
+
+
+class TestCrawlBenchmark:
+
+    def test_record_and_replay(self, tmpdir, monkeypatch):
+        import time
+        pytest.importorskip('requests')
+        pytest.importorskip('pyquery')
+        from benchmarks.crawl import incomplete
+        from benchmarks.mirror import LocalMirror
+        from benchmarks.replay import Fixtures, Recorder, Replayer, mounted
+        from liveusb.config import CONFIG
+        monkeypatch.setattr(CONFIG, '_data', {'DISTRO': 'Antergos', 'ARCHES': ['x86_64'],
+                                             'BASE_URL': 'http://localhost/'})
+        from liveusb.releases import antergos
+        with LocalMirror() as mirror:
+            page = tmpdir.join('index.html')
+            page.write(ANTERGOS_PAGE % {'url': mirror.base_url})
+            mirror.add('index.html', str(page))
+            mirror.redirect('antergos', mirror.url('index.html'))
+            url = mirror.url('antergos')
+            with mounted(Recorder(Fixtures(str(tmpdir.join('fixtures'))))):
+                recorded = antergos.getProducts(url)
+        assert [product['name'] for product in recorded] == ['Antergos', 'Antergos Minimal']
+        assert recorded[1]['variants']['x86_64']['size'] == 600 * 1024 ** 2
+
+        # the mirror is gone, the fixtures are all there is
+        with mounted(Replayer(Fixtures(str(tmpdir.join('fixtures'))), latency=0.1)) as replayer:
+            started = time.monotonic()
+            replayed = antergos.getProducts(url)
+            assert time.monotonic() - started >= 0.2  # the redirect and the page
+        assert replayed == recorded
+        assert replayer.requests == 2 and replayer.misses == []
+        assert replayer.bytes > len(ANTERGOS_PAGE)
+        assert incomplete(replayed) == []
+
+        with mounted(Replayer(Fixtures(str(tmpdir.join('fixtures'))), latency=0)) as replayer:
+            assert antergos.getProducts(mirror.url('elsewhere')) == []
+        assert replayer.misses == [mirror.url('elsewhere')]
+
+    def test_incomplete(self):
+        from benchmarks.crawl import incomplete
+        assert incomplete([
+            {'name': 'Custom OS...', 'source': 'Local', 'variants': {'': {'url': ''}}},
+            {'name': 'Good', 'variants': {'x86_64': {'url': 'u', 'sha256': 's'}}},
+            {'name': 'No checksum', 'variants': {'x86_64': {'url': 'u', 'sha256': ''}}},
+            {'name': 'No variants', 'variants': {}},
+        ]) == ['No checksum', 'No variants']
@@ -0,0 +1,20 @@
+import pytest
+
+
+class TestLazyConfig:
+
+    def test_file_is_not_read_until_used(self, tmpdir):
+        from liveusb.config import LazyConfig
+        config = LazyConfig(str(tmpdir.join('missing.yml')))
+        with pytest.raises(IOError):
+            config['DISTRO']
+
+    def test_loads_once(self, tmpdir):
+        pytest.importorskip('ruamel.yaml')
+        from liveusb.config import LazyConfig
+        filename = tmpdir.join('liveusb-creator.yml')
+        filename.write('DISTRO: Fedora\n')
+        config = LazyConfig(str(filename))
+        assert config['DISTRO'] == 'Fedora'
+        filename.remove()
+        assert dict(config) == {'DISTRO': 'Fedora'}
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from liveusb.creator import LiveUSBCreator
+
+from conftest import drive, Options
+
+
+class BlockingCreator(LiveUSBCreator):
+    """ Writes nothing, and only finishes once the test says so """
+    release = None
+
+    def verify_iso_sha1(self):
+        return None
+
+    def dd_image(self, update_function=None):
+        self.cancel_token.check()
+        if not self.release.wait(10):
+            raise Exception('not released')
+
+    def terminate(self):
+        pass
+
+
+class TestDaemon:
+
+    def _get_daemon(self, tmpdir, monkeypatch):
+        from liveusb.daemon import FlashDaemon, JobQueue
+        monkeypatch.setenv('TEMP', str(tmpdir))
+        BlockingCreator.release = threading.Event()
+        iso = tmpdir.join('test.iso')
+        iso.write(b'\0' * 4096, mode='wb')
+        queue = JobQueue(str(tmpdir.join('jobs.sqlite')))
+        return FlashDaemon(Options(), queue, BlockingCreator), str(iso)
+
+    def _wait_idle(self, daemon):
+        for thread in threading.enumerate():
+            if thread.name.startswith('flash-'):
+                thread.join(10)
+
+    def test_queue_persists(self, tmpdir):
+        from liveusb.daemon import JobQueue, QUEUED, RUNNING
+        path = str(tmpdir.join('jobs.sqlite'))
+        queue = JobQueue(path)
+        first = queue.submit('a.iso', name='SanDisk')
+        second = queue.submit('b.iso', '/dev/sdb')
+        assert queue.claim(first, '/dev/sdc')
+        assert not queue.claim(first, '/dev/sdd')
+        assert queue.cancel(second)
+        queue.close()
+        queue = JobQueue(path)
+        assert queue.requeue_running() == 1
+        assert [job['id'] for job in queue.jobs(QUEUED)] == [first]
+        assert queue.jobs(RUNNING) == []
+
+    def test_jobs_start_on_matching_drives(self, tmpdir, monkeypatch):
+        from liveusb.daemon import DONE
+        daemon, iso = self._get_daemon(tmpdir, monkeypatch)
+        first = daemon.submit(iso, name='sandisk')
+        second = daemon.submit(iso)
+        daemon.update_drives({'a': drive('/dev/sdb', 'SanDisk Cruzer')})
+        assert daemon.running == {first: '/dev/sdb'}
+        # a drive that was written to is not reused until it is replugged
+        BlockingCreator.release.set()
+        self._wait_idle(daemon)
+        assert daemon.queue.get(first)['state'] == DONE
+        assert daemon.running == {}
+        daemon.update_drives({})
+        daemon.update_drives({'a': drive('/dev/sdb')})
+        self._wait_idle(daemon)
+        assert daemon.queue.get(second)['target'] == '/dev/sdb'
+        assert daemon.queue.get(second)['state'] == DONE
+
+    def test_cancel_before_the_flash_starts(self, tmpdir, monkeypatch):
+        from liveusb.daemon import FlashDaemon, CANCELLED
+        daemon, iso = self._get_daemon(tmpdir, monkeypatch)
+        started = []
+        monkeypatch.setattr(daemon, 'flash', lambda job, drive: started.append((job, drive)))
+        job_id = daemon.submit(iso)
+        daemon.update_drives({'a': drive('/dev/sdb')})
+        assert daemon.running == {job_id: '/dev/sdb'}
+        # cancelled while running but before the flasher has a creator for it
+        assert daemon.cancel(job_id)
+        BlockingCreator.release.set()
+        FlashDaemon.flash(daemon, *started[0])
+        assert daemon.queue.get(job_id)['state'] == CANCELLED
+        assert daemon.running == {}
+        assert not daemon.flasher._terminated
+        # too late for a job that is over
+        assert not daemon.cancel(job_id)
+        assert not daemon.flasher._terminated
+
+    def test_control_socket_is_never_world_accessible(self, tmpdir, monkeypatch):
+        import os
+        import stat
+        daemon, iso = self._get_daemon(tmpdir, monkeypatch)
+        path = str(tmpdir.join('control.sock'))
+        # as it is right after the bind
+        monkeypatch.setattr(os, 'chmod', lambda path, mode: None)
+        umask = os.umask(0)
+        try:
+            server = daemon.listen(path)
+        finally:
+            os.umask(umask)
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_control_socket(self, tmpdir, monkeypatch):
+        from liveusb import LiveUSBError
+        from liveusb.daemon import DaemonClient, QUEUED, CANCELLED
+        daemon, iso = self._get_daemon(tmpdir, monkeypatch)
+        path = str(tmpdir.join('control.sock'))
+        server = daemon.listen(path)
+        try:
+            client = DaemonClient(path)
+            job_id = client.submit(iso, device='/dev/sdz')
+            assert client.job(job_id)['state'] == QUEUED
+            assert client.cancel(job_id)
+            assert [job['state'] for job in client.jobs()] == [CANCELLED]
+            assert client.drives() == []
+            with pytest.raises(LiveUSBError):
+                client.submit(str(tmpdir.join('missing.iso')))
+            with pytest.raises(LiveUSBError):
+                client.request('frobnicate')
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,99 @@
+import bz2
+import gzip
+import lzma
+import os
+import sys
+
+import pytest
+
+
+def compressed(tmpdir, format, data):
+    path = str(tmpdir.join('image.%s' % format))
+    if format == 'xz':
+        content = lzma.compress(data[:len(data) // 2]) + lzma.compress(data[len(data) // 2:])
+    elif format == 'gzip':
+        content = gzip.compress(data)
+    elif format == 'bzip2':
+        content = bz2.compress(data)
+    with open(path, 'wb') as image:
+        image.write(content)
+    return path
+
+
+class TestDecompress:
+
+    @pytest.mark.parametrize('format', ['xz', 'gzip', 'bzip2'])
+    @pytest.mark.parametrize('tools', [True, False])
+    def test_reads_the_raw_image(self, tmpdir, format, tools):
+        from liveusb import decompress
+        data = os.urandom(3 * 1024 ** 2 + 17)
+        path = compressed(tmpdir, format, data)
+        assert decompress.detect(path) == format
+        with decompress.DecompressedImage(path, format, tools) as image:
+            chunks = []
+            while True:
+                chunk = image.read(1024 ** 2)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            assert b''.join(chunks) == data
+            assert image.fraction(len(data)) == 1.0
+
+    def test_sizes(self, tmpdir):
+        from liveusb import decompress
+        data = os.urandom(1024 ** 2)
+        assert decompress.uncompressed_size(compressed(tmpdir, 'xz', data)) == len(data)
+        assert decompress.uncompressed_size(compressed(tmpdir, 'gzip', data)) is None
+        plain = tmpdir.join('plain.iso')
+        plain.write(data, mode='wb')
+        assert decompress.detect(str(plain)) is None
+        assert decompress.image_size(str(plain)) == len(data)
+        frame = b'\x28\xb5\x2f\xfd\x20\x10'  # single segment, one byte size
+        assert decompress._zstd_size(frame) == 16
+
+    def test_corrupt_image(self, tmpdir):
+        from liveusb import LiveUSBError, decompress
+        path = compressed(tmpdir, 'xz', os.urandom(1024 ** 2))
+        with open(path, 'r+b') as image:
+            image.seek(100)
+            image.write(b'\0' * 64)
+        with pytest.raises(LiveUSBError):
+            with decompress.open_image(path, tools=False) as image:
+                while image.read():
+                    pass
+
+    def test_chatty_decompressor(self, tmpdir, monkeypatch):
+        from liveusb import LiveUSBError, decompress
+        # well past what a pipe holds before the writer blocks
+        script = ('import gzip, sys\n'
+                  'for n in range(20000): sys.stderr.write("warning %d\\n" % n)\n'
+                  'sys.stderr.flush()\n'
+                  'sys.stdout.buffer.write(gzip.decompress(sys.stdin.buffer.read()))\n'
+                  'sys.exit(int(sys.argv[1]))\n')
+        data = os.urandom(1024 ** 2)
+        path = compressed(tmpdir, 'gzip', data)
+        monkeypatch.setitem(decompress.FORMATS, 'gzip',
+                            (b'\x1f\x8b', [[sys.executable, '-c', script, '0']]))
+        with decompress.open_image(path) as image:
+            assert decompress.read_full(image, 2 * len(data)) == data
+        monkeypatch.setitem(decompress.FORMATS, 'gzip',
+                            (b'\x1f\x8b', [[sys.executable, '-c', script, '1']]))
+        with pytest.raises(LiveUSBError) as error:
+            with decompress.open_image(path) as image:
+                while image.read():
+                    pass
+        assert str(error.value).endswith('warning 19999')
+        assert 'warning 19949' not in str(error.value)
+
+    def test_writes_a_compressed_image(self, tmpdir):
+        from liveusb.writer import ImageWriter
+        data = os.urandom(6 * 1024 ** 2)
+        path = compressed(tmpdir, 'gzip', data)
+        target = tmpdir.join('drive')
+        target.write(b'\xff' * len(data), mode='wb')
+        progress = []
+        writer = ImageWriter(path, str(target), progress=progress.append)
+        assert writer.write() == len(data)
+        assert progress[-1] == 1.0
+        with open(str(target), 'rb') as drive:
+            assert drive.read() == data
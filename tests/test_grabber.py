@@ -0,0 +1,287 @@
+import hashlib
+import os
+
+import pytest
+
+MB = 1024 ** 2
+
+
+class Parent(object):
+    beingCancelled = False
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class TestGrabber:
+
+    def test_mirror_urls(self):
+        from liveusb.grabber import mirror_urls
+        url = 'https://dl.example.org/pub/fedora/23/Fedora.iso'
+        assert mirror_urls(url, 'https://dl.example.org/', ['http://a/fedora', 'http://b/']) == [
+            'http://a/fedora/pub/fedora/23/Fedora.iso', 'http://b/pub/fedora/23/Fedora.iso']
+        assert mirror_urls('https://elsewhere/Fedora.iso', 'https://dl.example.org', ['http://a']) == []
+
+    def test_resume(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb import LiveUSBError
+        from liveusb.grabber import download, PartialFile
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(3 * MB + 7))
+            mirror.reset(after=MB)
+            with pytest.raises(LiveUSBError):
+                download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir))
+            # allocated in full, but what was still unread when the reset came is lost
+            assert os.path.getsize(str(tmpdir.join('test.iso.part'))) == image.size
+            partial = PartialFile.load(str(tmpdir.join('test.iso.part'))).valid()
+            sizes = []
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir),
+                            update_current=sizes.append)
+            assert sizes[-1] == image.size
+            assert mirror.statuses[206] == (1 if partial else 0)
+            with open(path, 'rb') as downloaded:
+                assert downloaded.read() == image.read(0, image.size)
+            assert os.listdir(str(tmpdir)) == ['test.iso']
+
+    @pytest.mark.parametrize('segments', [1, 3])
+    def test_hasher(self, tmpdir, segments):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        from liveusb.hashing import MultiHasher
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(5 * MB + 11, seed=2))
+            # picked up where an earlier download stopped
+            with open(str(tmpdir.join('test.iso.part')), 'wb') as partial:
+                partial.write(image.read(0, 2 * MB + 5))
+            hasher = MultiHasher(['md5', 'sha256'])
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir),
+                            segments=segments, hasher=hasher)
+            assert hasher.hexdigests()['sha256'] == image.sha256()
+            with open(path, 'rb') as downloaded:
+                assert hashlib.md5(downloaded.read()).hexdigest() == hasher.hexdigests()['md5']
+
+    def test_hasher_already_downloaded(self, tmpdir):
+        pytest.importorskip('requests')
+        from liveusb.grabber import download
+        from liveusb.hashing import MultiHasher
+        data = os.urandom(MB + 3)
+        tmpdir.join('test.iso').write(data, mode='wb')
+        hasher = MultiHasher(['md5', 'sha256'])
+        # nothing is fetched, so nothing needs to listen at the url
+        path = download(Parent('test.iso'), 'http://127.0.0.1:9/test.iso', str(tmpdir),
+                        hasher=hasher)
+        hasher.close()
+        assert path == str(tmpdir.join('test.iso'))
+        assert hasher.hexdigests() == {'md5': hashlib.md5(data).hexdigest(),
+                                       'sha256': hashlib.sha256(data).hexdigest()}
+
+    def test_keeps_the_connections(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        with LocalMirror() as mirror:
+            mirror.add('test.iso', PatternFile(16 * MB))
+            connections = []
+            handle = mirror._server.finish_request
+            mirror._server.finish_request = lambda *args: (connections.append(args[1]),
+                                                           handle(*args))
+            download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir), segments=2)
+            # the probe, then one connection per worker for all of its pieces
+            assert mirror.statuses[206] > 3 and len(connections) == 3
+
+    def test_partial_file(self, tmpdir):
+        from liveusb.grabber import PartialFile
+        path = str(tmpdir.join('test.iso.part'))
+        tmpdir.join('test.iso.part').write(b'x' * 100, mode='wb')
+        # from before the extents were recorded
+        assert PartialFile.load(path).valid() == 100
+        partial = PartialFile(path)
+        partial.reset(1000, '"etag"')
+        partial.add(500, 600)
+        partial.add(0, 100)
+        partial.add(100, 200)
+        partial.add(550, 700)
+        assert partial.extents == [[0, 200], [500, 700]]
+        assert partial.valid() == 200 and partial.downloaded() == 400
+        assert partial.missing(1000) == [(200, 500), (700, 1000)]
+        with open(path, 'r+b') as f:
+            partial.save(f)
+        loaded = PartialFile.load(path)
+        assert (loaded.size, loaded.etag, loaded.extents) == (1000, '"etag"', partial.extents)
+        tmpdir.join('test.iso.part.extents').write('{')
+        assert PartialFile.load(path).valid() == 0
+
+    def test_not_enough_space(self, tmpdir, monkeypatch):
+        pytest.importorskip('requests')
+        import collections
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb import LiveUSBError
+        from liveusb.grabber import download
+        usage = collections.namedtuple('usage', 'total used free')
+        monkeypatch.setattr('shutil.disk_usage', lambda path: usage(8 * MB, 6 * MB, 2 * MB))
+        with LocalMirror() as mirror:
+            mirror.add('test.iso', PatternFile(64 * MB))
+            # the release size is checked before connecting
+            with pytest.raises(LiveUSBError) as error:
+                download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir), size=64 * MB)
+            assert 'not enough free space' in str(error.value)
+            assert mirror.requests == 0
+            # and the Content-Length before the download
+            for segments in (1, 2):
+                with pytest.raises(LiveUSBError):
+                    download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir),
+                             segments=segments)
+            # no more than what was on its way when the download was refused
+            assert mirror.bytes_sent < 16 * MB
+
+    def test_segmented_resume(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb import LiveUSBError
+        from liveusb.grabber import download, PartialFile
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(12 * MB + 1, seed=3))
+
+            def went_away(size):
+                if size >= 5 * MB:
+                    mirror.files.pop('test.iso', None)
+            with pytest.raises(LiveUSBError):
+                download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir), segments=2,
+                         update_current=went_away)
+            mirror.add('test.iso', image)
+            partial = PartialFile.load(str(tmpdir.join('test.iso.part')))
+            assert partial.size == image.size and partial.downloaded()
+            sent = mirror.bytes_sent
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir), segments=2)
+            assert mirror.bytes_sent - sent <= image.size - partial.downloaded() + 1
+            with open(path, 'rb') as downloaded:
+                assert hashlib.sha256(downloaded.read()).hexdigest() == image.sha256()
+            assert os.listdir(str(tmpdir)) == ['test.iso']
+
+    def test_complete_partial(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download, PartialFile
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(MB))
+            path = str(tmpdir.join('test.iso.part'))
+            image.write(path)
+            partial = PartialFile(path)
+            partial.reset(image.size, image.etag)
+            partial.add(0, image.size)
+            with open(path, 'rb') as f:
+                partial.save(f)
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir))
+            assert mirror.statuses == {416: 1}
+            assert path == str(tmpdir.join('test.iso')) and os.path.exists(path)
+            assert os.listdir(str(tmpdir)) == ['test.iso']
+
+    def test_killed_before_the_first_checkpoint(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+
+        class Killed(BaseException):
+            pass
+
+        def kill(size):
+            raise Killed()
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(3 * MB + 7))
+            with pytest.raises(Killed):
+                download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir),
+                         update_current=kill)
+            # allocated in full, with nothing recorded as downloaded
+            assert os.path.getsize(str(tmpdir.join('test.iso.part'))) == image.size
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir))
+            assert mirror.statuses == {200: 2}
+            with open(path, 'rb') as downloaded:
+                assert downloaded.read() == image.read(0, image.size)
+
+    def test_full_size_part_without_extents(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        with LocalMirror() as mirror:
+            image = mirror.add('test.iso', PatternFile(2 * MB))
+            # allocated, but killed before the extents were recorded
+            with open(str(tmpdir.join('test.iso.part')), 'wb') as part:
+                part.truncate(image.size)
+            path = download(Parent('test.iso'), mirror.url('test.iso'), str(tmpdir))
+            assert mirror.statuses == {416: 1, 200: 1}
+            with open(path, 'rb') as downloaded:
+                assert downloaded.read() == image.read(0, image.size)
+            # known to be as big as the download, it isn't even asked for
+            image.write(str(tmpdir.join('other.iso.part')))
+            mirror.add('other.iso', image)
+            download(Parent('other.iso'), mirror.url('other.iso'), str(tmpdir), size=image.size)
+            assert mirror.statuses == {416: 1, 200: 2}
+
+    @pytest.mark.parametrize('mirrors', [0, 2])
+    def test_segmented(self, tmpdir, mirrors):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        servers = [LocalMirror(latency=0.005).start() for i in range(mirrors + 1)]
+        try:
+            image = PatternFile(9 * MB + 3, seed=4)
+            for server in servers:
+                server.add('test.iso', image)
+            servers[0].redirect('pub/test.iso', servers[0].url('test.iso'))
+            servers[0].reset(after=MB // 2, count=2)
+            sizes = []
+            path = download(Parent('test.iso'), servers[0].url('pub/test.iso'), str(tmpdir),
+                            update_maximum=sizes.append, segments=3,
+                            mirrors=[server.url('test.iso') for server in servers[1:]])
+            assert sizes == [image.size]
+            with open(path, 'rb') as downloaded:
+                assert hashlib.sha256(downloaded.read()).hexdigest() == image.sha256()
+            if mirrors:
+                assert all(server.statuses[206] for server in servers)
+        finally:
+            for server in servers:
+                server.stop()
+
+    def test_mirrors_with_their_own_etags(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        servers = [LocalMirror(latency=0.005).start() for i in range(4)]
+        try:
+            image = PatternFile(12 * MB + 3, seed=5)
+            servers[0].add('test.iso', image)
+            servers[1].add('test.iso', image, etag='"elsewhere"')
+            servers[2].add('test.iso', image, etag='"changes"')
+            servers[3].add('test.iso', PatternFile(4 * MB))  # another file
+
+            def update(size):
+                if size >= 4 * MB:
+                    # what the probe saw no longer goes
+                    servers[2].etags['test.iso'] = '"changed"'
+            path = download(Parent('test.iso'), servers[0].url('test.iso'), str(tmpdir),
+                            update_current=update, segments=4,
+                            mirrors=[server.url('test.iso') for server in servers[1:]])
+            with open(path, 'rb') as downloaded:
+                assert hashlib.sha256(downloaded.read()).hexdigest() == image.sha256()
+            assert servers[1].statuses[206] > 1 and not servers[1].statuses[200]
+            # only probed
+            assert servers[3].statuses == {206: 1}
+        finally:
+            for server in servers:
+                server.stop()
+
+    def test_segmented_cancel(self, tmpdir):
+        pytest.importorskip('requests')
+        from benchmarks.mirror import LocalMirror, PatternFile
+        from liveusb.grabber import download
+        parent = Parent('test.iso')
+
+        def cancel(size):
+            parent.beingCancelled = True
+        with LocalMirror() as mirror:
+            mirror.add('test.iso', PatternFile(8 * MB))
+            assert download(parent, mirror.url('test.iso'), str(tmpdir),
+                            update_current=cancel, segments=2) is None
+        assert os.listdir(str(tmpdir)) == []
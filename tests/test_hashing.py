@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+import pytest
+
+from conftest import Options
+
+OPTIONS = dict(noverify=False, hash='md5,sha256', liveos_checksum=True,
+               device_checksum=True)
+
+
+class TestHashing:
+
+    def test_algorithms(self):
+        from liveusb import LiveUSBError
+        from liveusb.hashing import algorithms
+        assert algorithms('sha1') == ['sha1']
+        assert algorithms('SHA256, md5,sha256') == ['sha256', 'md5']
+        with pytest.raises(LiveUSBError):
+            algorithms('sha1,crc32')
+
+    @pytest.mark.parametrize('names', [['sha1'], ['md5', 'sha1', 'sha256', 'sha512', 'blake2b']])
+    def test_hash_file(self, tmpdir, names):
+        from liveusb.hashing import hash_file
+        data = os.urandom(5 * 1024 ** 2 + 3)
+        path = tmpdir.join('test.iso')
+        path.write(data, mode='wb')
+        read = []
+        checksums = hash_file(str(path), names, read.append, block_size=1024 ** 2)
+        assert checksums == dict((name, hashlib.new(name, data).hexdigest()) for name in names)
+        assert read[-1] == len(data)
+        limited = hash_file(str(path), names, limit=1000)
+        assert limited == dict((name, hashlib.new(name, data[:1000]).hexdigest()) for name in names)
+
+    def test_creator_checksums(self, tmpdir):
+        from liveusb.creator import Drive, LiveUSBCreator
+        data = os.urandom(3 * 1024 ** 2)
+        iso = tmpdir.join('test.iso')
+        iso.write(data, mode='wb')
+        device = tmpdir.join('drive')
+        device.write(data + b'\0' * 1024, mode='wb')
+        drive = Drive()
+        drive.device = str(device)
+        drive.size = len(data) + 1024
+
+        live = LiveUSBCreator(Options(**OPTIONS))
+        live.drives = {drive.device: drive}
+        live.drive = drive.device
+        live.set_iso(str(iso))
+        release = {'sha256': hashlib.sha256(data).hexdigest()}
+        live.get_release_from_iso = lambda: release
+        assert live.verify_iso_sha1()
+        assert live.checksums['iso']['md5'] == hashlib.md5(data).hexdigest()
+        live.verify_image()
+        live.calculate_checksums()
+        assert live.checksums['liveos']['sha256'] == release['sha256']
+        assert live.checksums['device']['md5'] == hashlib.md5(data + b'\0' * 1024).hexdigest()
+
+        release['sha256'] = '0' * 64
+        assert live.verify_iso_sha1() is False
+
+    def test_known_checksums(self, tmpdir):
+        from liveusb.creator import LiveUSBCreator
+        data = os.urandom(1024 ** 2)
+        iso = tmpdir.join('Fedora.iso')
+        iso.write(data, mode='wb')
+        live = LiveUSBCreator(Options(**OPTIONS))
+        live.set_iso(str(iso))
+        # the checksums are those of the variant the ISO is
+        release = {'variants': {
+            'x86_64': {'url': 'https://dl/Fedora.iso', 'sha256': hashlib.sha256(data).hexdigest().upper()},
+            'i386': {'url': 'https://dl/Fedora-i386.iso', 'sha256': '0' * 64}}}
+        live.get_release_from_iso = lambda: release
+        assert live.release_checksums(release) == {'sha256': hashlib.sha256(data).hexdigest()}
+        assert live.verify_iso_sha1()
+        # hashed as it was downloaded, it isn't read again
+        known = dict((name, '1' * 64) for name in ('md5', 'sha256'))
+        live.add_known_checksums(str(iso), known)
+        assert live.verify_iso_sha1() is False
+        assert live.checksums['iso'] == known
+        # unless it changed since
+        iso.write(data, mode='wb')
+        os.utime(str(iso), (0, 0))
+        assert live.verify_iso_sha1()
+
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import struct
+
+import pytest
+
+SECTOR = 2048
+
+
+def make_iso(tmpdir, sectors=1500, skipsectors=15, fragmentcount=20):
+    """ Build a minimal ISO and implant its MD5 like implantisomd5 does """
+    pvd = bytearray(SECTOR)
+    pvd[0:7] = b'\x01CD001\x01'
+    pvd[80:84] = struct.pack('<I', sectors)
+    pvd[84:88] = struct.pack('>I', sectors)
+    pvd[883:883 + 512] = b' ' * 512
+    terminator = b'\xffCD001\x01' + bytes(SECTOR - 7)
+    image = bytearray(bytes(16 * SECTOR) + bytes(pvd) + terminator
+                      + os.urandom((sectors - 18) * SECTOR))
+
+    total = sectors * SECTOR - skipsectors * SECTOR
+    fragment_size = total // (fragmentcount + 1)
+    chunk = min(16 * SECTOR, fragment_size)
+    md5 = hashlib.md5()
+    sums = ''
+    previous = 0
+    for offset in range(0, total, chunk):
+        md5.update(bytes(image[offset:min(offset + chunk, total)]))
+        fragment = offset // fragment_size
+        if fragment != previous:
+            digest = md5.copy().digest()
+            sums += ''.join(('%x' % byte)[0] for byte in digest[:60 // fragmentcount])
+            previous = fragment
+    appdata = ('ISO MD5SUM = %s;SKIPSECTORS = %d;RHLISOSTATUS=0;FRAGMENT SUMS = %s;'
+               'FRAGMENT COUNT = %d;THIS IS NOT THE SAME AS RUNNING MD5SUM ON THIS ISO!!'
+               % (md5.hexdigest(), skipsectors, sums, fragmentcount)).encode('ascii')
+    image[16 * SECTOR + 883:16 * SECTOR + 883 + len(appdata)] = appdata
+    path = tmpdir.join('test.iso')
+    path.write(bytes(image), mode='wb')
+    return str(path)
+
+
+def corrupt(path, offset):
+    with open(path, 'r+b') as image:
+        image.seek(offset)
+        byte = image.read(1)
+        image.seek(offset)
+        image.write(bytes([byte[0] ^ 0xff]))
+
+
+class TestImplantedMD5:
+
+    def test_parse(self, tmpdir):
+        from liveusb.isomd5 import ImplantedMD5
+        implanted = ImplantedMD5.from_file(make_iso(tmpdir))
+        assert implanted.skipsectors == 15
+        assert implanted.fragmentcount == 20
+        assert len(implanted.fragmentsums) == 60
+        assert implanted.isosize == 1500 * SECTOR
+        plain = tmpdir.join('plain.iso')
+        plain.write(bytes(64 * SECTOR), mode='wb')
+        assert ImplantedMD5.from_file(str(plain)) is None
+
+    @pytest.mark.parametrize('block_size', [1000, 32 * 1024, 1024 ** 2])
+    def test_check_any_block_size(self, tmpdir, block_size):
+        from liveusb.isomd5 import checker
+        path = make_iso(tmpdir)
+        md5 = checker(path)
+        with open(path, 'rb') as image:
+            while True:
+                block = image.read(block_size)
+                if not block:
+                    break
+                md5.update(block)
+        md5.close()
+        assert md5.offset == md5.total_size
+
+    def test_fragments_smaller_than_a_chunk(self, tmpdir):
+        from liveusb.isomd5 import ImplantedMD5Error, check_file
+        path = make_iso(tmpdir, sectors=60)
+        assert check_file(path)
+        corrupt(path, 30 * SECTOR)
+        with pytest.raises(ImplantedMD5Error) as error:
+            check_file(path)
+        assert 'fragment' in str(error.value)
+
+    def test_corruption(self, tmpdir):
+        from liveusb.isomd5 import ImplantedMD5Error, check_file
+        path = make_iso(tmpdir)
+        assert check_file(path)
+        corrupt(path, 100 * SECTOR)
+        with pytest.raises(ImplantedMD5Error) as error:
+            check_file(path)
+        assert 'fragment' in str(error.value)
+        # the skipped sectors at the end are not covered
+        path = make_iso(tmpdir)
+        corrupt(path, 1495 * SECTOR)
+        assert check_file(path)
+
+    def test_write_rejects_a_corrupt_image(self, tmpdir):
+        from liveusb import LiveUSBError
+        from liveusb.isomd5 import checker
+        from liveusb.writer import ImageWriter, HEAD_SIZE
+        path = make_iso(tmpdir)
+        target = tmpdir.join('drive')
+        target.write(b'\xff' * os.path.getsize(path), mode='wb')
+        writer = ImageWriter(path, str(target), consumers=[checker(path)])
+        writer.write()
+        assert writer.fed
+
+        corrupt(path, 1400 * SECTOR)  # after the last fragment
+        with pytest.raises(LiveUSBError):
+            ImageWriter(path, str(target), consumers=[checker(path)]).write()
+        with open(str(target), 'rb') as drive:
+            assert drive.read(HEAD_SIZE) == bytes(HEAD_SIZE)
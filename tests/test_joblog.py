@@ -0,0 +1,42 @@
+import logging
+import os
+
+
+class TestJobLog:
+
+    def _get_logger(self, name):
+        logger = logging.getLogger('test.joblog.%s' % name)
+        logger.setLevel(logging.DEBUG)
+        return logger
+
+    def test_jobs_only_get_their_own_records(self, tmpdir):
+        from liveusb.joblog import JobLog
+        logger = self._get_logger('jobs')
+        first = JobLog('/dev/sdx', 'first.iso', directory=str(tmpdir))
+        second = JobLog('/dev/sdy', 'second.iso', directory=str(tmpdir))
+        first.start(logger)
+        second.start(logger)
+        logging.LoggerAdapter(logger, {'job': first.id}).info('for the first job')
+        logging.LoggerAdapter(logger, {'job': second.id}).info('for the second job')
+        logger.info('for nobody')
+        first.finish()
+        second.finish(Exception('boom'))
+
+        with open(first.path) as f:
+            content = f.read()
+        assert 'for the first job' in content
+        assert 'for the second job' not in content
+        assert 'for nobody' not in content
+        assert 'finished in' in content
+        with open(second.path) as f:
+            assert 'failed after' in f.read()
+        assert not logger.handlers
+
+    def test_old_job_logs_are_pruned(self, tmpdir):
+        from liveusb.joblog import prune_job_logs
+        for i in range(5):
+            path = os.path.join(str(tmpdir), 'job-%d.log' % i)
+            open(path, 'w').close()
+            os.utime(path, (i, i))
+        prune_job_logs(str(tmpdir), keep=2)
+        assert sorted(os.listdir(str(tmpdir))) == ['job-3.log', 'job-4.log']
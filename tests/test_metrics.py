@@ -0,0 +1,66 @@
+import pytest
+
+
+class TestMetrics:
+
+    def test_histogram_and_counter_format(self):
+        from liveusb.metrics import Counter, Histogram
+        counter = Counter('test_bytes_total', 'Bytes.', ['device'])
+        counter.inc(10, device='/dev/sdb')
+        counter.inc(5, device='/dev/sdb')
+        assert counter.render()[2:] == ['test_bytes_total{device="/dev/sdb"} 15']
+        histogram = Histogram('test_seconds', 'Time.', [1, 10])
+        histogram.observe(0.5)
+        histogram.observe(5)
+        assert histogram.render()[2:] == [
+            'test_seconds_bucket{le="1"} 1',
+            'test_seconds_bucket{le="10"} 2',
+            'test_seconds_bucket{le="+Inf"} 2',
+            'test_seconds_sum 5.5',
+            'test_seconds_count 2',
+        ]
+
+    def test_failures_are_counted_by_type(self):
+        from liveusb import metrics
+        before = metrics.FAILURES.value(operation='write', error='ENOSPC')
+        with pytest.raises(OSError):
+            with metrics.timed('write'):
+                raise OSError(28, 'No space left on device')
+        assert metrics.FAILURES.value(operation='write', error='ENOSPC') == before + 1
+
+    def test_measured_creator_method(self, tmpdir):
+        from liveusb import metrics
+
+        class Creator(object):
+            drive = type('Drive', (), {'device': '/dev/test-measured'})
+
+            @metrics.measured('write', metrics.record_write, 'written')
+            def dd_image(self, fail=False):
+                self.written = 1024 ** 2
+                if fail:
+                    raise OSError(5, 'Input/output error')
+                return 'written'
+
+        assert Creator().dd_image() == 'written'
+        assert metrics.BYTES_WRITTEN.value(device='/dev/test-measured') == 1024 ** 2
+        speeds = metrics.WRITE_SPEED.count()
+        # what a failed write wrote counts too, but not for the speed
+        with pytest.raises(OSError):
+            Creator().dd_image(fail=True)
+        assert metrics.BYTES_WRITTEN.value(device='/dev/test-measured') == 2 * 1024 ** 2
+        assert metrics.WRITE_SPEED.count() == speeds
+        path = str(tmpdir.join('liveusb.prom'))
+        metrics.write_textfile(path)
+        with open(path) as prom:
+            assert 'liveusb_written_bytes_total{device="/dev/test-measured"} 2097152' in prom.read()
+
+    def test_http_exporter(self):
+        from urllib.request import urlopen
+        from liveusb import metrics
+        server = metrics.serve(0)
+        try:
+            reply = urlopen('http://127.0.0.1:%d/metrics' % server.server_address[1])
+            assert b'# TYPE liveusb_failures_total counter' in reply.read()
+        finally:
+            server.shutdown()
+            server.server_close()
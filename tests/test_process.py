@@ -0,0 +1,52 @@
+import logging
+import sys
+
+import pytest
+
+
+class TestProcessRunner:
+
+    def _get_runner(self, **kw):
+        from liveusb.process import ProcessRunner
+        return ProcessRunner(logging.getLogger('test'), **kw)
+
+    def test_streams_lines(self):
+        runner = self._get_runner()
+        lines = []
+        result = runner.run([sys.executable, '-c',
+                             'import sys; print("out"); print("err", file=sys.stderr)'],
+                            line_callback=lines.append)
+        assert result.returncode == 0
+        assert result.stdout == ['out']
+        assert result.stderr == ['err']
+        assert sorted(lines) == ['err', 'out']
+
+    def test_output_is_bounded(self):
+        runner = self._get_runner(max_lines=10)
+        result = runner.run([sys.executable, '-c',
+                             'for i in range(100): print(i)'])
+        assert result.stdout == [str(i) for i in range(90, 100)]
+        assert len(runner.history) == 10
+
+    def test_failure_raises(self):
+        from liveusb import LiveUSBError
+        runner = self._get_runner()
+        with pytest.raises(LiveUSBError):
+            runner.run([sys.executable, '-c', 'raise SystemExit(3)'])
+        result = runner.run([sys.executable, '-c', 'raise SystemExit(3)'],
+                            passive=True)
+        assert result.returncode == 3
+
+    def test_timeout_kills_child(self):
+        from liveusb import LiveUSBError
+        runner = self._get_runner()
+        with pytest.raises(LiveUSBError):
+            runner.run([sys.executable, '-c', 'import time; time.sleep(30)'],
+                       timeout=0.5)
+        assert runner.pids == []
+
+    def test_runners_do_not_share_history(self):
+        first, second = self._get_runner(), self._get_runner()
+        first.run([sys.executable, '-c', 'print("first")'])
+        assert 'first' in first.history
+        assert not second.history
@@ -0,0 +1,32 @@
+import json
+import sys
+
+
+class TestStartupProfiler:
+
+    def test_spans_nest(self):
+        from liveusb.profiling import StartupProfiler
+        profiler = StartupProfiler()
+        with profiler.span('outer'):
+            with profiler.span('inner'):
+                pass
+        outer, inner = profiler.spans
+        assert inner.depth == outer.depth + 1
+        assert outer.children == inner.duration
+        assert 'outer' in profiler.summary()
+
+    def test_imports_are_timed(self, tmpdir):
+        from liveusb.profiling import StartupProfiler
+        sys.modules.pop('colorsys', None)
+        profiler = StartupProfiler('test')
+        profiler.install_import_hook()
+        try:
+            import colorsys
+        finally:
+            profiler.remove_import_hook()
+        assert colorsys.rgb_to_hsv(0, 0, 0)
+        assert 'colorsys' in [r.name for r in profiler.spans if r.category == 'import']
+
+        trace = json.load(open(profiler.write_trace(str(tmpdir.join('trace.json')))))
+        assert trace['metadata']['version'] == 'test'
+        assert trace['traceEvents'][0]['ph'] == 'X'
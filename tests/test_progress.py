@@ -0,0 +1,49 @@
+class FakeClock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressMeter:
+
+    def _get_meter(self, total=None):
+        from liveusb.progress import ProgressMeter
+        reports = []
+        clock = FakeClock()
+        meter = ProgressMeter(lambda *args: reports.append(args), total=total,
+                              rate=10, clock=clock)
+        return meter, reports, clock
+
+    def test_updates_are_coalesced(self):
+        meter, reports, clock = self._get_meter(total=1000)
+        for i in range(100):
+            clock.now = i * 0.01
+            meter.update(i)
+        # one report to start with, then one every 0.1s
+        assert len(reports) == 10
+        assert reports[0][0] == 0
+
+    def test_final_update_always_passes(self):
+        meter, reports, clock = self._get_meter(total=100)
+        meter.update(0)
+        clock.now = 0.01
+        meter.update(100)
+        assert reports[-1][0] == 100
+
+    def test_speed_and_eta(self):
+        meter, reports, clock = self._get_meter(total=1000)
+        meter.update(0)
+        for i in range(1, 5):
+            clock.now = float(i)
+            meter.update(i * 100)
+        done, speed, eta = reports[-1]
+        assert speed == 100
+        assert eta == 6
+
+    def test_unknown_total(self):
+        meter, reports, clock = self._get_meter()
+        meter.update(0)
+        clock.now = 1.0
+        meter.update(50)
+        assert reports[-1] == (50, 50, -1)
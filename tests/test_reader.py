@@ -0,0 +1,44 @@
+import lzma
+import os
+
+
+class TestBlockReader:
+
+    def test_blocks(self, tmpdir):
+        from liveusb.reader import BlockReader
+        data = os.urandom(5 * 4096 + 100)
+        path = tmpdir.join('test.iso')
+        path.write(data, mode='wb')
+        with BlockReader(str(path), 4096) as reader:
+            blocks = [block.tobytes() for block in reader]
+        assert b''.join(blocks) == data
+        assert [len(block) for block in blocks] == [4096] * 5 + [100]
+        with BlockReader(str(path), 4096, limit=5000) as reader:
+            assert b''.join(block.tobytes() for block in reader) == data[:5000]
+
+    def test_buffers_are_reused(self, tmpdir):
+        from liveusb.reader import BlockReader
+        path = tmpdir.join('test.iso')
+        path.write(os.urandom(4 * 4096), mode='wb')
+        with BlockReader(str(path), 4096, buffers=2) as reader:
+            first, second, third = reader.read(), reader.read(), reader.read()
+            assert first.obj is third.obj
+            assert first.obj is not second.obj
+
+    def test_reads_decompressed_images(self, tmpdir):
+        from liveusb.decompress import read_blocks
+        data = os.urandom(3 * 1024 ** 2 + 1)
+        path = tmpdir.join('test.img.xz')
+        path.write(lzma.compress(data), mode='wb')
+        with read_blocks(str(path)) as reader:
+            assert b''.join(block.tobytes() for block in reader) == data
+
+    def test_same(self):
+        from liveusb.reader import same
+        a = memoryview(bytearray(b'x' * 4096))
+        b = memoryview(bytearray(b'x' * 4096))
+        assert same(a, b)
+        b[4095] = 0
+        assert not same(a, b)
+        assert same(a[:13], a[:13])
+        assert not same(a[:13], b[:12])
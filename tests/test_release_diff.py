@@ -0,0 +1,44 @@
+def apply(old, new):
+    from liveusb.releases.diff import diff
+    rows = list(old)
+    touched = []
+    for op, row, arg in diff(old, new):
+        if op == 'remove':
+            del rows[row:arg + 1]
+        elif op == 'move':
+            rows.insert(arg, rows.pop(row))
+            touched.append(arg)
+        elif op == 'insert':
+            rows.insert(row, arg)
+            touched.append(row)
+        else:
+            touched.append(row)
+    return rows, touched
+
+
+class TestReleaseDiff:
+
+    def test_diff_applies(self):
+        cases = [
+            ('abcde', 'abcde'),
+            ('abcde', 'ace'),
+            ('abcde', 'abxcde'),
+            ('abcde', 'edcba'),
+            ('', 'abc'),
+            ('abc', ''),
+            ('abcdef', 'xfbyd'),
+        ]
+        for old, new in cases:
+            rows, touched = apply(old, new)
+            assert rows == list(new)
+            assert sorted(touched) == list(range(len(new)))
+
+    def test_unchanged_list_only_keeps(self):
+        from liveusb.releases.diff import diff
+        assert set(op for op, _, _ in diff('abc', 'abc')) == set(['keep'])
+
+    def test_duplicate_keys_are_numbered(self):
+        from liveusb.releases.diff import release_keys
+        separator = {'source': '', 'name': '', 'version': ''}
+        keys = release_keys([separator, dict(separator)])
+        assert keys[0] != keys[1]
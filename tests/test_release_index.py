@@ -0,0 +1,37 @@
+def release(name, summary='', source='Spins', variants=('x86_64',)):
+    return {'name': name, 'summary': summary, 'source': source,
+            'variants': dict((variant, {}) for variant in variants)}
+
+
+class TestReleaseIndex:
+
+    def _get_index(self):
+        from liveusb.releases.index import ReleaseIndex
+        return ReleaseIndex([
+            release('Custom OS...', source='Local', variants=()),
+            release('Workstation', 'Fedora for desktops', source='Fedora'),
+            release('', source=''),
+            release('KDE Plasma', 'A complete, modern desktop', variants=('i686',)),
+            release('Xfce', 'A light ÉDITION', variants=('x86_64', 'i686')),
+        ])
+
+    def accepted(self, index, arch='', search=''):
+        from liveusb.releases.index import normalize
+        bit = index.arch_bits.get(arch, 0)
+        return [row for row in range(len(index))
+                if index.accepts(row, bit, normalize(search))]
+
+    def test_arch_filter(self):
+        index = self._get_index()
+        assert self.accepted(index) == [0, 1, 2, 3, 4]
+        assert self.accepted(index, 'Intel 64bit') == [0, 1, 2, 4]
+        assert self.accepted(index, 'Intel 32bit') == [0, 2, 3, 4]
+        assert index.arch_names(index.entries[4].arches) == ['Intel 64bit', 'Intel 32bit']
+
+    def test_search_matches_name_and_summary(self):
+        index = self._get_index()
+        assert self.accepted(index, search='DESKTOP') == [1, 3]
+        assert self.accepted(index, 'Intel 32bit', 'desktop') == [3]
+        assert self.accepted(index, search='édition') == [4]
+        # the separator between name and summary is never matched across
+        assert self.accepted(index, search='workstationfedora') == []
@@ -0,0 +1,96 @@
+import io
+import threading
+
+import pytest
+
+from liveusb.creator import LiveUSBCreator
+
+from conftest import drive, Options
+
+
+class CopyingCreator(LiveUSBCreator):
+    """ Writes the image to a file standing in for the drive """
+
+    def verify_iso_sha1(self):
+        return None
+
+    def dd_image(self, update_function=None):
+        with open(self.iso, 'rb') as iso, open(self.drive.device, 'wb') as device:
+            device.write(iso.read())
+        update_function(1.0)
+
+    def terminate(self):
+        pass
+
+
+class TestStation:
+
+    def test_usb_location(self, tmpdir):
+        from liveusb.creator import usb_location
+        sysfs = tmpdir.mkdir('sys')
+        usb = sysfs.ensure('devices/pci0000:00/usb1/1-1/1-1.2', dir=True)
+        usb.join('idVendor').write('0781\n')
+        disk = usb.ensure('1-1.2:1.0/host6/target6:0:0/6:0:0:0', dir=True)
+        sysfs.ensure('class/block', dir=True).join('sdb').mksymlinkto(disk.ensure('block/sdb', dir=True))
+        disk.join('block/sdb/device').mksymlinkto(disk)
+        assert usb_location('/dev/sdb', str(sysfs)) == ('0781', '1-1.2')
+        assert usb_location('/dev/sdc', str(sysfs)) == ('', '')
+
+    def test_allow_list_is_required(self):
+        from liveusb import LiveUSBError
+        from liveusb.station import Station
+        with pytest.raises(LiveUSBError):
+            Station(Options(), 'test.iso', CopyingCreator)
+
+    def test_writes_newly_inserted_sticks(self, tmpdir, monkeypatch):
+        from liveusb.station import Station, DONE, FAILED, IGNORED, REPLUG, EMPTY
+        monkeypatch.setenv('TEMP', str(tmpdir))
+        iso = tmpdir.join('test.iso')
+        iso.write(b'\1' * 4096, mode='wb')
+        station = Station(Options(), str(iso), CopyingCreator,
+                          allow_ports=['1-1.*'], allow_vendors=['0781'],
+                          out=io.StringIO())
+        old = drive(str(tmpdir.join('sdb')), port='1-1.1')
+        station.update_drives({'b': old})
+        assert station.slots['1-1.1'].state == REPLUG
+
+        sticks = {'b': old,
+                  'c': drive(str(tmpdir.join('sdc')), port='1-1.2'),
+                  'd': drive(str(tmpdir.join('sdd')), port='2-1', vendor='0781'),
+                  'e': drive(str(tmpdir.join('sde')), port='2-2'),
+                  'f': drive(str(tmpdir.mkdir('sdf')), port='1-1.3')}
+        assert len(station.update_drives(sticks)) == 3
+        for thread in threading.enumerate():
+            if thread.name.startswith('flash-'):
+                thread.join(10)
+        assert station.slots['1-1.2'].state == DONE
+        assert station.slots['2-1'].state == DONE
+        assert station.slots['2-2'].state == IGNORED
+        assert station.slots['1-1.3'].state == FAILED
+        assert tmpdir.join('sdc').read_binary() == iso.read_binary()
+        assert 'sdc' in station.render()
+
+        station.update_drives({})
+        assert station.slots['1-1.1'].state == EMPTY
+        assert station.slots['1-1.2'].written == 1
+
+    def test_stick_replaced_during_a_write(self, tmpdir, monkeypatch):
+        from liveusb.station import Station, DONE, WRITING
+        station = Station(Options(), 'test.iso', CopyingCreator,
+                          allow_ports=['1-1.*'], out=io.StringIO())
+        monkeypatch.setattr(station.flasher, 'flash', lambda number, iso, drive: None)
+        station.update_drives({})
+        first = station.update_drives({'b': drive('/dev/sdb', port='1-1.1')})
+        station.update_drives({})
+        second = station.update_drives({'c': drive('/dev/sdc', port='1-1.1')})
+        # the same device node, for a third stick
+        station.update_drives({})
+        third = station.update_drives({'b': drive('/dev/sdb', port='1-1.1')})
+        slot = station.slots['1-1.1']
+        for number in first + second:
+            station.report('progress', job=number, phase='verify', written=9, size=10, speed=5)
+            station.report('done', job=number)
+        assert (slot.state, slot.fraction, slot.written) == (WRITING, 0.0, 0)
+        station.report('done', job=third[0])
+        assert (slot.state, slot.written) == (DONE, 1)
+        assert station.jobs == {}
@@ -0,0 +1,165 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+from conftest import Options
+
+MB = 1024 ** 2
+OPTIONS = dict(hash='sha256', liveos_checksum=False, device_checksum=False)
+
+
+def make_iso(tmpdir, size=4 * MB):
+    iso = tmpdir.join('test.iso')
+    iso.write(os.urandom(size), mode='wb')
+    return str(iso)
+
+
+def virtual_creator(tmpdir, monkeypatch, *specs):
+    from liveusb.virtual import VirtualDrive, VirtualLiveUSBCreator
+    monkeypatch.setattr('liveusb.journal.JOURNAL_DIR', str(tmpdir.join('journal')))
+    drives = []
+    for number, spec in enumerate(specs):
+        path = str(tmpdir.join('drive%d' % number))
+        drives.append(VirtualDrive.parse('path=%s,%s' % (path, spec)).create())
+    live = VirtualLiveUSBCreator(Options(**OPTIONS), drives)
+    live.detect_removable_drives()
+    return live, drives
+
+
+class TestVirtual:
+
+    def test_parse(self):
+        from liveusb import LiveUSBError
+        from liveusb.virtual import VirtualDrive, STALL, EIO
+        drive = VirtualDrive.parse('size=2G,speed=20M,latency=5ms,name=Stick,'
+                                   'fail=eio@64M,fail=stall@1M:0.5')
+        assert drive.size == 2 * 1024 ** 3
+        assert drive.throughput == 20 * MB
+        assert drive.latency == 0.005
+        assert drive.friendlyName == 'Stick'
+        assert [(f.kind, f.offset) for f in drive.faults] == [(EIO, 64 * MB), (STALL, MB)]
+        assert drive.faults[1].duration == 0.5
+        for spec in ['size=big', 'colour=red', 'fail=melt@1M', 'fail=eio']:
+            with pytest.raises(LiveUSBError):
+                VirtualDrive.parse(spec)
+
+    def test_write_and_verify(self, tmpdir, monkeypatch):
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M')
+        assert list(live.drives) == [drive.device]
+        assert os.path.getsize(drive.device) == 16 * MB
+        live.drive = drive.device
+        live.set_iso(make_iso(tmpdir))
+        progress = []
+        live.dd_image(progress.append)
+        assert progress[-1] == 1.0
+        live.verify_image()
+        live.calculate_device_checksum()
+        assert 'sha256' in live.checksums['device']
+
+    def test_compressed_image_checksums(self, tmpdir, monkeypatch):
+        import gzip
+        import hashlib
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M')
+        data = os.urandom(3 * MB + 5)
+        image = tmpdir.join('test.iso.gz')
+        image.write(gzip.compress(data), mode='wb')
+        live.drive = drive.device
+        live.set_iso(str(image))
+        # gzip doesn't tell the size up front
+        assert live.isosize == os.path.getsize(str(image))
+        live.dd_image()
+        assert live.isosize == len(data)
+        progress = []
+        live.verify_image(progress.append)
+        assert progress[-1] == 1.0 and progress[-2] < 1.0
+        live.calculate_liveos_checksum()
+        assert live.checksums['liveos']['sha256'] == hashlib.sha256(data).hexdigest()
+
+    def test_throughput(self, tmpdir, monkeypatch):
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M,speed=20M')
+        live.drive = drive.device
+        live.set_iso(make_iso(tmpdir))
+        started = time.monotonic()
+        live.dd_image()
+        assert time.monotonic() - started >= 0.18  # 4M at 20M/s
+
+    def test_eio_clears_the_head(self, tmpdir, monkeypatch):
+        from liveusb import LiveUSBError
+        from liveusb.writer import HEAD_SIZE
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M,fail=eio@2M')
+        live.drive = drive.device
+        live.set_iso(make_iso(tmpdir))
+        with open(drive.device, 'r+b') as backing:
+            backing.write(b'\xff' * HEAD_SIZE)
+        from liveusb import metrics
+        before = metrics.BYTES_WRITTEN.value(device=drive.device)
+        with pytest.raises(LiveUSBError) as error:
+            live.dd_image()
+        assert 'Input/output error' in str(error.value)
+        # what got written before the error is counted
+        assert live.written == 2 * MB - HEAD_SIZE
+        assert metrics.BYTES_WRITTEN.value(device=drive.device) == before + live.written
+        with open(drive.device, 'rb') as backing:
+            assert backing.read(HEAD_SIZE) == bytes(HEAD_SIZE)
+        # the bad sector is still bad for the read-back
+        with drive.open() as device:
+            device.seek(2 * MB)
+            with pytest.raises(OSError):
+                device.read(4096)
+
+    def test_disconnect(self, tmpdir, monkeypatch):
+        from liveusb import LiveUSBError
+        live, drives = virtual_creator(tmpdir, monkeypatch, 'size=16M,fail=disconnect@3M',
+                                       'size=16M')
+        changes = []
+        live.detect_removable_drives(lambda: changes.append(sorted(live.drives)))
+        live.drive = drives[0].device
+        live.set_iso(make_iso(tmpdir))
+        with pytest.raises(LiveUSBError):
+            live.dd_image()
+        assert not drives[0].connected
+        assert changes[-1] == [drives[1].device]
+        live.plug(drives[0])
+        assert changes[-1] == sorted(d.device for d in drives)
+
+    def test_stall(self, tmpdir, monkeypatch):
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M,fail=stall@1M:0.3')
+        live.drive = drive.device
+        live.set_iso(make_iso(tmpdir))
+        started = time.monotonic()
+        live.dd_image()
+        assert time.monotonic() - started >= 0.3
+        assert drive.faults[0].fired
+
+    def test_restore(self, tmpdir, monkeypatch):
+        live, (drive,) = virtual_creator(tmpdir, monkeypatch, 'size=16M')
+        with open(drive.device, 'r+b') as backing:
+            backing.write(b'\xff' * 4096)
+        results = []
+        live.restore_drive(drive, lambda *result: results.append(result))
+        assert results == [(True,)]
+        with open(drive.device, 'rb') as backing:
+            assert backing.read(4096) == bytes(4096)
+        drive.disconnect()
+        live.restore_drive(drive, lambda *result: results.append(result))
+        assert results[-1][0] is False
+
+    def test_batch(self, tmpdir, monkeypatch):
+        from liveusb.batch import BatchFlasher, JSONReporter
+        from liveusb.virtual import VirtualLiveUSBCreator
+        monkeypatch.setenv('TEMP', str(tmpdir))
+        live, drives = virtual_creator(tmpdir, monkeypatch, 'size=16M,speed=50M',
+                                       'size=16M,fail=eio@1M', 'size=16M,latency=1ms')
+        iso = make_iso(tmpdir)
+        out = io.StringIO()
+        flasher = BatchFlasher(Options(**OPTIONS), lambda opts: VirtualLiveUSBCreator(opts, drives),
+                               JSONReporter(out), concurrency=3, verify=False,
+                               readback=True)
+        assert flasher.run([(iso, drive) for drive in drives]) == 1
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert sorted(e['device'] for e in events if e['event'] == 'done') == \
+            [drives[0].device, drives[2].device]
+        assert [e['device'] for e in events if e['event'] == 'error'] == [drives[1].device]
@@ -0,0 +1,220 @@
+import os
+
+import pytest
+
+
+def make_image(tmpdir, size=8 * 1024 ** 2):
+    image = tmpdir.join('test.iso')
+    image.write(os.urandom(size), mode='wb')
+    target = tmpdir.join('drive')
+    target.write(b'\xff' * size, mode='wb')
+    return str(image), str(target)
+
+
+class TestImageWriter:
+
+    def test_writes_the_image(self, tmpdir):
+        from liveusb.writer import ImageWriter
+        image, target = make_image(tmpdir)
+        progress = []
+        writer = ImageWriter(image, target, progress=progress.append)
+        assert writer.write() == os.path.getsize(image)
+        assert not writer.partial
+        assert progress[-1] == 1.0
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_cancel_clears_the_head(self, tmpdir):
+        from liveusb.writer import CancelToken, ImageWriter, WriteCancelled, HEAD_SIZE
+        image, target = make_image(tmpdir)
+        token = CancelToken()
+        callbacks = []
+        token.on_cancel(lambda: callbacks.append('killed'))
+
+        def progress(fraction):
+            if fraction >= 0.25:
+                token.cancel()
+
+        writer = ImageWriter(image, target, token, progress)
+        with pytest.raises(WriteCancelled) as error:
+            writer.write()
+        assert error.value.written == 2 * 1024 ** 2
+        assert writer.partial
+        assert callbacks == ['killed']
+        with open(target, 'rb') as drive:
+            assert drive.read(HEAD_SIZE) == bytes(HEAD_SIZE)
+        # a late registration still gets called
+        token.on_cancel(lambda: callbacks.append('late'))
+        assert callbacks == ['killed', 'late']
+
+    @pytest.mark.parametrize('sync_interval', [None, 3 * 1024 ** 2])
+    def test_head_is_written_after_a_sync(self, tmpdir, sync_interval):
+        from liveusb.writer import ImageWriter
+
+        class Recording(ImageWriter):
+            def _write_block(self, fd, block):
+                events.append(('write', os.lseek(fd, 0, os.SEEK_CUR)))
+                ImageWriter._write_block(self, fd, block)
+
+            def _sync(self, fd):
+                events.append(('sync', None))
+                ImageWriter._sync(self, fd)
+        events = []
+        Recording(*make_image(tmpdir), sync_interval=sync_interval).write()
+        head = events.index(('write', 0))
+        assert events[head - 1] == ('sync', None) and events[head + 1] == ('sync', None)
+        assert head == len(events) - 2
+
+    def test_cancel_before_start_leaves_the_drive_alone(self, tmpdir):
+        from liveusb.writer import CancelToken, ImageWriter, WriteCancelled
+        image, target = make_image(tmpdir)
+        token = CancelToken()
+        token.cancel()
+        with pytest.raises(WriteCancelled):
+            ImageWriter(image, target, token).write()
+        with open(target, 'rb') as drive:
+            assert drive.read(16) == b'\xff' * 16
+
+    def test_write_errors(self, tmpdir):
+        from liveusb import LiveUSBError
+        from liveusb.writer import ImageWriter
+        image, target = make_image(tmpdir)
+        with pytest.raises(LiveUSBError):
+            ImageWriter(image, str(tmpdir)).write()
+
+
+class TestWriteJournal:
+
+    def cancel_at(self, token, fraction):
+        def progress(done):
+            if done >= fraction:
+                token.cancel()
+        return progress
+
+    def test_resumes_an_interrupted_write(self, tmpdir):
+        from liveusb.journal import WriteJournal
+        from liveusb.writer import CancelToken, ImageWriter, WriteCancelled, HEAD_SIZE
+        image, target = make_image(tmpdir)
+        journal = WriteJournal.for_write('0123456789', image, str(tmpdir.join('journal')))
+        token = CancelToken()
+        with pytest.raises(WriteCancelled):
+            ImageWriter(image, target, token, self.cancel_at(token, 0.6),
+                        sync_interval=2 * 1024 ** 2, journal=journal).write()
+        assert journal.load() == (5 * 1024 ** 2, 5)
+        with open(target, 'rb') as drive:
+            assert drive.read(HEAD_SIZE) == bytes(HEAD_SIZE)
+
+        progress = []
+        writer = ImageWriter(image, target, progress=progress.append,
+                             sync_interval=2 * 1024 ** 2, journal=journal)
+        assert writer.write() == os.path.getsize(image)
+        assert writer.resumed == 5 * 1024 ** 2
+        assert progress[0] > 0.5
+        assert journal.load() is None
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_starts_over_when_the_tail_does_not_match(self, tmpdir):
+        from liveusb.journal import WriteJournal
+        from liveusb.writer import ImageWriter
+        image, target = make_image(tmpdir)
+        journal = WriteJournal.for_write('0123456789', image, str(tmpdir.join('journal')))
+        journal.checkpoint(5 * 1024 ** 2, 5)  # but nothing was written
+        writer = ImageWriter(image, target, journal=journal)
+        writer.write()
+        assert writer.resumed == 0
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_journal_is_keyed_by_drive_and_image(self, tmpdir):
+        from liveusb.journal import WriteJournal
+        image, target = make_image(tmpdir)
+        directory = str(tmpdir.join('journal'))
+        assert WriteJournal.for_write('', image, directory) is None
+        journal = WriteJournal.for_write('0123456789', image, directory)
+        journal.checkpoint(1024, 1)
+        assert WriteJournal.for_write('0123456789', image, directory).load() == (1024, 1)
+        assert WriteJournal.for_write('9876543210', image, directory).load() is None
+        assert WriteJournal.for_write('0123456789', target, directory).load() is None
+
+
+class TestWriteOptions:
+
+    @pytest.mark.parametrize('direct', [False, True])
+    @pytest.mark.parametrize('depth', [0, 3])
+    @pytest.mark.parametrize('sync_interval', [None, 2 * 1024 ** 2])
+    def test_options_write_the_same_image(self, tmpdir, direct, depth, sync_interval):
+        from liveusb.writer import ImageWriter
+        image, target = make_image(tmpdir, 5 * 1024 ** 2 + 512)
+        writer = ImageWriter(image, target, sync_interval=sync_interval,
+                             direct=direct, depth=depth)
+        assert writer.write() == os.path.getsize(image)
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_read_ahead_stops_on_cancel(self, tmpdir):
+        import threading
+        from liveusb.writer import CancelToken, ImageWriter, WriteCancelled
+        image, target = make_image(tmpdir)
+        token = CancelToken()
+
+        def progress(fraction):
+            if fraction >= 0.25:
+                token.cancel()
+        with pytest.raises(WriteCancelled):
+            ImageWriter(image, target, token, progress, depth=2).write()
+        assert not [t for t in threading.enumerate() if t.name == 'read-ahead']
+
+
+class TestKernelEngine:
+
+    def test_writes_the_image(self, tmpdir):
+        from liveusb.writer import ImageWriter, KERNEL
+        image, target = make_image(tmpdir, 20 * 1024 ** 2 + 512)
+        progress = []
+        writer = ImageWriter(image, target, progress=progress.append, engine=KERNEL)
+        assert writer.write() == os.path.getsize(image)
+        assert writer.method in ('copy_file_range', 'sendfile')
+        assert len(progress) > 2 and progress[-1] == 1.0
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_consumers_go_through_python(self, tmpdir):
+        import hashlib
+        from liveusb.writer import ImageWriter, KERNEL
+        image, target = make_image(tmpdir)
+
+        class Digest(object):
+            def __init__(self):
+                self.digest = hashlib.sha256()
+                self.update = self.digest.update
+
+            def close(self):
+                pass
+        digest = Digest()
+        writer = ImageWriter(image, target, consumers=[digest], engine=KERNEL)
+        writer.write()
+        assert writer.method == 'python'
+        with open(image, 'rb') as a:
+            assert digest.digest.hexdigest() == hashlib.sha256(a.read()).hexdigest()
+
+    def test_falls_back_when_unsupported(self, tmpdir, monkeypatch):
+        import errno
+        from liveusb.writer import ImageWriter, KERNEL
+
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        monkeypatch.setattr(ImageWriter, '_copy_file_range', unsupported)
+        monkeypatch.setattr(ImageWriter, '_sendfile', unsupported)
+        image, target = make_image(tmpdir)
+        writer = ImageWriter(image, target, engine=KERNEL)
+        writer.write()
+        assert writer.method == 'python'
+        with open(image, 'rb') as a, open(target, 'rb') as b:
+            assert a.read() == b.read()
+
+    def test_unknown_engine(self, tmpdir):
+        from liveusb import LiveUSBError
+        from liveusb.writer import ImageWriter
+        with pytest.raises(LiveUSBError):
+            ImageWriter(*make_image(tmpdir), engine='dd')